@@ -1,14 +1,15 @@
 from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from pymongo import MongoClient
 import os
 from datetime import datetime
 
 # Import configuration and routes
 from config import Config
+from database import init_db, get_db
 from routes.auth_routes import auth_bp
 from routes.floorplan_routes import floorplan_bp
+from routes.booth_routes import booth_bp
 from routes.dashboard_routes import dashboard_bp
 
 def create_app():
@@ -19,22 +20,11 @@ def create_app():
     jwt = JWTManager(app)
     CORS(app, origins=Config.CORS_ORIGINS)
     
-    # Test MongoDB connection
+    # Initialise the shared MongoDB client, test the connection and create indexes
     try:
-        client = MongoClient(Config.MONGODB_URI)
-        db = client.get_default_database()
-        # Test connection
-        db.command('ping')
+        init_db(app)
         print("✅ MongoDB connection successful")
         
-        # Create indexes for better performance
-        db.users.create_index([("username", 1)], unique=True)
-        db.users.create_index([("email", 1)], unique=True)
-        db.floorplans.create_index([("name", 1)])
-        db.floorplans.create_index([("user_id", 1)])
-        db.floorplans.create_index([("event_id", 1)])
-        db.floorplans.create_index([("last_modified", -1)])
-        
     except Exception as e:
         print(f"❌ MongoDB connection failed: {e}")
         return None
@@ -42,6 +32,7 @@ def create_app():
     # Register API blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(floorplan_bp, url_prefix='/api')
+    app.register_blueprint(booth_bp, url_prefix='/api')
     
     # Register dashboard blueprint
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
@@ -51,8 +42,7 @@ def create_app():
     def health_check():
         try:
             # Test database connection
-            client = MongoClient(Config.MONGODB_URI)
-            db = client.get_default_database()
+            db = get_db()
             db.command('ping')
             
             return jsonify({
@@ -78,6 +68,7 @@ def create_app():
             'endpoints': {
                 'auth': '/api/auth',
                 'floorplans': '/api/floorplans',
+                'booths': '/api/booths',
                 'dashboard': '/dashboard',
                 'health': '/health'
             }
@@ -105,6 +96,11 @@ def create_app():
     def missing_token_callback(error):
         return jsonify({'message': 'Authorization token is required'}), 401
     
+    @jwt.token_verification_loader
+    def reject_stream_tickets(jwt_header, jwt_payload):
+        # A collab stream ticket opens only its event stream, never an authenticated route
+        return 'stream' not in jwt_payload
+    
     return app
 
 if __name__ == '__main__':
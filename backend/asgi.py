@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point: the public read endpoints on an asyncio event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+`/health`, `/api/public/floorplans` and `/api/public/floorplans/<id>` are
+served by coroutines that query MongoDB through Motor, so a slow query holds
+no thread and one worker keeps thousands of kiosk requests in flight. Every
+other request is handed to the Flask app on a pool of ASGI_WSGI_THREADS
+threads, so the same server still serves the whole API.
+
+The coroutines run inside a Flask request context built from the ASGI scope.
+They share the Flask app's JSON provider, models, response cache, conditional
+request helpers and CORS handling with the WSGI routes, and answer with the
+same bytes and headers.
+
+Server-Sent Events streams (STREAM_ROUTES) are opened by the Flask route's
+own subscribe function on a pool thread, then served by live.astream: an idle
+subscriber waits on an asyncio.Event and holds no thread, so one worker keeps
+thousands of kiosks and editors connected.
+
+Requires `pip install motor uvicorn`.
+"""
+
+import asyncio
+import io
+import logging
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from flask import jsonify, request
+
+from app import create_app
+from config import Config
+from database import close_client, get_async_db
+from http_cache import VALIDATOR_PROJECTION, floorplan_etag, is_not_modified, not_modified_response
+from models import FloorPlan
+from pagination import paginate_async
+from response_cache import public_cache
+from routes.floorplan_routes import (event_stream_response, open_collab_events, open_public_events,
+                                     parse_fields)
+import live
+import search as plan_search
+
+logger = logging.getLogger(__name__)
+
+flask_app = create_app()
+if flask_app is None:
+    raise RuntimeError('Failed to create the application; check the MongoDB connection')
+
+_executor = ThreadPoolExecutor(max_workers=Config.ASGI_WSGI_THREADS, thread_name_prefix='wsgi')
+
+# Handlers (same responses as the Flask routes of the same paths)
+
+async def health():
+    try:
+        await get_async_db().command('ping')
+        return jsonify({
+            'status': 'healthy',
+            'timestamp': datetime.utcnow().isoformat(),
+            'database': 'connected',
+            'version': '1.0.0'
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'status': 'unhealthy',
+            'timestamp': datetime.utcnow().isoformat(),
+            'database': 'disconnected',
+            'error': str(e)
+        }), 500
+
+async def public_floorplans():
+    """Published floor plans (GET /api/public/floorplans)"""
+    try:
+        cache_key = public_cache.list_key(request.args)
+        cached = public_cache.get(cache_key)
+        if cached:
+            return public_cache.to_response(cached)
+
+        search = request.args.get('search', '')
+        event_id = request.args.get('event_id')
+        try:
+            fields = parse_fields(request.args.get('fields'), FloorPlan.PUBLIC_LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        query = {'status': 'published'}
+        terms = plan_search.parse_terms(search)
+        if terms:
+            query.update(plan_search.prefix_filter(terms))
+        if event_id:
+            query['event_id'] = event_id
+
+        try:
+            docs, pagination = await paginate_async(
+                get_async_db().floorplans, query, FloorPlan.list_projection(fields), request.args,
+                score=plan_search.score_expression(terms) if terms else None)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        floorplans = [FloorPlan.summarize(fp, fields) for fp in docs]
+
+        entry = public_cache.store(cache_key, {
+            'floorplans': floorplans,
+            'pagination': pagination
+        })
+        return public_cache.to_response(entry)
+
+    except Exception as e:
+        return jsonify({'message': 'Failed to get public floor plans', 'error': str(e)}), 500
+
+async def public_floorplan(floorplan_id):
+    """A published floor plan (GET /api/public/floorplans/<id>)"""
+    try:
+        db = get_async_db()
+        published = {'_id': ObjectId(floorplan_id), 'status': 'published'}
+
+        meta = await db.floorplans.find_one(published, VALIDATOR_PROJECTION)
+        if not meta:
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
+        etag = floorplan_etag(meta['_id'], meta['version'])
+        if is_not_modified(etag, meta['last_modified']):
+            return not_modified_response(etag, meta['last_modified'], public=True)
+        cached = public_cache.get(public_cache.detail_key(meta['_id'], meta['version']))
+        if cached:
+            return public_cache.to_response(cached)
+
+        floorplan = await db.floorplans.find_one(published)
+        if not floorplan:
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
+
+        entry = public_cache.store(public_cache.detail_key(floorplan['_id'], floorplan['version']),
+                                   {'floorplan': FloorPlan.public_detail(floorplan)},
+                                   etag=floorplan_etag(floorplan['_id'], floorplan['version']),
+                                   last_modified=floorplan['last_modified'])
+        return public_cache.to_response(entry)
+
+    except Exception as e:
+        return jsonify({'message': 'Failed to get public floor plan', 'error': str(e)}), 500
+
+ROUTES = [
+    (re.compile(r'^/health$'), health),
+    (re.compile(r'^/api/public/floorplans$'), public_floorplans),
+    (re.compile(r'^/api/public/floorplans/(?P<floorplan_id>[^/]+)$'), public_floorplan),
+]
+
+# Event streams: the function opening the subscription (see call_stream)
+STREAM_ROUTES = [
+    (re.compile(r'^/api/public/floorplans/(?P<floorplan_id>[^/]+)/events$'), open_public_events),
+    (re.compile(r'^/api/floorplans/(?P<floorplan_id>[^/]+)/collab/events$'), open_collab_events),
+]
+
+# ASGI plumbing
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    """WSGI environ of an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': '',
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _headers(headers) -> list:
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+async def _read_body(receive) -> bytes:
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if not message.get('more_body'):
+            return bytes(body)
+
+async def call_async(handler, params: dict, scope, send):
+    with flask_app.request_context(wsgi_environ(scope, b'')):
+        response = flask_app.make_response(await handler(**params))
+        response = flask_app.process_response(response)
+    await send({'type': 'http.response.start', 'status': response.status_code,
+                'headers': _headers(response.headers.items())})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+def open_stream(opener, params: dict, scope):
+    """Runs on a pool thread: (channel, stream options, response carrying the headers or the error)"""
+    with flask_app.request_context(wsgi_environ(scope, b'')):
+        try:
+            channel, opened = opener(**params)
+            response = event_stream_response(None) if channel else flask_app.make_response(opened)
+        except Exception as e:
+            channel, opened = None, None
+            response = flask_app.make_response(
+                (jsonify({'message': 'Failed to open event stream', 'error': str(e)}), 500))
+        return channel, opened, flask_app.process_response(response)
+
+async def call_stream(opener, params: dict, scope, receive, send):
+    """Serve an event stream from the event loop until the client goes away"""
+    loop = asyncio.get_running_loop()
+    channel, opened, response = await loop.run_in_executor(_executor, open_stream, opener, params, scope)
+    await send({'type': 'http.response.start', 'status': response.status_code,
+                'headers': _headers(response.headers.items())})
+    if channel is None:
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+        return
+
+    async def pump():
+        async for chunk in live.astream(channel, **opened):
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(watch_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Cancelling the pump closes the stream, which unsubscribes
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning(f"Event stream of {scope['path']} failed: {result}")
+
+async def call_wsgi(scope, receive, send):
+    """Run the Flask app in the thread pool, streaming its body chunk by chunk"""
+    loop = asyncio.get_running_loop()
+    environ = wsgi_environ(scope, await _read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+        return lambda data: None
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    result = await loop.run_in_executor(_executor, flask_app, environ, start_response)
+    chunks = iter(result)
+    try:
+        # start_response may be deferred until the first chunk
+        chunk = await loop.run_in_executor(_executor, next, chunks, None)
+        await send({'type': 'http.response.start', 'status': started['status'],
+                    'headers': _headers(started['headers'])})
+        # Streamed responses (events, CSV export) end when the client goes away
+        while chunk is not None and not disconnected.is_set():
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(_executor, next, chunks, None)
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(_executor, result.close)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            close_client()
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    if scope['method'] == 'GET':
+        for pattern, handler in ROUTES:
+            match = pattern.match(scope['path'])
+            if match:
+                return await call_async(handler, match.groupdict(), scope, send)
+        for pattern, opener in STREAM_ROUTES:
+            match = pattern.match(scope['path'])
+            if match:
+                return await call_stream(opener, match.groupdict(), scope, receive, send)
+    return await call_wsgi(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', host='0.0.0.0', port=5000)
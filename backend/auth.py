@@ -1,23 +1,67 @@
 from functools import wraps
 from flask import jsonify, request
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
-from pymongo import MongoClient
 from bson import ObjectId
-import os
+from cache import TTLCache
+from config import Config
+from database import get_db
+
+# User records (without password hash) by id, so authorization and the
+# dashboard do not query MongoDB on every request
+_user_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+
+def user_claims(user_doc) -> dict:
+    """Additional signed JWT claims issued at login/registration"""
+    return {'role': user_doc.get('role', 'user'), 'role_version': user_doc.get('role_version', 0)}
+
+def get_user_record(user_id):
+    """Return the cached user record for `user_id`, loading it on a miss"""
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = get_db().users.find_one({'_id': ObjectId(user_id)}, {'password_hash': 0})
+        if user is None:
+            return None
+        user['_id'] = str(user['_id'])
+        _user_cache.set(user_id, user)
+    return dict(user)
+
+def invalidate_user(user_id):
+    """Drop a user's cached record; call after changing the user document"""
+    _user_cache.pop(str(user_id))
+
+def set_user_role(user_id, role: str) -> bool:
+    """Change a user's role. Tokens issued before the change stop carrying it."""
+    result = get_db().users.update_one({'_id': ObjectId(user_id)},
+                                       {'$set': {'role': role}, '$inc': {'role_version': 1}})
+    invalidate_user(user_id)
+    return result.matched_count == 1
+
+def user_cache_stats() -> dict:
+    return _user_cache.stats()
+
+def get_current_role():
+    """Role of the authenticated user.
+
+    The signed token claim is used while its `role_version` matches the cached
+    user record; after a role change (set_user_role) the record's role applies,
+    so a demoted admin loses access without waiting for the token to expire.
+    Must be called after the JWT has been verified.
+    """
+    user = get_user_record(get_jwt_identity())
+    if user is None:
+        return None
+    claims = get_jwt()
+    if claims.get('role') is not None and claims.get('role_version', 0) == user.get('role_version', 0):
+        return claims['role']
+    return user.get('role')
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         try:
             verify_jwt_in_request()
-            current_user_id = get_jwt_identity()
             
-            # Get MongoDB connection
-            client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/imtma_flooring'))
-            db = client.get_default_database()
-            
-            user = db.users.find_one({'_id': ObjectId(current_user_id)})
-            if not user or user.get('role') != 'admin':
+            if get_current_role() != 'admin':
                 return jsonify({'message': 'Admin access required'}), 403
                 
             return f(*args, **kwargs)
@@ -43,15 +87,7 @@ def get_current_user():
         verify_jwt_in_request()
         current_user_id = get_jwt_identity()
         
-        # Get MongoDB connection
-        client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/imtma_flooring'))
-        db = client.get_default_database()
-        
-        user = db.users.find_one({'_id': ObjectId(current_user_id)})
-        if user:
-            user['_id'] = str(user['_id'])
-            user.pop('password_hash', None)  # Remove sensitive data
-            return user
-        return None
+        # Cached record; the password hash is never loaded
+        return get_user_record(current_user_id)
     except:
         return None
\ No newline at end of file
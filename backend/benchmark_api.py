@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for IMTMA Flooring Backend
+Measures throughput and latency of the API under concurrent load.
+
+Run it against a running server before and after a change and compare:
+
+    python benchmark_api.py throughput --requests 2000 --concurrency 32
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Configuration
+BASE_URL = "http://localhost:5000"
+BENCH_USER = {
+    "username": "bench_admin",
+    "email": "bench_admin@example.com",
+    "password": "bench_password_123",
+    "role": "admin"
+}
+
+def get_token():
+    """Register (or log in) the benchmark admin user and return its token"""
+    response = requests.post(f"{BASE_URL}/api/auth/register", json=BENCH_USER)
+    if response.status_code != 201:
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": BENCH_USER["username"],
+            "password": BENCH_USER["password"]
+        })
+    if response.status_code not in (200, 201):
+        print(f"❌ Could not authenticate benchmark user: {response.text}")
+        sys.exit(1)
+    return response.json()["access_token"]
+
+def run_load(url, total, concurrency, headers=None):
+    """Issue `total` GET requests to `url` from `concurrency` threads"""
+    local = threading.local()
+
+    def one_request(_):
+        # One keep-alive session per worker thread
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = local.session.get(url, headers=headers or {})
+        elapsed = time.perf_counter() - start
+        return response.status_code, elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_request, range(total)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(r[1] for r in results)
+    errors = sum(1 for r in results if r[0] >= 400)
+    return {
+        'requests': total,
+        'errors': errors,
+        'wall_seconds': wall,
+        'rps': total / wall if wall else 0,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000,
+    }
+
+def print_result(title, result):
+    print(f"\n{'='*50}")
+    print(f"📋 {title}")
+    print(f"{'='*50}")
+    print(f"Requests:   {result['requests']} ({result['errors']} errors)")
+    print(f"Wall time:  {result['wall_seconds']:.2f}s")
+    print(f"Throughput: {result['rps']:.1f} req/s")
+    print(f"Latency:    p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms")
+
+def bench_throughput(args):
+    """Requests/sec for the health check and the authenticated list endpoint.
+
+    Both paths used to open a new MongoClient per call, so this is the number
+    to compare before and after the shared connection pool.
+    """
+    token = get_token()
+    auth_headers = {"Authorization": f"Bearer {token}"}
+
+    print_result("GET /health", run_load(
+        f"{BASE_URL}/health", args.requests, args.concurrency))
+    print_result("GET /api/floorplans", run_load(
+        f"{BASE_URL}/api/floorplans", args.requests, args.concurrency, auth_headers))
+    print_result("GET /api/public/floorplans", run_load(
+        f"{BASE_URL}/api/public/floorplans", args.requests, args.concurrency))
+
+def bench_projection(args):
+    """Bytes per listing page with and without field projection.
+
+    Reports both the HTTP payload and, when the database is reachable from
+    this machine, the BSON bytes MongoDB ships for one page of documents.
+    """
+    token = get_token()
+    auth_headers = {"Authorization": f"Bearer {token}"}
+    limit = args.page_size
+
+    print(f"\n{'='*50}")
+    print(f"📋 Listing payload per page ({limit} plans)")
+    print(f"{'='*50}")
+    for label, url in [
+        ("default fields", f"{BASE_URL}/api/floorplans?limit={limit}"),
+        ("fields=name,status", f"{BASE_URL}/api/floorplans?limit={limit}&fields=name,status"),
+        ("public default", f"{BASE_URL}/api/public/floorplans?limit={limit}"),
+    ]:
+        response = requests.get(url, headers=auth_headers)
+        print(f"HTTP {label:<22} {len(response.content):>10,} bytes")
+
+    try:
+        import bson
+        from database import get_db
+        from models import FloorPlan
+        db = get_db()
+        full = list(db.floorplans.find().sort('last_modified', -1).limit(limit))
+        projected = list(db.floorplans.find({}, FloorPlan.list_projection())
+                         .sort('last_modified', -1).limit(limit))
+    except Exception as e:
+        print(f"⚠️  Skipping MongoDB wire measurement: {e}")
+        return
+
+    full_bytes = sum(len(bson.encode(doc)) for doc in full)
+    projected_bytes = sum(len(bson.encode(doc)) for doc in projected)
+    saved = 100 * (1 - projected_bytes / full_bytes) if full_bytes else 0
+    print(f"BSON full documents      {full_bytes:>10,} bytes")
+    print(f"BSON list projection     {projected_bytes:>10,} bytes ({saved:.1f}% less)")
+
+def bench_search(args):
+    """Unanchored $regex versus indexed search_tokens on a synthetic collection.
+
+    Works directly against MongoDB in a scratch database (<db>_bench) that is
+    dropped afterwards; no server needs to be running for this scenario.
+    """
+    import random
+    import re
+    from database import get_client, get_db
+    from models import FloorPlan
+    import search
+
+    db = get_client()[get_db().name + '_bench']
+    db.floorplans.drop()
+    words = ['hall', 'pavilion', 'machine', 'tools', 'robotics', 'laser', 'cutting',
+             'automation', 'welding', 'forming', 'digital', 'factory', 'metrology']
+    companies = [f"{random.choice(words).title()} {random.choice(words).title()} {i}"
+                 for i in range(500)]
+
+    print(f"\n{'='*50}")
+    print(f"📋 Search: {args.documents:,} synthetic plans, {args.booths} booths each")
+    print(f"{'='*50}")
+    batch = []
+    for i in range(args.documents):
+        elements = [{'type': 'booth', 'number': f"{chr(65 + b % 26)}{b}",
+                     'exhibitor': {'companyName': random.choice(companies)}}
+                    for b in range(args.booths)]
+        name = f"{random.choice(words).title()} {random.choice(words).title()} {i}"
+        description = ' '.join(random.choices(words, k=8))
+        batch.append({'name': name, 'description': description,
+                      'last_modified': datetime.utcnow(),
+                      'state': {'elements': elements},
+                      **FloorPlan.derived_fields({'elements': elements}, name, description)})
+        if len(batch) == 1000:
+            db.floorplans.insert_many(batch)
+            batch = []
+    if batch:
+        db.floorplans.insert_many(batch)
+    db.floorplans.create_index([("search_tokens", 1)])
+
+    def timed(label, query):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            found = list(db.floorplans.find(query, {'name': 1}).limit(args.page_size))
+        elapsed = (time.perf_counter() - start) / args.repeat * 1000
+        plan = db.floorplans.find(query).limit(args.page_size).explain()
+        examined = plan.get('executionStats', {}).get('totalDocsExamined', 'n/a')
+        print(f"{label:<28} {elapsed:8.2f} ms/query  ({len(found)} hits, {examined} docs examined)")
+
+    for term in ['robo', 'laser cut', 'metrology 42']:
+        print(f"\nsearch={term!r}")
+        pattern = re.escape(term)
+        timed("  $regex name/description", {'$or': [
+            {'name': {'$regex': pattern, '$options': 'i'}},
+            {'description': {'$regex': pattern, '$options': 'i'}}
+        ]})
+        timed("  search_tokens prefix", search.prefix_filter(search.parse_terms(term)))
+
+    db.client.drop_database(db.name)
+
+def bench_wayfinding(args):
+    """Booth-to-booth routing on a synthetic hall of --booths booths.
+
+    Compares rebuilding the grid for every query (what the browser hook does)
+    with the cached grid and the cached route of a popular pair. Runs in
+    process against wayfinding.py; no server needs to be running.
+    """
+    import math
+    import random
+    import wayfinding
+
+    # Double rows of 3x3 m booths separated by 2 m aisles, grid cell 20 units = 1 m
+    size, aisle = 60, 40
+    per_row = max(1, int(math.sqrt(args.booths)))
+    elements = []
+    for b in range(args.booths):
+        row, col = divmod(b, per_row)
+        x = aisle + col * size + (col // 2) * aisle
+        y = aisle + row * size + (row // 2) * aisle
+        elements.append({'id': f"booth-{b}", 'type': 'booth', 'number': f"B{b}",
+                         'x': x, 'y': y, 'width': size, 'height': size})
+    width = max(e['x'] + e['width'] for e in elements) + aisle
+    height = max(e['y'] + e['height'] for e in elements) + aisle
+    # One entrance in the middle of each wall
+    for d, (x, y) in enumerate([(width / 2, 0), (width / 2, height - 20),
+                                (0, height / 2), (width - 20, height / 2)]):
+        elements.append({'id': f"door-{d}", 'type': 'door', 'x': x, 'y': y,
+                         'width': 20, 'height': 20})
+    state = {'elements': elements, 'canvasSize': {'width': width, 'height': height},
+             'grid': {'size': 20}}
+    pairs = [(f"booth-{random.randrange(args.booths)}", f"booth-{random.randrange(args.booths)}")
+             for _ in range(args.repeat)]
+
+    print(f"\n{'='*50}")
+    print(f"🧭 Wayfinding: {args.booths:,} booths, {width}x{height} canvas, "
+          f"numpy {'on' if wayfinding.np is not None else 'off'}")
+    print(f"{'='*50}")
+
+    def report(label, samples):
+        samples = sorted(samples)
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        print(f"{label:<32} p50 {statistics.median(samples):8.2f} ms   p99 {p99:8.2f} ms")
+
+    builds, rebuild_queries, cold, cached = [], [], [], []
+    for i, (a, b) in enumerate(pairs):
+        start = time.perf_counter()
+        grid = wayfinding.build_grid(state)
+        builds.append((time.perf_counter() - start) * 1000)
+        wayfinding.booth_route('bench', i, grid, a, b)
+        rebuild_queries.append((time.perf_counter() - start) * 1000)
+
+    grid = wayfinding.get_grid('bench', 0, lambda: state)
+    print(f"grid {grid.cols}x{grid.rows} cells, {grid.size_bytes / 1024:.1f} KB")
+    for a, b in pairs:
+        start = time.perf_counter()
+        wayfinding.booth_route('bench', 0, wayfinding.get_grid('bench', 0, lambda: state), a, b)
+        cold.append((time.perf_counter() - start) * 1000)
+    for a, b in pairs:
+        start = time.perf_counter()
+        wayfinding.booth_route('bench', 0, wayfinding.get_grid('bench', 0, lambda: state), a, b)
+        cached.append((time.perf_counter() - start) * 1000)
+
+    report("  grid build", builds)
+    report("  rebuild grid + route", rebuild_queries)
+    report("  cached grid, new route", cold)
+    report("  cached route", cached)
+
+    start = time.perf_counter()
+    field = wayfinding.entrance_field(grid)
+    field_ms = (time.perf_counter() - start) * 1000
+    packed = wayfinding.pack_field(field)
+    entrance = []
+    for _, b in pairs:
+        start = time.perf_counter()
+        wayfinding.entrance_route(grid, field, b)
+        entrance.append((time.perf_counter() - start) * 1000)
+    print(f"\nentrance field: {field_ms:.0f} ms to build, {packed['raw_bytes'] / 1024:.1f} KB raw, "
+          f"{packed['stored_bytes'] / 1024:.1f} KB stored")
+    report("  nearest entrance route", entrance)
+
+async def _read_response(reader):
+    """Read one HTTP/1.x response; returns (status, headers, keep_alive)"""
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    version, status = head[0].split(' ', 2)[:2]
+    status = int(status)
+    headers = {name.strip().lower(): value.strip()
+               for name, _, value in (line.partition(':') for line in head[1:] if line)}
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif status != 304:
+        await reader.read()  # body delimited by the connection closing
+        return status, headers, False
+    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    return status, headers, keep_alive
+
+async def _kiosk_load(url, connections, rounds):
+    """`connections` kiosks, each polling `url` `rounds` times with If-None-Match over keep-alive"""
+    import asyncio
+    from urllib.parse import urlsplit
+
+    target = urlsplit(url)
+    host, port = target.hostname, target.port or 80
+    path = target.path + (f"?{target.query}" if target.query else '')
+    latencies, failures = [], {'connect': 0, 'io': 0, 'http': 0}
+
+    async def kiosk():
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            failures['connect'] += 1
+            return
+        etag = None
+        try:
+            for _ in range(rounds):
+                request = f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                if etag:
+                    request += f"If-None-Match: {etag}\r\n"
+                start = time.perf_counter()
+                writer.write((request + "\r\n").encode('latin-1'))
+                status, headers, keep_alive = await _read_response(reader)
+                latencies.append(time.perf_counter() - start)
+                if status >= 400:
+                    failures['http'] += 1
+                etag = headers.get('etag', etag)
+                if not keep_alive:
+                    writer.close()
+                    reader, writer = await asyncio.open_connection(host, port)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            failures['io'] += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(kiosk() for _ in range(connections)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(failures.values()),
+        'failures': failures,
+        'wall_seconds': wall,
+        'rps': len(latencies) / wall if wall else 0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99_ms': latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000 if latencies else 0,
+    }
+
+def bench_kiosks(args):
+    """Kiosks polling a public plan: WSGI (--base-url) versus ASGI (--asgi-url).
+
+    --connections kiosks (default 1,000) each hold one keep-alive connection and
+    fetch the plan --rounds times, revalidating with If-None-Match like the
+    viewer does. Start both servers on the same database first, e.g.
+
+        python run.py                                 # WSGI on :5000
+        uvicorn asgi:app --port 5001                  # ASGI on :5001
+
+    and raise the open file limit (ulimit -n 4096) for this many sockets.
+    """
+    import asyncio
+
+    floorplan_id = args.floorplan_id
+    if not floorplan_id:
+        response = requests.get(f"{BASE_URL}/api/public/floorplans?limit=1&fields=name")
+        plans = response.json().get('floorplans', [])
+        if not plans:
+            print("❌ No published floor plan to poll; publish one or pass --floorplan-id")
+            sys.exit(1)
+        floorplan_id = plans[0]['id']
+
+    for label, base in [("WSGI", BASE_URL), ("ASGI", args.asgi_url.rstrip('/'))]:
+        url = f"{base}/api/public/floorplans/{floorplan_id}"
+        result = asyncio.run(_kiosk_load(url, args.connections, args.rounds))
+        print_result(f"{label} {args.connections} kiosks: GET /api/public/floorplans/<id>", result)
+        failures = result['failures']
+        print(f"Failures:   {failures['connect']} connect, {failures['io']} dropped, "
+              f"{failures['http']} HTTP errors")
+
+def bench_login_storm(args):
+    """API read latency on its own and during a login storm.
+
+    Measures GET /api/floorplans (--requests, --concurrency), then again while
+    --logins threads log the benchmark user in back to back. With bcrypt in
+    its bounded pool the read p99 should stay close to the baseline, and the
+    logins beyond BCRYPT_MAX_PENDING come back as 503 with Retry-After.
+    """
+    token = get_token()
+    auth_headers = {"Authorization": f"Bearer {token}"}
+    url = f"{BASE_URL}/api/floorplans"
+    credentials = {"username": BENCH_USER["username"], "password": BENCH_USER["password"]}
+
+    print_result("GET /api/floorplans, no logins", run_load(
+        url, args.requests, args.concurrency, auth_headers))
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    outcomes = {}
+
+    def storm():
+        session = requests.Session()
+        while not stop.is_set():
+            try:
+                status = session.post(f"{BASE_URL}/api/auth/login", json=credentials).status_code
+            except requests.exceptions.RequestException:
+                status = 'error'
+            with lock:
+                outcomes[status] = outcomes.get(status, 0) + 1
+
+    threads = [threading.Thread(target=storm, daemon=True) for _ in range(args.logins)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(1)  # let the storm build up
+    result = run_load(url, args.requests, args.concurrency, auth_headers)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    print_result(f"GET /api/floorplans, {args.logins} threads logging in", result)
+    print(f"Logins:     {sum(outcomes.values())} in {wall:.1f}s "
+          f"({', '.join(f'{count} x {status}' for status, count in sorted(outcomes.items(), key=str))})")
+
+SCENARIOS = {
+    'throughput': bench_throughput,
+    'projection': bench_projection,
+    'search': bench_search,
+    'wayfinding': bench_wayfinding,
+    'kiosks': bench_kiosks,
+    'login-storm': bench_login_storm,
+}
+
+# Scenarios that talk to MongoDB directly instead of the HTTP API
+OFFLINE_SCENARIOS = {'search', 'wayfinding'}
+
+def main():
+    global BASE_URL
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--booths', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--asgi-url', default='http://localhost:5001')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--floorplan-id')
+    parser.add_argument('--logins', type=int, default=64)
+    args = parser.parse_args()
+    BASE_URL = args.base_url.rstrip('/')
+
+    if args.scenario not in OFFLINE_SCENARIOS:
+        try:
+            requests.get(f"{BASE_URL}/health", timeout=5)
+        except requests.exceptions.ConnectionError:
+            print("❌ Cannot connect to server. Is it running?")
+            sys.exit(1)
+
+    SCENARIOS[args.scenario](args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+The `booths` collection: one indexed document per booth element.
+
+Floor plans remain the source of truth. Each floor plan write re-synchronises
+the plan's booth documents. The sync is incremental: every booth document
+stores a digest of its content, and only booths whose digest changed are
+upserted. Booths no longer present in the plan are deleted.
+
+Every booth document records the `plan_version` it was built from, and a
+write only lands on documents from the same or an older version. A sync
+that read an outdated plan repeats itself against the current version, so
+concurrent writers converge on the latest state.
+"""
+
+import csv
+import hashlib
+import io
+import json
+from typing import Dict, Iterable, List, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne, DeleteMany
+from pymongo.errors import BulkWriteError
+
+import search
+from models import FloorPlanStats
+
+# Plan fields copied onto every booth so booth queries need no join
+SYNC_PROJECTION = {'version': 1, 'name': 1, 'status': 1, 'event_id': 1, 'floor': 1,
+                   'user_id': 1, 'state.elements': 1}
+
+# Fields returned by booth listings (everything but the sync bookkeeping)
+DETAIL_PROJECTION = {'digest': 0, 'tokens': 0, 'plan_version': 0}
+
+# Sortable fields of /api/booths (`sort=price`, `sort=-price`) and their stored keys
+SORT_FIELDS = {
+    'number': 'number',
+    'price': 'price',
+    'status': 'status_key',
+    'company': 'company',
+    'category': 'category',
+    'floor': 'floor',
+    'floorplan': 'floorplan_name'
+}
+DEFAULT_SORT = [('floorplan_name', 1), ('number', 1), ('_id', 1)]
+
+CSV_COLUMNS = ('floorplan_id', 'floorplan_name', 'event_id', 'floor', 'booth_id', 'number',
+               'status', 'price', 'company', 'category', 'width', 'height')
+
+# Sponsorship tiers, best first (matches the frontend Sponsor type)
+SPONSOR_TIERS = ('platinum', 'gold', 'silver', 'bronze')
+
+_DUPLICATE_KEY = 11000
+
+def status_key(status) -> str:
+    """Normalized status used for filtering and stats ('on-hold' -> 'on_hold')"""
+    return (status or 'available').replace('-', '_')
+
+def sponsor_tier(element: Dict):
+    """Sponsorship tier set on the booth's exhibitor (or custom properties), if valid"""
+    exhibitor = element.get('exhibitor') or {}
+    tier = exhibitor.get('sponsorTier') or (element.get('customProperties') or {}).get('sponsorTier')
+    tier = str(tier).lower() if tier else None
+    return tier if tier in SPONSOR_TIERS else None
+
+def booth_document(floorplan: Dict, element: Dict) -> Dict:
+    """Booth document for one booth element of a plan (without the sync fields)"""
+    detail = FloorPlanStats.booth_detail(element)
+    exhibitor = detail.get('exhibitor') or {}
+    doc = {
+        'floorplan_id': floorplan['_id'],
+        'element_id': detail.pop('id'),
+        'floorplan_name': floorplan.get('name'),
+        'floorplan_status': floorplan.get('status', 'draft'),
+        'event_id': floorplan.get('event_id'),
+        'floor': floorplan.get('floor', 1),
+        'user_id': floorplan.get('user_id'),
+        **detail,
+        # Sort keys never hold null, so keyset pagination compares like with like
+        'number': detail['number'] or '',
+        'price': detail['price'] or 0,
+        'status_key': status_key(detail['status']),
+        'company': exhibitor.get('company_name') or '',
+        'category': exhibitor.get('category') or '',
+        'sponsor_tier': sponsor_tier(element),
+        'website': element.get('website') or (exhibitor.get('contact') or {}).get('website'),
+        'tokens': search.booth_tokens([element])
+    }
+    return doc
+
+def booth_documents(floorplan: Dict) -> Dict[str, Dict]:
+    """Booth documents of a plan keyed by element id, each with its digest"""
+    docs = {}
+    for element in (floorplan.get('state') or {}).get('elements', []):
+        if element.get('type') != 'booth' or not element.get('id'):
+            continue
+        doc = booth_document(floorplan, element)
+        doc['digest'] = hashlib.sha1(
+            json.dumps(doc, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        docs[doc['element_id']] = doc
+    return docs
+
+def apply_sync(db, floorplan: Dict) -> Tuple[int, int]:
+    """Write the differences between a plan's booths and the stored ones.
+
+    Returns (upserted_or_updated, deleted).
+    """
+    floorplan_id = floorplan['_id']
+    version = floorplan.get('version', 1)
+    docs = booth_documents(floorplan)
+    stored = {d['element_id']: d.get('digest')
+              for d in db.booths.find({'floorplan_id': floorplan_id}, {'element_id': 1, 'digest': 1})}
+
+    ops = []
+    for element_id, doc in docs.items():
+        if stored.get(element_id) != doc['digest']:
+            doc['plan_version'] = version
+            ops.append(UpdateOne(
+                {'floorplan_id': floorplan_id, 'element_id': element_id,
+                 'plan_version': {'$lte': version}},
+                {'$set': doc},
+                upsert=True
+            ))
+    removed = [element_id for element_id in stored if element_id not in docs]
+    if removed:
+        ops.append(DeleteMany({'floorplan_id': floorplan_id, 'element_id': {'$in': removed},
+                               'plan_version': {'$lte': version}}))
+    if not ops:
+        return 0, 0
+
+    try:
+        result = db.booths.bulk_write(ops, ordered=False)
+        return result.upserted_count + result.modified_count, result.deleted_count
+    except BulkWriteError as e:
+        # A duplicate key means a newer version already owns that booth
+        if any(err.get('code') != _DUPLICATE_KEY for err in e.details.get('writeErrors', [])):
+            raise
+        details = e.details
+        return details.get('nUpserted', 0) + details.get('nModified', 0), details.get('nRemoved', 0)
+
+def sync_floorplan(db, floorplan_id, floorplan: Dict = None, attempts: int = 5) -> Tuple[int, int]:
+    """Synchronise the booths of one plan with its current version.
+
+    `floorplan` may be a document the caller already holds (it needs the
+    SYNC_PROJECTION fields); otherwise the plan is read.
+    """
+    changed = deleted = 0
+    for _ in range(attempts):
+        if floorplan is None:
+            floorplan = db.floorplans.find_one({'_id': floorplan_id}, SYNC_PROJECTION)
+        if floorplan is None:
+            return changed, delete_floorplan(db, floorplan_id)
+        c, d = apply_sync(db, floorplan)
+        changed, deleted = changed + c, deleted + d
+
+        # Another write may have landed meanwhile; if so, sync again from it
+        current = db.floorplans.find_one({'_id': floorplan_id}, {'version': 1})
+        if current is None:
+            return changed, deleted + delete_floorplan(db, floorplan_id)
+        if current.get('version') == floorplan.get('version'):
+            return changed, deleted
+        floorplan = None
+    return changed, deleted
+
+def delete_floorplan(db, floorplan_id) -> int:
+    return db.booths.delete_many({'floorplan_id': floorplan_id}).deleted_count
+
+def to_detail(doc: Dict) -> Dict:
+    """API representation of a booth document (same shape as booth_detail)"""
+    detail = {k: v for k, v in doc.items()
+              if k not in ('_id', 'element_id', 'floorplan_id', 'user_id', 'status_key', 'company',
+                           'category', 'sponsor_tier', 'digest', 'tokens', 'plan_version')}
+    detail['id'] = doc.get('element_id')
+    detail['floorplan_id'] = str(doc['floorplan_id'])
+    return detail
+
+def stats_pipeline(match: Dict) -> List[Dict]:
+    """Booth counts and revenue per status for the booths matching `match`"""
+    return [
+        {'$match': match},
+        {'$group': {
+            '_id': '$status_key',
+            'count': {'$sum': 1},
+            'revenue': {'$sum': {'$ifNull': ['$price', 0]}}
+        }}
+    ]
+
+def stats_from_rows(rows: List[Dict]) -> Dict:
+    """Fold stats_pipeline rows into the FloorPlanStats.empty_stats() shape"""
+    stats = FloorPlanStats.empty_stats()
+    for row in rows:
+        stats['total_booths'] += row['count']
+        if row['_id'] in stats:
+            stats[row['_id']] += row['count']
+        if row['_id'] in ('reserved', 'sold'):
+            stats['total_revenue'] += row['revenue']
+            stats[f"{row['_id']}_revenue"] += row['revenue']
+    return stats
+
+def parse_sort(raw: str) -> List[Tuple[str, int]]:
+    """Parse `sort=field` / `sort=-field` into a total order ending in _id"""
+    if not raw:
+        return list(DEFAULT_SORT)
+    direction = -1 if raw.startswith('-') else 1
+    field = SORT_FIELDS.get(raw.lstrip('-'))
+    if field is None:
+        raise ValueError(f"Invalid sort. Must be one of: {', '.join(SORT_FIELDS)}")
+    return [(field, direction), ('_id', direction)]
+
+def _float_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+def build_query(args, user_id: str = None) -> Dict:
+    """Booth filter from request arguments; raises ValueError for malformed values.
+
+    `user_id` restricts the result to that user's floor plans (non-admins).
+    """
+    query = {}
+    if user_id is not None:
+        query['user_id'] = user_id
+
+    status = args.get('status')
+    if status:
+        keys = [status_key(s.strip()) for s in status.split(',') if s.strip()]
+        query['status_key'] = keys[0] if len(keys) == 1 else {'$in': keys}
+    if args.get('floor'):
+        try:
+            query['floor'] = int(args['floor'])
+        except ValueError:
+            raise ValueError('floor must be an integer')
+    if args.get('event_id'):
+        query['event_id'] = args['event_id']
+    if args.get('floorplan_id'):
+        if not ObjectId.is_valid(args['floorplan_id']):
+            raise ValueError('Invalid floorplan_id')
+        query['floorplan_id'] = ObjectId(args['floorplan_id'])
+    if args.get('floorplan_status'):
+        query['floorplan_status'] = args['floorplan_status']
+    if args.get('category'):
+        query['category'] = args['category']
+    if args.get('company'):
+        query['company'] = args['company']
+
+    min_price, max_price = _float_arg(args, 'min_price'), _float_arg(args, 'max_price')
+    if min_price is not None or max_price is not None:
+        query['price'] = {}
+        if min_price is not None:
+            query['price']['$gte'] = min_price
+        if max_price is not None:
+            query['price']['$lte'] = max_price
+
+    terms = search.parse_terms(args.get('search', ''))
+    if terms:
+        query.update(search.prefix_filter(terms, field='tokens'))
+    return query
+
+def csv_row(doc: Dict) -> List:
+    position = doc.get('position') or {}
+    return [str(doc['floorplan_id']), doc.get('floorplan_name'), doc.get('event_id'), doc.get('floor'),
+            doc.get('element_id'), doc.get('number'), doc.get('status'), doc.get('price'),
+            doc.get('company'), doc.get('category'), position.get('width'), position.get('height')]
+
+def stream_csv(docs: Iterable[Dict], chunk_rows: int = 500):
+    """Yield CSV text in chunks of `chunk_rows` rows while iterating a cursor"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    rows = 0
+    for doc in docs:
+        writer.writerow(csv_row(doc))
+        rows += 1
+        if rows % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
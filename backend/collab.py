@@ -0,0 +1,333 @@
+"""
+Collaborative editing sessions: element operations shared between editors.
+
+Editors of a plan subscribe to its EditSession over Server-Sent Events and
+send element operations (the format of element_ops.py) with POST. Each batch
+is numbered and broadcast to every editor as soon as it arrives, so all
+editors apply the same operations in the same order:
+
+    event: ops
+    data: {"seq": 7, "client_id": "tab-1", "user_id": "...", "ops": [...]}
+
+The operations are also merged into the session's pending set, one entry per
+element: consecutive moves of a dragged booth collapse into one update, an
+element added and removed before a flush is never written. One flusher
+thread per worker writes every session's pending set as a single
+version-guarded update each COLLAB_FLUSH_INTERVAL, so MongoDB sees at most
+one write per plan per interval however many editors are dragging. After a
+write the session publishes `saved` with the new version, and `rejected`
+with the ids of operations that no longer apply (an update of an element
+somebody removed). A write to the plan from outside the session (a full PUT,
+a status change) publishes `resync`: editors re-fetch the plan.
+
+Sessions live in the worker process that serves them; see README for
+running several workers.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+import element_ops
+import live
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def merge_op(pending: Dict, kind: str, element_id: str, payload):
+    """Fold one operation into a pending set of element_id -> (kind, payload).
+
+    Pending kinds are add, update, remove and replace (removed, then added
+    again). Raises ValueError for an operation that contradicts the pending
+    state, such as updating an element removed earlier.
+    """
+    current = pending.get(element_id)
+    state = current[0] if current else None
+    if kind == 'add':
+        if state is None:
+            pending[element_id] = ('add', payload)
+        elif state == 'remove':
+            pending[element_id] = ('replace', payload)
+        else:
+            raise ValueError(f"Element {element_id} already exists")
+    elif kind == 'update':
+        if state is None:
+            pending[element_id] = ('update', dict(payload))
+        elif state == 'remove':
+            raise ValueError(f"Element {element_id} was removed")
+        else:
+            pending[element_id] = (state, {**current[1], **payload})
+    elif state == 'remove':
+        raise ValueError(f"Element {element_id} was removed")
+    elif state == 'add':
+        del pending[element_id]
+    else:
+        pending[element_id] = ('remove', None)
+
+def _as_ops(element_id: str, kind: str, payload) -> List[Dict]:
+    if kind == 'update':
+        return [{'op': 'update', 'id': element_id, 'fields': payload}]
+    if kind == 'remove':
+        return [{'op': 'remove', 'id': element_id}]
+    if kind == 'replace':
+        return [{'op': 'remove', 'id': element_id}, {'op': 'add', 'element': payload}]
+    return [{'op': 'add', 'element': payload}]
+
+class EditSession(live.Channel):
+    """Event channel and pending writes of one plan's editors"""
+
+    def __init__(self, floorplan_id, version: int):
+        super().__init__(floorplan_id)
+        self.version = version
+        self.pending: Dict[str, tuple] = OrderedDict()
+        self.last_active = time.monotonic()
+
+    def submit(self, ops: List[Dict], user_id, client_id) -> int:
+        """Merge a validated batch into the pending set and broadcast it; returns its seq"""
+        changes = []
+        for op in ops:
+            if op['op'] == 'add':
+                changes.append(('add', op['element']['id'], op['element']))
+            else:
+                changes.append((op['op'], op['id'], op.get('fields')))
+        with self.cond:
+            if self.closed:
+                raise ValueError('The floor plan was deleted')
+            # Merge into a copy of the touched entries so a rejected batch changes nothing
+            scratch = {element_id: self.pending[element_id]
+                       for _, element_id, _ in changes if element_id in self.pending}
+            for kind, element_id, payload in changes:
+                merge_op(scratch, kind, element_id, payload)
+            for _, element_id, _ in changes:
+                if element_id in scratch:
+                    self.pending[element_id] = scratch[element_id]
+                else:
+                    self.pending.pop(element_id, None)
+            self.last_active = time.monotonic()
+            self.publish('ops', {'seq': self.seq + 1, 'client_id': client_id,
+                                 'user_id': user_id, 'ops': ops})
+            return self.seq
+
+    def take(self) -> Dict:
+        with self.cond:
+            pending, self.pending = self.pending, OrderedDict()
+            return pending
+
+    def requeue(self, pending: Dict):
+        """Put operations whose write failed back in front of newer ones"""
+        with self.cond:
+            newer, self.pending = self.pending, pending
+            for element_id, (kind, payload) in newer.items():
+                for op in _as_ops(element_id, kind, payload):
+                    try:
+                        merge_op(self.pending, op['op'], element_id,
+                                 op.get('element') if op['op'] == 'add' else op.get('fields'))
+                    except ValueError as e:
+                        logger.warning(f"Dropped requeued edit of {self.floorplan_id}: {e}")
+
+    def ready(self) -> Dict:
+        """First event of a new editor: the saved version and the edits not yet written"""
+        with self.cond:
+            ops = [op for element_id, (kind, payload) in self.pending.items()
+                   for op in _as_ops(element_id, kind, payload)]
+            return {'version': self.version, 'pending': ops}
+
+class CollabHub:
+    def __init__(self):
+        self.sessions: Dict[str, EditSession] = {}
+        self.ops_received = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._app = None
+        self._after_write = None
+
+    def session(self, db, floorplan_id, app, after_write) -> EditSession:
+        """The plan's session in this worker, created (and the flusher started) if needed.
+
+        `after_write(db, oid)` runs after every flush, inside `app`'s context.
+        """
+        key = str(floorplan_id)
+        with self._lock:
+            self._app, self._after_write = app, after_write
+            session = self.sessions.get(key)
+            if session is None or session.closed:
+                plan = db.floorplans.find_one({'_id': floorplan_id}, {'version': 1})
+                session = self.sessions[key] = EditSession(floorplan_id, (plan or {}).get('version'))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='collab-flush', daemon=True)
+                self._thread.start()
+        return session
+
+    def subscribe(self, db, floorplan_id, app, after_write) -> EditSession:
+        session = self.session(db, floorplan_id, app, after_write)
+        with session.cond:
+            session.subscribers += 1
+            session.last_active = time.monotonic()
+        return session
+
+    def unsubscribe(self, session: EditSession):
+        with session.cond:
+            session.subscribers -= 1
+            session.last_active = time.monotonic()
+
+    def submit(self, session: EditSession, ops: List[Dict], user_id, client_id) -> int:
+        seq = session.submit(ops, user_id, client_id)
+        self.ops_received += len(ops)
+        return seq
+
+    # Flushing
+
+    def flush(self, db, session: EditSession, attempts: int = 3):
+        """Write a session's pending operations as one guarded update"""
+        pending = session.take()
+        if not pending:
+            return
+        oid = session.floorplan_id
+        # Element ids are enough unless the batch may change stats or search tokens
+        projection = element_ops.SOURCE_PROJECTION if self._may_affect_derived(pending) \
+            else {'version': 1, 'state.elements.id': 1}
+        written = False
+        try:
+            for _ in range(attempts):
+                doc = db.floorplans.find_one({'_id': oid}, projection)
+                if not doc:
+                    session.publish('closed', {'reason': 'deleted'})
+                    return
+                self._check_version(session, doc['version'])
+                existing = {e.get('id') for e in (doc.get('state') or {}).get('elements') or []}
+
+                adds, updates, removes, readds, rejected = [], {}, [], [], []
+                for element_id, (kind, payload) in pending.items():
+                    exists = element_id in existing
+                    if kind == 'replace':
+                        if exists:
+                            removes.append(element_id)
+                            readds.append(payload)
+                        else:
+                            adds.append(payload)
+                    elif kind == 'add' and not exists:
+                        adds.append(payload)
+                    elif kind == 'update' and exists:
+                        updates[element_id] = payload
+                    elif kind == 'remove' and exists:
+                        removes.append(element_id)
+                    else:
+                        rejected.append(element_id)
+                if not (adds or updates or removes or readds):
+                    break
+
+                # A replaced element is removed and appended again by the same update
+                derived = None
+                if element_ops.affects_derived_fields(adds + readds, updates, removes):
+                    derived = element_ops.derived_after(doc, adds + readds, updates, removes)
+                update, array_filters = element_ops.build_update(adds + readds, updates, removes,
+                                                                 derived=derived)
+                updated = db.floorplans.find_one_and_update(
+                    {'_id': oid, 'version': doc['version'], **element_ops.element_guard(adds, updates, removes)},
+                    update, array_filters=array_filters, projection={'version': 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                if not updated:
+                    continue  # written concurrently; read again
+
+                written = True
+                self.writes += 1
+                self._after_write(db, oid)
+                with session.cond:
+                    session.version = updated['version']
+                    session.publish('saved', {'version': updated['version'], 'elements': len(pending) - len(rejected)})
+                break
+            else:
+                session.requeue(pending)
+                return
+        except PyMongoError:
+            # Unless the update landed, the edits are only here; keep them for the next tick
+            if not written:
+                session.requeue(pending)
+            raise
+
+        if rejected:
+            session.publish('rejected', {'ids': rejected,
+                                         'message': 'Updated or removed elements must exist and added ids must be new'})
+
+    @staticmethod
+    def _may_affect_derived(pending: Dict) -> bool:
+        """Whether pending operations could change stats or search tokens, before reading the plan"""
+        adds = [payload for kind, payload in pending.values() if kind in ('add', 'replace')]
+        updates = {element_id: payload for element_id, (kind, payload) in pending.items() if kind == 'update'}
+        removes = [element_id for element_id, (kind, _) in pending.items() if kind in ('remove', 'replace')]
+        return element_ops.affects_derived_fields(adds, updates, removes)
+
+    def _check_version(self, session: EditSession, version):
+        """Tell editors to re-fetch after a write that did not come through the session"""
+        with session.cond:
+            if session.version != version:
+                session.version = version
+                session.publish('resync', {'version': version})
+
+    def tick(self, db):
+        sessions = list(self.sessions.values())
+        idle = []
+        for session in sessions:
+            if session.closed:
+                continue
+            if session.pending:
+                try:
+                    self.flush(db, session)
+                except PyMongoError as e:
+                    logger.warning(f"Collaborative edit flush of {session.floorplan_id} failed: {e}")
+            elif session.subscribers > 0:
+                idle.append(session)
+
+        if idle:
+            versions = {d['_id']: d.get('version') for d in db.floorplans.find(
+                {'_id': {'$in': [s.floorplan_id for s in idle]}}, {'version': 1})}
+            for session in idle:
+                if session.floorplan_id not in versions:
+                    session.publish('closed', {'reason': 'deleted'})
+                else:
+                    self._check_version(session, versions[session.floorplan_id])
+
+        now = time.monotonic()
+        with self._lock:
+            for key, session in list(self.sessions.items()):
+                if session.subscribers <= 0 and not session.pending and (
+                        session.closed or now - session.last_active > Config.COLLAB_IDLE_TIMEOUT):
+                    del self.sessions[key]
+
+    def _run(self):
+        from database import get_db
+        with self._app.app_context():
+            db = get_db()
+            while True:
+                time.sleep(Config.COLLAB_FLUSH_INTERVAL)
+                try:
+                    self.tick(db)
+                except Exception as e:
+                    logger.warning(f"Collaborative edit flusher error: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'sessions': len(self.sessions),
+            'editors': sum(max(0, s.subscribers) for s in list(self.sessions.values())),
+            'ops_received': self.ops_received,
+            'writes': self.writes,
+            'flush_interval': Config.COLLAB_FLUSH_INTERVAL
+        }
+
+hub = CollabHub()
+
+def _reset_after_fork():
+    # The flusher thread does not survive a fork; children start their own hub
+    global hub
+    hub = CollabHub()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -11,4 +11,101 @@ class Config:
     
     # Flask settings
     SECRET_KEY = os.getenv('FLASK_SECRET_KEY', JWT_SECRET_KEY)
-    DEBUG = os.getenv('FLASK_DEBUG', 'True').lower() in ('true', '1', 'yes')
\ No newline at end of file
+    DEBUG = os.getenv('FLASK_DEBUG', 'True').lower() in ('true', '1', 'yes')
+    
+    # MongoDB connection pool (one shared client per process)
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '300000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '20000'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+    
+    # Listing pagination
+    PAGINATION_MAX_LIMIT = int(os.getenv('PAGINATION_MAX_LIMIT', '100'))
+    PAGINATION_COUNT_CAP = int(os.getenv('PAGINATION_COUNT_CAP', '10000'))
+    
+    # Cached user records for authorization (seconds / entries)
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    
+    # HTTP caching of public floor plan reads (seconds)
+    PUBLIC_CACHE_MAX_AGE = int(os.getenv('PUBLIC_CACHE_MAX_AGE', '15'))
+    PUBLIC_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv('PUBLIC_CACHE_STALE_WHILE_REVALIDATE', '30'))
+    
+    # Server-side cache of serialized public responses ('local' or 'redis')
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'local')
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '512'))
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # Element-level PATCH of floor plan state
+    ELEMENT_PATCH_MAX_OPS = int(os.getenv('ELEMENT_PATCH_MAX_OPS', '500'))
+    
+    # Server-side wayfinding (navigation grids are cached per plan version)
+    WAYFINDING_DEFAULT_CELL = float(os.getenv('WAYFINDING_DEFAULT_CELL', '20'))
+    WAYFINDING_MAX_CELLS = int(os.getenv('WAYFINDING_MAX_CELLS', '1000000'))
+    WAYFINDING_GRID_CACHE_SIZE = int(os.getenv('WAYFINDING_GRID_CACHE_SIZE', '16'))
+    WAYFINDING_ROUTE_CACHE_SIZE = int(os.getenv('WAYFINDING_ROUTE_CACHE_SIZE', '10000'))
+    
+    # Threads for in-process background jobs (see jobs.py)
+    BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '2'))
+    
+    # Spatial index of canvas elements for viewport / hit-test queries
+    SPATIAL_MIN_BUCKET = float(os.getenv('SPATIAL_MIN_BUCKET', '64'))
+    SPATIAL_INDEX_CACHE_SIZE = int(os.getenv('SPATIAL_INDEX_CACHE_SIZE', '32'))
+    
+    # Level-of-detail tiles of published plans (see tiles.py)
+    TILES_CACHE_DIR = os.getenv('TILES_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tile_cache'))
+    TILES_MAX_ZOOM = int(os.getenv('TILES_MAX_ZOOM', '8'))
+    TILES_DETAIL_ZOOM = int(os.getenv('TILES_DETAIL_ZOOM', '3'))
+    TILES_SIZE_PX = int(os.getenv('TILES_SIZE_PX', '256'))
+    TILES_MIN_PIXELS = float(os.getenv('TILES_MIN_PIXELS', '4'))
+    TILES_MERGE_CELLS = int(os.getenv('TILES_MERGE_CELLS', '32'))
+    
+    # Listing previews ('png' or 'webp' with Pillow installed, SVG otherwise)
+    THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'png')
+    THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', '320'))
+    THUMBNAIL_HEIGHT = int(os.getenv('THUMBNAIL_HEIGHT', '200'))
+    
+    # Live booth-status events ('auto' uses change streams when available, else 'poll')
+    LIVE_EVENTS_MODE = os.getenv('LIVE_EVENTS_MODE', 'auto')
+    LIVE_EVENTS_POLL_INTERVAL = float(os.getenv('LIVE_EVENTS_POLL_INTERVAL', '1'))
+    LIVE_EVENTS_HEARTBEAT = float(os.getenv('LIVE_EVENTS_HEARTBEAT', '15'))
+    LIVE_EVENTS_RETRY_MS = int(os.getenv('LIVE_EVENTS_RETRY_MS', '3000'))
+    LIVE_EVENTS_BUFFER = int(os.getenv('LIVE_EVENTS_BUFFER', '256'))
+    LIVE_EVENTS_MAX_SUBSCRIBERS = int(os.getenv('LIVE_EVENTS_MAX_SUBSCRIBERS', '5000'))
+    
+    # Collaborative editing: pending element operations are written once per interval
+    COLLAB_FLUSH_INTERVAL = float(os.getenv('COLLAB_FLUSH_INTERVAL', '0.5'))
+    COLLAB_IDLE_TIMEOUT = float(os.getenv('COLLAB_IDLE_TIMEOUT', '300'))
+    # Lifetime of the ticket that opens an editing session's event stream (it travels in the URL)
+    COLLAB_TICKET_TTL = int(os.getenv('COLLAB_TICKET_TTL', '60'))
+    
+    # ASGI entry point (asgi.py): threads running the Flask app for the routes that are not async
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '32'))
+    
+    # Production server (serve.py): preforked workers, each running SERVER_THREADS threads
+    SERVER_BIND = os.getenv('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', str((os.cpu_count() or 1) * 2 + 1)))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '8'))
+    # Event streams served by the Flask app hold a thread each; keep the rest for the API
+    LIVE_EVENTS_MAX_THREAD_STREAMS = int(os.getenv('LIVE_EVENTS_MAX_THREAD_STREAMS',
+                                                   str(max(1, SERVER_THREADS // 2))))
+    SERVER_WORKER_CLASS = os.getenv('SERVER_WORKER_CLASS', 'gthread')
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', '60'))
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30'))
+    SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', '5'))
+    SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', '0'))
+    SERVER_WARMUP_PLANS = int(os.getenv('SERVER_WARMUP_PLANS', '20'))
+    
+    # Password hashing (passwords.py): bcrypt cost, and the process pool each worker hashes in.
+    # Beyond BCRYPT_MAX_PENDING queued operations, logins get 503 with Retry-After.
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    BCRYPT_PROCESSES = int(os.getenv('BCRYPT_PROCESSES', '1'))
+    BCRYPT_NICE = int(os.getenv('BCRYPT_NICE', '10'))
+    BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', '16'))
+    BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', '10'))
+    BCRYPT_RETRY_AFTER = int(os.getenv('BCRYPT_RETRY_AFTER', '2'))
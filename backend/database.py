@@ -0,0 +1,130 @@
+"""
+Process-wide MongoDB client shared by every blueprint and auth helper.
+
+MongoClient is thread-safe and maintains its own connection pool, so one
+client per process is all the application needs. The client is created
+lazily on first use and re-created in a child process after fork, because
+pymongo clients must never be shared across a fork.
+"""
+
+import os
+import threading
+from pymongo import MongoClient
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # optional dependency, only needed by the ASGI entry point (asgi.py)
+    AsyncIOMotorClient = None
+
+from config import Config
+
+_client = None
+_client_pid = None
+_async_client = None
+_lock = threading.Lock()
+
+def _client_options() -> dict:
+    return {
+        'maxPoolSize': Config.MONGO_MAX_POOL_SIZE,
+        'minPoolSize': Config.MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': Config.MONGO_MAX_IDLE_TIME_MS,
+        'connectTimeoutMS': Config.MONGO_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'socketTimeoutMS': Config.MONGO_SOCKET_TIMEOUT_MS,
+        'waitQueueTimeoutMS': Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
+
+def get_client() -> MongoClient:
+    """Return the shared client, creating it for the current process if needed"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                # A client inherited from the parent process is unusable here;
+                # drop the reference without closing the parent's sockets.
+                _client = MongoClient(Config.MONGODB_URI, connect=False, **_client_options())
+                _client_pid = pid
+    return _client
+
+def get_db():
+    """Return the default database of the shared client"""
+    return get_client().get_default_database()
+
+def get_async_db():
+    """Default database of the process's Motor client, for asyncio handlers.
+
+    The client binds to the event loop it is first used on; the ASGI server
+    runs one loop per worker process.
+    """
+    global _async_client
+    if _async_client is None:
+        if AsyncIOMotorClient is None:
+            raise RuntimeError('The ASGI entry point requires the motor package')
+        _async_client = AsyncIOMotorClient(Config.MONGODB_URI, **_client_options())
+    return _async_client.get_default_database()
+
+def close_client():
+    """Close the shared clients (used on shutdown and in tests)"""
+    global _client, _client_pid, _async_client
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+        if _async_client is not None:
+            _async_client.close()
+        _async_client = None
+
+def _reset_after_fork():
+    # Runs in the child only. The lock may have been held by another thread
+    # at fork time, so replace it rather than acquiring it.
+    global _client, _client_pid, _async_client, _lock
+    _lock = threading.Lock()
+    _client = None
+    _client_pid = None
+    _async_client = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def ensure_indexes(db):
+    """Create the indexes the application relies on"""
+    db.users.create_index([("username", 1)], unique=True)
+    db.users.create_index([("email", 1)], unique=True)
+    db.floorplans.create_index([("name", 1)])
+    db.floorplans.create_index([("user_id", 1)])
+    db.floorplans.create_index([("event_id", 1)])
+    # Keyset pagination: the listing sort key plus the filters that precede it
+    db.floorplans.create_index([("last_modified", -1), ("_id", -1)])
+    db.floorplans.create_index([("status", 1), ("last_modified", -1), ("_id", -1)])
+    db.floorplans.create_index([("user_id", 1), ("last_modified", -1), ("_id", -1)])
+    # Multikey indexes for prefix search (see search.py)
+    db.floorplans.create_index([("search_tokens", 1)])
+    db.floorplans.create_index([("booth_tokens", 1)])
+    # Booth collection (see booths.py)
+    db.booths.create_index([("floorplan_id", 1), ("element_id", 1)], unique=True)
+    db.booths.create_index([("status_key", 1)])
+    db.booths.create_index([("number", 1)])
+    db.booths.create_index([("company", 1)])
+    db.booths.create_index([("tokens", 1)])
+    # Default /api/booths order and price sorting / range filters
+    db.booths.create_index([("floorplan_name", 1), ("number", 1), ("_id", 1)])
+    db.booths.create_index([("price", 1), ("_id", 1)])
+    # Public exhibitor directory (see directory.py)
+    db.exhibitors.create_index([("floorplan_id", 1)])
+    db.exhibitors.create_index([("featured", -1), ("name_key", 1), ("_id", 1)])
+    db.exhibitors.create_index([("tokens", 1)])
+    db.exhibitors.create_index([("category", 1)])
+    db.exhibitors.create_index([("floor", 1)])
+    db.exhibitors.create_index([("tier_rank", 1), ("name_key", 1)])
+    # Listing previews (see thumbnails.py)
+    db.thumbnails.create_index([("floorplan_id", 1), ("version", 1)])
+
+def init_db(app):
+    """Create the shared client for the app, verify connectivity and build indexes"""
+    db = get_db()
+    db.command('ping')
+    ensure_indexes(db)
+    app.extensions['mongo_db'] = db
+    return db
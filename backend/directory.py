@@ -0,0 +1,149 @@
+"""
+Precomputed exhibitor directory for the public kiosk views.
+
+The `exhibitors` collection holds one small document per company per
+published floor plan. It is built from the `booths` collection (see
+booths.py): a company's booths on that plan are folded into a single entry
+with its booth numbers, best booth status and any sponsorship tier.
+`/api/public/companies` and `/api/public/sponsors` read only this
+collection, so a kiosk sidebar fetches a few KB instead of whole plans.
+
+refresh_floorplan() rebuilds one plan's entries and is called whenever a
+plan's booths change, including status changes (publish / unpublish) and
+deletion. Entries are rewritten only when their content digest changed.
+"""
+
+import hashlib
+import json
+from typing import Dict, List
+from pymongo import ReplaceOne, DeleteMany
+
+import search
+from booths import SPONSOR_TIERS
+
+# Directory status of a company, from the best status among its booths
+_STATUS_RANK = {'sold': 0, 'reserved': 1, 'on_hold': 1, 'available': 2}
+_COMPANY_STATUS = {0: 'sold', 1: 'reserved', 2: 'available'}
+
+# Company listing order: sponsors first, then alphabetical
+COMPANY_SORT = [('featured', -1), ('name_key', 1), ('_id', 1)]
+
+# Fields kept out of the company listing query results
+COMPANY_PROJECTION = {'digest': 0, 'tokens': 0}
+
+BOOTH_PROJECTION = {'number': 1, 'status_key': 1, 'company': 1, 'category': 1, 'exhibitor': 1,
+                    'website': 1, 'sponsor_tier': 1, 'floor': 1, 'event_id': 1,
+                    'floorplan_name': 1}
+
+def company_entries(floorplan_id, booth_docs: List[Dict]) -> Dict[str, Dict]:
+    """Fold the published booths of one plan into directory entries keyed by _id"""
+    entries = {}
+    for booth in booth_docs:
+        name = (booth.get('company') or '').strip()
+        if not name:
+            continue
+        key = f"{floorplan_id}:{name.lower()}"
+        exhibitor = booth.get('exhibitor') or {}
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = {
+                '_id': key,
+                'floorplan_id': floorplan_id,
+                'floorplan_name': booth.get('floorplan_name'),
+                'event_id': booth.get('event_id'),
+                'floor': booth.get('floor', 1),
+                'name': name,
+                'name_key': name.lower(),
+                'tokens': search.tokenize(name),
+                'category': booth.get('category') or '',
+                'booth_numbers': [],
+                'status_rank': 2,
+                'tier_rank': None,
+                'logo': None,
+                'description': None,
+                'website': None,
+                'contact': {}
+            }
+        entry['booth_numbers'].append(booth.get('number'))
+        entry['status_rank'] = min(entry['status_rank'], _STATUS_RANK.get(booth.get('status_key'), 2))
+        if booth.get('sponsor_tier'):
+            rank = SPONSOR_TIERS.index(booth['sponsor_tier'])
+            if entry['tier_rank'] is None or rank < entry['tier_rank']:
+                entry['tier_rank'] = rank
+        # The first booth that carries a value wins
+        entry['category'] = entry['category'] or booth.get('category') or ''
+        entry['logo'] = entry['logo'] or exhibitor.get('logo')
+        entry['description'] = entry['description'] or exhibitor.get('description')
+        entry['website'] = entry['website'] or booth.get('website')
+        entry['contact'] = entry['contact'] or exhibitor.get('contact') or {}
+
+    for entry in entries.values():
+        entry['booth_numbers'] = sorted(n for n in entry['booth_numbers'] if n)
+        entry['featured'] = entry['tier_rank'] is not None
+        entry['digest'] = hashlib.sha1(
+            json.dumps(entry, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return entries
+
+def refresh_floorplan(db, floorplan_id) -> int:
+    """Rebuild the directory entries of one plan; returns the number of writes"""
+    booth_docs = db.booths.find({'floorplan_id': floorplan_id, 'floorplan_status': 'published'},
+                                BOOTH_PROJECTION)
+    entries = company_entries(floorplan_id, booth_docs)
+    stored = {d['_id']: d.get('digest')
+              for d in db.exhibitors.find({'floorplan_id': floorplan_id}, {'digest': 1})}
+
+    ops = [ReplaceOne({'_id': key}, entry, upsert=True)
+           for key, entry in entries.items() if stored.get(key) != entry['digest']]
+    removed = [key for key in stored if key not in entries]
+    if removed:
+        ops.append(DeleteMany({'_id': {'$in': removed}}))
+    if not ops:
+        return 0
+    db.exhibitors.bulk_write(ops, ordered=False)
+    return len(ops)
+
+def to_company(entry: Dict) -> Dict:
+    """Directory entry in the shape of the frontend `Company` type"""
+    booth_numbers = entry.get('booth_numbers') or []
+    return {
+        'id': entry['_id'],
+        'name': entry['name'],
+        'booth_number': booth_numbers[0] if booth_numbers else None,
+        'boothNumber': booth_numbers[0] if booth_numbers else None,
+        'booth_numbers': booth_numbers,
+        'floor': entry.get('floor', 1),
+        'floorplan_id': str(entry['floorplan_id']),
+        'status': _COMPANY_STATUS[entry.get('status_rank', 2)],
+        'category': entry.get('category') or '',
+        'featured': entry.get('featured', False),
+        'logo': entry.get('logo'),
+        'description': entry.get('description'),
+        'website': entry.get('website'),
+        'contact': entry.get('contact') or {}
+    }
+
+def sponsors_pipeline(match: Dict, limit: int) -> List[Dict]:
+    """One sponsor per company (its best tier across plans), best tiers first"""
+    return [
+        {'$match': {**match, 'tier_rank': {'$ne': None}}},
+        {'$sort': {'tier_rank': 1, 'name_key': 1}},
+        {'$group': {
+            '_id': '$name_key',
+            'name': {'$first': '$name'},
+            'tier_rank': {'$first': '$tier_rank'},
+            'logo': {'$first': '$logo'},
+            'website': {'$first': '$website'}
+        }},
+        {'$sort': {'tier_rank': 1, '_id': 1}},
+        {'$limit': limit}
+    ]
+
+def to_sponsor(row: Dict) -> Dict:
+    """Aggregated sponsor row in the shape of the frontend `Sponsor` type"""
+    return {
+        'id': row['_id'],
+        'name': row['name'],
+        'logo': row.get('logo') or '',
+        'website': row.get('website'),
+        'tier': SPONSOR_TIERS[row['tier_rank']]
+    }
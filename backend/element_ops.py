@@ -0,0 +1,185 @@
+"""
+Element-level edits of a floor plan's `state.elements`.
+
+A request carries a list of operations addressed by element `id`:
+
+    {"op": "add", "element": {...}}
+    {"op": "update", "id": "booth-1", "fields": {"x": 120, "status": "sold"}}
+    {"op": "remove", "id": "booth-2"}
+
+They are applied as one atomic, version-guarded MongoDB update. A batch of a
+single kind maps onto a targeted operator: `$set` with array filters, `$push`
+or `$pull`. MongoDB rejects a mix of those on the same array, so a mixed batch
+becomes a pipeline update that filters, merges and appends in place.
+
+When an edit can change the stored stats and search tokens, the caller reads
+the elements at the version it guards on, computes them with derived_after,
+and passes them to build_update. They are then written by the same update and
+are never stale at any version.
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from models import FloorPlan
+
+# Element fields that feed `stats`, `booth_tokens` and `search_tokens`
+DERIVED_ELEMENT_FIELDS = frozenset(('type', 'status', 'price', 'number', 'exhibitor'))
+
+# What derived_after needs from the stored plan
+SOURCE_PROJECTION = {'version': 1, 'name': 1, 'description': 1, 'state.elements': 1}
+
+_FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _element_id(value) -> str:
+    if not isinstance(value, str) or not value:
+        raise ValueError('Each operation needs a non-empty string element id')
+    if value.startswith('$'):
+        # Would read as a field path or variable inside an aggregation expression
+        raise ValueError(f"Element id must not start with '$': {value!r}")
+    return value
+
+def parse_ops(ops, max_ops: int) -> Tuple[List[Dict], Dict[str, Dict], List[str]]:
+    """Validate a list of operations and split it into (adds, updates, removes).
+
+    Raises ValueError for malformed input. An element id may appear in at most
+    one operation per request.
+    """
+    if not isinstance(ops, list) or not ops:
+        raise ValueError('ops must be a non-empty list')
+    if len(ops) > max_ops:
+        raise ValueError(f'At most {max_ops} operations per request')
+
+    adds, updates, removes = [], {}, []
+    seen = set()
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError('Each operation must be an object')
+        kind = op.get('op')
+        if kind == 'add':
+            element = op.get('element')
+            if not isinstance(element, dict):
+                raise ValueError('add requires an element object')
+            element_id = _element_id(element.get('id'))
+        elif kind in ('update', 'remove'):
+            element_id = _element_id(op.get('id'))
+        else:
+            raise ValueError(f"Unknown operation: {kind!r}")
+
+        if element_id in seen:
+            raise ValueError(f"Element {element_id} appears in more than one operation")
+        seen.add(element_id)
+
+        if kind == 'add':
+            adds.append(element)
+        elif kind == 'remove':
+            removes.append(element_id)
+        else:
+            fields = op.get('fields')
+            if not isinstance(fields, dict) or not fields:
+                raise ValueError('update requires a non-empty fields object')
+            for name in fields:
+                if name == 'id' or not _FIELD_NAME.match(name):
+                    raise ValueError(f"Invalid element field: {name!r}")
+            updates[element_id] = fields
+    return adds, updates, removes
+
+def element_guard(adds: List[Dict], updates: Dict[str, Dict], removes: List[str]) -> Dict:
+    """Filter clause: updated/removed ids must exist and added ids must not"""
+    condition = {}
+    existing = list(updates) + removes
+    if existing:
+        condition['$all'] = existing
+    if adds:
+        condition['$nin'] = [element['id'] for element in adds]
+    return {'state.elements.id': condition}
+
+def build_update(adds: List[Dict], updates: Dict[str, Dict], removes: List[str],
+                 now: datetime = None, derived: Optional[Dict] = None) -> Tuple[object, List[Dict]]:
+    """Return (update, array_filters) for `find_one_and_update`; `derived` fields are set too"""
+    now = now or datetime.utcnow()
+    derived = derived or {}
+    kinds = sum(1 for part in (adds, updates, removes) if part)
+
+    if kinds == 1:
+        update = {'$set': {'last_modified': now, **derived}, '$inc': {'version': 1}}
+        array_filters = None
+        if adds:
+            update['$push'] = {'state.elements': {'$each': adds}}
+        elif removes:
+            update['$pull'] = {'state.elements': {'id': {'$in': removes}}}
+        else:
+            array_filters = []
+            for i, (element_id, fields) in enumerate(updates.items()):
+                for name, value in fields.items():
+                    update['$set'][f'state.elements.$[e{i}].{name}'] = value
+                array_filters.append({f'e{i}.id': element_id})
+        return update, array_filters
+
+    # Mixed batch: rebuild the array server-side in a single pipeline stage
+    elements = '$state.elements'
+    if removes:
+        elements = {'$filter': {'input': elements, 'as': 'el',
+                                'cond': {'$not': [{'$in': ['$$el.id', {'$literal': removes}]}]}}}
+    if updates:
+        elements = {'$map': {'input': elements, 'as': 'el', 'in': {'$switch': {
+            'branches': [
+                {'case': {'$eq': ['$$el.id', {'$literal': element_id}]},
+                 'then': {'$mergeObjects': ['$$el', {'$literal': fields}]}}
+                for element_id, fields in updates.items()
+            ],
+            'default': '$$el'
+        }}}}
+    if adds:
+        elements = {'$concatArrays': [elements, {'$literal': adds}]}
+    pipeline = [{'$set': {
+        'state.elements': elements,
+        'last_modified': {'$literal': now},
+        'version': {'$add': ['$version', 1]},
+        **{name: {'$literal': value} for name, value in derived.items()}
+    }}]
+    return pipeline, None
+
+def affects_derived_fields(adds: List[Dict], updates: Dict[str, Dict], removes: List[str]) -> bool:
+    """Whether the edit can change booth stats or search tokens (plain moves cannot)"""
+    if removes or any(element.get('type') == 'booth' for element in adds):
+        return True
+    return any(DERIVED_ELEMENT_FIELDS & set(fields) for fields in updates.values())
+
+def apply_ops(elements: List[Dict], adds: List[Dict], updates: Dict[str, Dict],
+              removes: List[str]) -> List[Dict]:
+    """The elements after the edit, in the order build_update leaves them"""
+    removed = set(removes)
+    result = [{**element, **updates[element.get('id')]} if element.get('id') in updates else element
+              for element in elements if element.get('id') not in removed]
+    return result + list(adds)
+
+def derived_after(doc: Dict, adds: List[Dict], updates: Dict[str, Dict], removes: List[str]) -> Dict:
+    """Derived fields of `doc` (read with SOURCE_PROJECTION) once the edit is applied"""
+    elements = apply_ops((doc.get('state') or {}).get('elements') or [], adds, updates, removes)
+    return FloorPlan.derived_fields({'elements': elements}, doc.get('name'), doc.get('description'))
+
+def refresh_derived_fields(collection, floorplan_id, attempts: int = 5) -> Optional[int]:
+    """Recompute stored stats/search fields from the current elements; returns the new version.
+
+    Each attempt writes only if the plan is still at the version it read, so a
+    concurrent edit can never be overwritten with stale derived fields. The
+    write bumps the version so that ETags and cached responses move on too. The
+    loop retries until it lands or the attempts run out.
+    """
+    for _ in range(attempts):
+        doc = collection.find_one({'_id': floorplan_id}, SOURCE_PROJECTION)
+        if not doc:
+            return None
+        derived = FloorPlan.derived_fields(doc.get('state'), doc.get('name'), doc.get('description'))
+        updated = collection.find_one_and_update(
+            {'_id': floorplan_id, 'version': doc['version']},
+            {'$set': {**derived, 'last_modified': datetime.utcnow()}, '$inc': {'version': 1}},
+            projection={'version': 1}, return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            return updated['version']
+    return None
@@ -0,0 +1,59 @@
+"""
+HTTP conditional request helpers for floor plan reads.
+
+Floor plans carry a monotonically increasing `version`, so `_id` + `version`
+is a strong validator. Handlers first check the request's validators against
+a projection of {version, last_modified}. Only on a miss do they load and
+serialize the full state.
+"""
+
+from flask import request, make_response
+
+from config import Config
+
+# Fields needed to answer a conditional request without loading the state
+VALIDATOR_PROJECTION = {'version': 1, 'last_modified': 1, 'status': 1, 'user_id': 1}
+
+def floorplan_etag(floorplan_id, version) -> str:
+    return f"fp-{floorplan_id}-v{version}"
+
+def if_match_version(floorplan_id):
+    """Version named by an If-Match ETag for this plan, or None when absent"""
+    prefix = floorplan_etag(floorplan_id, '')
+    for etag in request.if_match.as_set():
+        if etag.startswith(prefix) and etag[len(prefix):].isdigit():
+            return int(etag[len(prefix):])
+    return None
+
+def is_conditional() -> bool:
+    """Whether the client sent validators worth checking before loading the state"""
+    return bool(request.if_none_match) or request.if_modified_since is not None
+
+def is_not_modified(etag: str, last_modified) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against a plan's validators"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since is not None and last_modified is not None:
+        # HTTP dates have second precision
+        return last_modified.replace(microsecond=0, tzinfo=None) <= \
+            request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def apply_cache_headers(response, etag: str, last_modified, public: bool = False):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if public:
+        # Shared caches (CDN / reverse proxy) may serve this for max_age seconds
+        response.cache_control.public = True
+        response.cache_control.max_age = Config.PUBLIC_CACHE_MAX_AGE
+        response.headers['Cache-Control'] += f', stale-while-revalidate={Config.PUBLIC_CACHE_STALE_WHILE_REVALIDATE}'
+    else:
+        # Per-user responses: browsers may keep them but must revalidate each time
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+def not_modified_response(etag: str, last_modified, public: bool = False):
+    response = make_response('', 304)
+    return apply_cache_headers(response, etag, last_modified, public=public)
@@ -0,0 +1,61 @@
+"""
+In-process background jobs.
+
+Work that must not delay a response (e.g. precomputing a published plan's
+navigation data) is handed to a small thread pool. Jobs are keyed: a job whose
+key is already queued or running is not submitted again. Jobs are best effort
+and lost on restart, so each one must be safe to re-run from a script.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.BACKGROUND_WORKERS,
+                                           thread_name_prefix='jobs')
+        return _executor
+
+def submit(key, fn, *args) -> bool:
+    """Run fn(*args) in the background unless a job with `key` is pending"""
+    with _lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+
+    def run():
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception(f"Background job {key} failed")
+        finally:
+            with _lock:
+                _pending.discard(key)
+
+    _get_executor().submit(run)
+    return True
+
+def pending() -> int:
+    return len(_pending)
+
+def _reset_after_fork():
+    # Worker threads do not survive a fork; children start their own pool
+    global _executor, _pending, _lock
+    _lock = threading.Lock()
+    _executor = None
+    _pending = set()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,349 @@
+"""
+Live booth-status events for viewers and kiosks (Server-Sent Events).
+
+Each worker runs one LiveHub thread. Subscribers of a plan share a Channel:
+a bounded buffer of numbered events. A subscriber served by the Flask app
+(stream) holds one server thread, waiting on the channel's condition variable,
+so a worker serves at most LIVE_EVENTS_MAX_THREAD_STREAMS of them. asgi.py
+serves the same streams as coroutines (astream): an idle subscriber is then an
+asyncio.Event the channel sets on publish, and holds no thread (see README).
+
+The hub learns that a plan's booths changed from a MongoDB change stream on
+the `booths` collection. The collection is written after every plan update
+(see booths.py), so the change has landed by the time the event arrives. On a
+standalone server without change streams it polls the subscribed plans'
+versions instead. Either way the hub then diffs the plan's booth statuses
+against the channel's snapshot and publishes only the booths that changed:
+
+    event: booths
+    data: {"version": 12, "changes": [{"id": "...", "number": "A1", "status": "sold"}]}
+
+Other events are `ready` (sent first), `resync` (the client missed events and
+should re-fetch the plan) and `closed` (the plan was unpublished or deleted).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Server error codes meaning "change streams are not available here"
+_NO_CHANGE_STREAMS = {40573, 20, 115}
+
+_WATCH_PIPELINE = [
+    {'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}},
+    {'$project': {'operationType': 1, 'documentKey': 1, 'fullDocument.floorplan_id': 1}}
+]
+
+class TooManySubscribers(Exception):
+    pass
+
+class Channel:
+    """Event buffer and booth snapshot shared by the subscribers of one plan"""
+
+    def __init__(self, floorplan_id):
+        self.floorplan_id = floorplan_id
+        self.cond = threading.Condition()
+        self.refresh_lock = threading.Lock()
+        self.seq = 0
+        self.events = deque(maxlen=Config.LIVE_EVENTS_BUFFER)
+        self.subscribers = 0
+        self.closed = False
+        self.version = None
+        self.snapshot: Optional[Dict] = None  # element_id -> (number, status)
+        self.booth_ids: Dict = {}  # booth document _id -> element_id
+        self.settle = 0  # extra polls after a version change (poll mode)
+        self.waiters = set()  # (loop, asyncio.Event) of coroutine subscribers
+
+    def publish(self, event: str, data: Dict):
+        with self.cond:
+            self.seq += 1
+            self.events.append((self.seq, event, json.dumps(data, separators=(',', ':'))))
+            if event == 'closed':
+                self.closed = True
+            self.cond.notify_all()
+            for loop, wake in self.waiters:
+                try:
+                    loop.call_soon_threadsafe(wake.set)
+                except RuntimeError:
+                    pass  # event loop already closed
+
+    def since(self, seq: int):
+        """Buffered events after `seq`, and whether some were already dropped"""
+        events = [e for e in self.events if e[0] > seq]
+        missed = bool(events) and events[0][0] > seq + 1
+        return events, missed
+
+class LiveHub:
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.channels: Dict[str, Channel] = {}
+        self.subscribers = 0
+        self.thread_streams = 0
+        self.mode = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Subscriptions
+
+    def subscribe(self, db, floorplan_id) -> Channel:
+        key = str(floorplan_id)
+        with self._lock:
+            if self.subscribers >= Config.LIVE_EVENTS_MAX_SUBSCRIBERS:
+                raise TooManySubscribers()
+            channel = self.channels.get(key)
+            if channel is None or channel.closed:
+                channel = self.channels[key] = Channel(floorplan_id)
+            channel.subscribers += 1
+            self.subscribers += 1
+            self._ensure_thread()
+        if channel.snapshot is None:
+            self.refresh(db, channel)
+        return channel
+
+    def unsubscribe(self, channel: Channel):
+        with self._lock:
+            channel.subscribers -= 1
+            self.subscribers -= 1
+            if channel.subscribers <= 0 and self.channels.get(str(channel.floorplan_id)) is channel:
+                del self.channels[str(channel.floorplan_id)]
+
+    # Deltas
+
+    def refresh(self, db, channel: Channel):
+        """Diff a plan's booth statuses against the channel snapshot and publish the changes"""
+        with channel.refresh_lock:
+            plan = db.floorplans.find_one({'_id': channel.floorplan_id}, {'version': 1, 'status': 1})
+            if not plan or plan.get('status') != 'published':
+                if channel.snapshot is not None and not channel.closed:
+                    channel.publish('closed', {'reason': 'unpublished' if plan else 'deleted'})
+                channel.snapshot = {}
+                channel.closed = True
+                return
+
+            rows = list(db.booths.find({'floorplan_id': channel.floorplan_id},
+                                       {'element_id': 1, 'number': 1, 'status': 1}))
+            snapshot = {r['element_id']: (r.get('number'), r.get('status')) for r in rows}
+            if channel.snapshot is not None:
+                changes = [{'id': element_id, 'number': number, 'status': status}
+                           for element_id, (number, status) in snapshot.items()
+                           if channel.snapshot.get(element_id) != (number, status)]
+                changes.extend({'id': element_id, 'removed': True}
+                               for element_id in channel.snapshot if element_id not in snapshot)
+                if changes:
+                    channel.publish('booths', {'version': plan['version'], 'changes': changes})
+            if channel.version != plan['version']:
+                channel.settle = 1
+            channel.snapshot = snapshot
+            channel.booth_ids = {r['_id']: r['element_id'] for r in rows}
+            channel.version = plan['version']
+
+    # Background watcher
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='live-events', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        from database import get_db
+        db = get_db()
+        self.mode = 'poll' if Config.LIVE_EVENTS_MODE == 'poll' else 'changestream'
+        while True:
+            try:
+                if self.mode == 'changestream':
+                    self._watch(db)
+                else:
+                    self._poll(db)
+            except OperationFailure as e:
+                if self.mode == 'changestream' and e.code in _NO_CHANGE_STREAMS:
+                    logger.info("Change streams unavailable, polling for live booth events")
+                    self.mode = 'poll'
+                    continue
+                logger.warning(f"Live events watcher error: {e}")
+                time.sleep(1)
+            except PyMongoError as e:
+                logger.warning(f"Live events watcher error: {e}")
+                time.sleep(1)
+            # Events may have been missed while reconnecting
+            for channel in list(self.channels.values()):
+                self._safe_refresh(db, channel)
+
+    def _watch(self, db):
+        with db.booths.watch(_WATCH_PIPELINE, max_await_time_ms=500) as stream:
+            while True:
+                # Collect a batch of changes, then refresh each touched plan once
+                dirty = {}
+                deadline = time.monotonic() + 0.5
+                change = stream.try_next()
+                while change is not None:
+                    channel = self._channel_of(change)
+                    if channel is not None:
+                        dirty[id(channel)] = channel
+                    if time.monotonic() > deadline:
+                        break
+                    change = stream.try_next()
+                for channel in dirty.values():
+                    self._safe_refresh(db, channel)
+
+    def _channel_of(self, change) -> Optional[Channel]:
+        floorplan_id = (change.get('fullDocument') or {}).get('floorplan_id')
+        if floorplan_id is not None:
+            return self.channels.get(str(floorplan_id))
+        booth_id = change.get('documentKey', {}).get('_id')
+        for channel in list(self.channels.values()):
+            if booth_id in channel.booth_ids:
+                return channel
+        return None
+
+    def _poll(self, db):
+        while True:
+            time.sleep(Config.LIVE_EVENTS_POLL_INTERVAL)
+            channels = list(self.channels.values())
+            if not channels:
+                continue
+            versions = {d['_id']: d.get('version') for d in db.floorplans.find(
+                {'_id': {'$in': [c.floorplan_id for c in channels]}}, {'version': 1})}
+            for channel in channels:
+                # The booths are synchronised just after the plan write, so look once more
+                # on the next poll before trusting a diff of a new version
+                if versions.get(channel.floorplan_id) != channel.version or channel.settle:
+                    if versions.get(channel.floorplan_id) == channel.version:
+                        channel.settle -= 1
+                    self._safe_refresh(db, channel)
+
+    def _safe_refresh(self, db, channel: Channel):
+        try:
+            self.refresh(db, channel)
+        except PyMongoError as e:
+            logger.warning(f"Live events refresh of {channel.floorplan_id} failed: {e}")
+
+    def stats(self) -> Dict:
+        return {'mode': self.mode, 'channels': len(self.channels), 'subscribers': self.subscribers,
+                'max_subscribers': Config.LIVE_EVENTS_MAX_SUBSCRIBERS,
+                'thread_streams': self.thread_streams,
+                'max_thread_streams': Config.LIVE_EVENTS_MAX_THREAD_STREAMS}
+
+    def threads_exhausted(self) -> bool:
+        """Whether this worker already gives LIVE_EVENTS_MAX_THREAD_STREAMS threads to streams"""
+        return self.thread_streams >= Config.LIVE_EVENTS_MAX_THREAD_STREAMS
+
+def _format(event_id: str, event: str, data: str) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+class _Cursor:
+    """Position of one subscriber in a channel's events"""
+
+    def __init__(self, channel: Channel, last_event_id: Optional[str], ready: Optional[Callable[[], Dict]]):
+        self.channel = channel
+        with channel.cond:
+            self.last = channel.seq
+            payload = ready() if ready else {'version': channel.version}
+        self.resync = False
+        if last_event_id:
+            epoch, _, seq = last_event_id.partition('-')
+            if epoch == hub.epoch and seq.isdigit():
+                self.last = int(seq)
+            else:
+                # Reconnected to another worker or after a restart
+                self.resync = True
+        self.opening = (f"retry: {Config.LIVE_EVENTS_RETRY_MS}\n" +
+                        _format(f"{hub.epoch}-{self.last}", 'ready', json.dumps(payload, default=str)))
+
+    def pending(self) -> bool:
+        """Whether there is something to send; call with channel.cond held"""
+        return self.channel.seq > self.last or self.channel.closed
+
+    def take(self) -> Tuple[str, bool]:
+        """Chunk to send now (events, resync or keep-alive) and whether the stream ends"""
+        channel = self.channel
+        with channel.cond:
+            events, missed = channel.since(self.last)
+            closed = channel.closed
+        if self.resync or missed:
+            chunk = _format(f"{hub.epoch}-{events[-1][0] if events else self.last}", 'resync',
+                            json.dumps({'version': channel.version}))
+            self.resync = False
+        elif events:
+            chunk = ''.join(_format(f"{hub.epoch}-{seq}", event, data) for seq, event, data in events)
+        else:
+            chunk = '' if closed else ': keep-alive\n\n'
+        if events:
+            self.last = events[-1][0]
+        return chunk, closed and not channel.since(self.last)[0]
+
+def stream(channel: Channel, last_event_id: Optional[str] = None,
+           ready: Optional[Callable[[], Dict]] = None, unsubscribe=None):
+    """SSE body for one subscriber of `channel`, holding the server thread that iterates it.
+
+    `ready()` builds the payload of the first event (the channel version by
+    default) and `unsubscribe(channel)` is called when the client goes away.
+    """
+    with hub._lock:
+        hub.thread_streams += 1
+    try:
+        cursor = _Cursor(channel, last_event_id, ready)
+        yield cursor.opening
+        while True:
+            with channel.cond:
+                channel.cond.wait_for(cursor.pending, timeout=Config.LIVE_EVENTS_HEARTBEAT)
+            chunk, done = cursor.take()
+            if chunk:
+                yield chunk
+            if done:
+                return
+    finally:
+        with hub._lock:
+            hub.thread_streams -= 1
+        (unsubscribe or hub.unsubscribe)(channel)
+
+async def astream(channel: Channel, last_event_id: Optional[str] = None,
+                  ready: Optional[Callable[[], Dict]] = None, unsubscribe=None):
+    """The same SSE body as stream() for an event loop; waiting holds no thread"""
+    wake = asyncio.Event()
+    waiter = (asyncio.get_running_loop(), wake)
+    with channel.cond:
+        channel.waiters.add(waiter)
+    try:
+        cursor = _Cursor(channel, last_event_id, ready)
+        yield cursor.opening
+        while True:
+            with channel.cond:
+                pending = cursor.pending()
+            if not pending:
+                try:
+                    await asyncio.wait_for(wake.wait(), Config.LIVE_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    pass
+            # Cleared before reading, so a publish from now on sets it again
+            wake.clear()
+            chunk, done = cursor.take()
+            if chunk:
+                yield chunk
+            if done:
+                return
+    finally:
+        with channel.cond:
+            channel.waiters.discard(waiter)
+        (unsubscribe or hub.unsubscribe)(channel)
+
+hub = LiveHub()
+
+def _reset_after_fork():
+    # The watcher thread does not survive a fork; children start their own hub
+    global hub
+    hub = LiveHub()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Migration script to build the `booths` collection from existing floorplans
+Synchronises every floorplan's booth elements into `booths` (see booths.py),
+rebuilds the public exhibitor directory (see directory.py) and removes booth
+and directory documents whose floorplan no longer exists. The sync is
+incremental, so running it again only rewrites booths that drifted. Floorplans
+are processed in batches by _id.
+
+Usage: python migrate_booths.py [--batch-size N]
+"""
+
+import argparse
+
+from database import get_db, ensure_indexes
+import booths
+import directory
+
+def migrate_booths(batch_size: int = 100):
+    db = get_db()
+    ensure_indexes(db)
+
+    print("Starting migration: Synchronising booths collection...")
+
+    count = db.floorplans.count_documents({})
+    print(f"Found {count} floorplans to synchronise (batch size {batch_size}).")
+
+    processed = 0
+    changed = 0
+    last_id = None
+    while True:
+        batch_query = {} if last_id is None else {'_id': {'$gt': last_id}}
+        batch = list(db.floorplans.find(batch_query, booths.SYNC_PROJECTION)
+                     .sort('_id', 1)
+                     .limit(batch_size))
+        if not batch:
+            break
+
+        for fp in batch:
+            upserted, _ = booths.sync_floorplan(db, fp['_id'], fp)
+            changed += upserted
+            directory.refresh_floorplan(db, fp['_id'])
+        processed += len(batch)
+        last_id = batch[-1]['_id']
+        print(f"  processed {processed}/{count}...")
+
+    # Booths of floorplans deleted before the collection existed
+    live_ids = db.floorplans.distinct('_id')
+    orphans = db.booths.delete_many({'floorplan_id': {'$nin': live_ids}}).deleted_count
+    db.exhibitors.delete_many({'floorplan_id': {'$nin': live_ids}})
+
+    print(f"Migration completed successfully!")
+    print(f"Wrote {changed} booth documents, removed {orphans} orphaned booths")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the booths collection from floorplans')
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    migrate_booths(batch_size=args.batch_size)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Migration script to backfill denormalized fields on existing floorplans
+Computes the stored `stats` subdocument and the `booth_tokens` / `search_tokens`
+search fields (see FloorPlan.derived_fields) from each floorplan's state. Floorplans are processed in batches by _id so the script
+never holds more than one batch of canvas states in memory.
+
+Usage: python migrate_derived_fields.py [--batch-size N] [--all]
+  --all  recompute every floorplan, not only those missing stats
+"""
+
+import argparse
+from pymongo import UpdateOne
+
+from database import get_db
+from models import FloorPlan
+
+def migrate_derived_fields(batch_size: int = 100, recompute_all: bool = False):
+    db = get_db()
+
+    print("Starting migration: Backfilling derived fields on floorplans...")
+
+    query = {} if recompute_all else {'$or': [
+        {'stats': {'$exists': False}},
+        {'search_tokens': {'$exists': False}}
+    ]}
+    count = db.floorplans.count_documents(query)
+
+    if count == 0:
+        print("No floorplans need migration. All floorplans already have derived fields.")
+        return
+
+    print(f"Found {count} floorplans to update (batch size {batch_size}).")
+
+    processed = 0
+    updated = 0
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query['_id'] = {'$gt': last_id}
+
+        batch = list(db.floorplans.find(batch_query, {'name': 1, 'description': 1,
+                                                      'state.elements': 1, 'version': 1})
+                     .sort('_id', 1)
+                     .limit(batch_size))
+        if not batch:
+            break
+
+        # Guard on version so a concurrent save is never overwritten with stale stats
+        operations = [
+            UpdateOne(
+                {'_id': fp['_id'], 'version': fp.get('version')},
+                {'$set': FloorPlan.derived_fields(fp.get('state'), fp.get('name'), fp.get('description'))}
+            )
+            for fp in batch
+        ]
+        result = db.floorplans.bulk_write(operations, ordered=False)
+        processed += len(batch)
+        updated += result.modified_count
+        last_id = batch[-1]['_id']
+        print(f"  processed {processed}/{count}...")
+
+    print(f"Migration completed successfully!")
+    print(f"Updated {updated} floorplans with derived fields")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill denormalized floorplan fields')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--all', action='store_true', help='recompute every floorplan')
+    args = parser.parse_args()
+    migrate_derived_fields(batch_size=args.batch_size, recompute_all=args.all)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Migration script to strip transient editor state from existing floorplans
+Removes the undo/redo history, selection, active tool, zoom/offset and other
+viewer session keys (FloorPlan.TRANSIENT_STATE_KEYS) from stored states and
+reports the document sizes before and after.
+
+Usage: python migrate_strip_state.py [--batch-size N]
+"""
+
+import argparse
+from pymongo.errors import OperationFailure
+
+from database import get_db
+from models import FloorPlan
+
+def size_report(db) -> dict:
+    """Total, average and largest floorplan document size in bytes"""
+    try:
+        rows = list(db.floorplans.aggregate([
+            {'$project': {'size': {'$bsonSize': '$$ROOT'}}},
+            {'$group': {
+                '_id': None,
+                'count': {'$sum': 1},
+                'total': {'$sum': '$size'},
+                'avg': {'$avg': '$size'},
+                'max': {'$max': '$size'}
+            }}
+        ]))
+    except OperationFailure:
+        # $bsonSize needs MongoDB 4.4+; fall back to collection statistics
+        stats = db.command('collStats', 'floorplans')
+        return {'count': stats.get('count', 0), 'total': stats.get('size', 0),
+                'avg': stats.get('avgObjSize', 0), 'max': None}
+    if not rows:
+        return {'count': 0, 'total': 0, 'avg': 0, 'max': 0}
+    return rows[0]
+
+def print_report(title: str, report: dict):
+    print(f"{title}: {report['count']} documents, "
+          f"total {report['total'] / 1024:,.1f} KB, "
+          f"avg {report['avg'] / 1024:,.1f} KB"
+          + (f", max {report['max'] / 1024:,.1f} KB" if report['max'] is not None else ""))
+
+def migrate_strip_state(batch_size: int = 500):
+    db = get_db()
+
+    print("Starting migration: Stripping transient editor state from floorplans...")
+
+    transient_paths = [f'state.{key}' for key in FloorPlan.TRANSIENT_STATE_KEYS]
+    query = {'$or': [{path: {'$exists': True}} for path in transient_paths]}
+    count = db.floorplans.count_documents(query)
+
+    if count == 0:
+        print("No floorplans need migration. No stored state contains transient keys.")
+        return
+
+    before = size_report(db)
+    print(f"Found {count} floorplans with transient state (batch size {batch_size}).")
+
+    # The $unset runs server-side; batches of _ids keep each write short
+    unset = {path: '' for path in transient_paths}
+    updated = 0
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query['_id'] = {'$gt': last_id}
+        ids = [fp['_id'] for fp in db.floorplans.find(batch_query, {'_id': 1})
+                                              .sort('_id', 1)
+                                              .limit(batch_size)]
+        if not ids:
+            break
+
+        result = db.floorplans.update_many({'_id': {'$in': ids}}, {'$unset': unset})
+        updated += result.modified_count
+        last_id = ids[-1]
+        print(f"  stripped {updated}/{count}...")
+
+    after = size_report(db)
+
+    print(f"Migration completed successfully!")
+    print(f"Updated {updated} floorplans\n")
+    print_report("Before", before)
+    print_report("After ", after)
+    if before['total']:
+        print(f"Saved {(before['total'] - after['total']) / 1024:,.1f} KB "
+              f"({100 * (1 - after['total'] / before['total']):.1f}%)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Strip transient editor state from floorplans')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    migrate_strip_state(batch_size=args.batch_size)
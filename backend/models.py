@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from bson import ObjectId
-import bcrypt
+
+import passwords
+import search
 
 class User:
     def __init__(self, username: str, email: str, password: str, role: str = 'user'):
@@ -13,11 +15,17 @@ class User:
         self.last_login = None
     
     def _hash_password(self, password: str) -> str:
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        # Runs in the bcrypt pool; raises passwords.PasswordHasherBusy when it is full
+        return passwords.hash_password(password)
     
     def check_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Verify in the bcrypt pool. A hash of another cost than BCRYPT_ROUNDS is
+        replaced on success and `rehashed` is set; the caller stores it."""
+        valid, new_hash = passwords.verify_password(password, self.password_hash)
+        self.rehashed = new_hash is not None
+        if new_hash:
+            self.password_hash = new_hash
+        return valid
     
     def to_dict(self) -> Dict:
         return {
@@ -29,6 +37,21 @@ class User:
         }
 
 class FloorPlan:
+    # Metadata returned by listing queries; the canvas state is never part of a listing
+    LIST_FIELDS = ('name', 'description', 'created', 'last_modified', 'version',
+                   'event_id', 'floor', 'layer', 'user_id', 'status', 'stats')
+    PUBLIC_LIST_FIELDS = tuple(f for f in LIST_FIELDS if f != 'user_id')
+    
+    # Defaults for fields that older documents may not have
+    FIELD_DEFAULTS = {'description': None, 'event_id': None, 'floor': 1, 'layer': 0,
+                      'user_id': None, 'status': 'draft'}
+    
+    # Editor session state that is never persisted. The undo/redo history holds a
+    # full copy of the elements per step and the editor resets it on load anyway.
+    TRANSIENT_STATE_KEYS = ('history', 'selectedIds', 'activeTool', 'zoom', 'offset',
+                            'viewerMode', 'activeBoothId', 'searchTerm', 'categoryFilter',
+                            'miniMapEnabled')
+    
     def __init__(self, name: str, description: str = None, event_id: str = None, 
                  floor: int = 1, layer: int = 0, state: Dict = None, user_id: str = None,
                  status: str = 'draft'):
@@ -36,36 +59,34 @@ class FloorPlan:
         self.description = description
         self.created = datetime.utcnow()
         self.last_modified = datetime.utcnow()
-        self.state = state or self._default_state()
+        self.state = self.normalize_state(state) if state else self._default_state()
         self.version = 1
         self.event_id = event_id
         self.floor = floor
         self.layer = layer
         self.user_id = user_id  # Track who created the floor plan
         self.status = status  # Status: 'draft', 'active', 'published', 'archived'
+        self.stats = FloorPlanStats.calculate_booth_stats({'state': self.state})
     
     def _default_state(self) -> Dict:
         return {
             'elements': [],
-            'selectedIds': [],
-            'activeTool': 'select',
-            'history': {
-                'past': [],
-                'future': []
-            },
             'grid': {
                 'enabled': True,
                 'size': 20,
                 'snap': True,
                 'opacity': 0.3
             },
-            'zoom': 1,
-            'offset': {'x': 0, 'y': 0},
-            'canvasSize': {'width': 1200, 'height': 800},
-            'viewerMode': 'editor',
-            'miniMapEnabled': False
+            'canvasSize': {'width': 1200, 'height': 800}
         }
     
+    @classmethod
+    def normalize_state(cls, state: Dict) -> Dict:
+        """Keep only the durable parts of a client CanvasState"""
+        if not isinstance(state, dict):
+            return state
+        return {key: value for key, value in state.items() if key not in cls.TRANSIENT_STATE_KEYS}
+    
     def to_dict(self) -> Dict:
         return {
             'name': self.name,
@@ -78,72 +99,166 @@ class FloorPlan:
             'floor': self.floor,
             'layer': self.layer,
             'user_id': self.user_id,
-            'status': self.status
+            'status': self.status,
+            'stats': self.stats
         }
     
     def update_state(self, new_state: Dict):
-        self.state = new_state
+        self.state = self.normalize_state(new_state)
+        self.stats = FloorPlanStats.calculate_booth_stats({'state': self.state})
         self.last_modified = datetime.utcnow()
         self.version += 1
+    
+    @classmethod
+    def list_projection(cls, fields=None) -> Dict:
+        """Inclusion projection for listing queries (only `fields`, or all list fields)"""
+        return {field: 1 for field in (fields or cls.LIST_FIELDS)}
+    
+    @classmethod
+    def summarize(cls, floor_plan_data: Dict, fields=None) -> Dict:
+        """Serialize a projected floor plan document for a listing response"""
+        summary = {'id': str(floor_plan_data['_id'])}
+        for field in (fields or cls.LIST_FIELDS):
+            if field == 'stats':
+                summary['stats'] = FloorPlanStats.get_stats(floor_plan_data)
+            else:
+                summary[field] = floor_plan_data.get(field, cls.FIELD_DEFAULTS.get(field))
+        return summary
+    
+    @staticmethod
+    def public_detail(floorplan: Dict) -> Dict:
+        """Serialize a published floor plan for the public detail response"""
+        return {
+            'id': str(floorplan['_id']),
+            'name': floorplan['name'],
+            'description': floorplan.get('description'),
+            'created': floorplan['created'],
+            'last_modified': floorplan['last_modified'],
+            'state': floorplan['state'],
+            'version': floorplan['version'],
+            'event_id': floorplan.get('event_id'),
+            'floor': floorplan.get('floor', 1),
+            'layer': floorplan.get('layer', 0),
+            'status': floorplan.get('status', 'draft'),
+            'booth_details': FloorPlanStats.get_booth_details(floorplan),
+            'stats': FloorPlanStats.get_stats(floorplan)
+        }
+    
+    @staticmethod
+    def derived_fields(state: Dict, name: str = None, description: str = None) -> Dict:
+        """Denormalized fields stored alongside the state and recomputed on every state write"""
+        state = state or {}
+        booth_tokens = search.booth_tokens(state.get('elements', []))
+        return {
+            'stats': FloorPlanStats.calculate_booth_stats({'state': state}),
+            'booth_tokens': booth_tokens,
+            'search_tokens': search.plan_tokens(name, description, booth_tokens)
+        }
+    
+    @staticmethod
+    def search_fields(floor_plan_data: Dict, name: str, description: str) -> Dict:
+        """Recompute search_tokens after a name/description change without a new state"""
+        booth_tokens = floor_plan_data.get('booth_tokens')
+        if booth_tokens is None:
+            booth_tokens = search.booth_tokens((floor_plan_data.get('state') or {}).get('elements', []))
+        return {
+            'booth_tokens': booth_tokens,
+            'search_tokens': search.plan_tokens(name, description, booth_tokens)
+        }
 
 class FloorPlanStats:
     """Helper class to calculate statistics from floor plan data"""
     
     @staticmethod
-    def calculate_booth_stats(floor_plan_data: Dict) -> Dict:
-        elements = floor_plan_data.get('state', {}).get('elements', [])
-        booths = [elem for elem in elements if elem.get('type') == 'booth']
-        
-        stats = {
-            'total_booths': len(booths),
+    def empty_stats() -> Dict:
+        return {
+            'total_booths': 0,
             'available': 0,
             'reserved': 0,
             'sold': 0,
             'on_hold': 0,
-            'total_revenue': 0
+            'total_revenue': 0,
+            'reserved_revenue': 0,
+            'sold_revenue': 0
         }
+    
+    @staticmethod
+    def calculate_booth_stats(floor_plan_data: Dict) -> Dict:
+        elements = (floor_plan_data.get('state') or {}).get('elements', [])
+        booths = [elem for elem in elements if elem.get('type') == 'booth']
+        
+        stats = FloorPlanStats.empty_stats()
+        stats['total_booths'] = len(booths)
         
         for booth in booths:
-            status = booth.get('status', 'available')
-            stats[status] += 1
+            # The editor stores 'on-hold', the stats keys use 'on_hold'
+            status = (booth.get('status') or 'available').replace('-', '_')
+            if status in stats:
+                stats[status] += 1
             
             # Add revenue calculation
-            price = booth.get('price', 0)
+            price = booth.get('price') or 0
             if status in ['reserved', 'sold']:
                 stats['total_revenue'] += price
+                stats[f'{status}_revenue'] += price
         
         return stats
     
     @staticmethod
-    def get_booth_details(floor_plan_data: Dict) -> List[Dict]:
-        elements = floor_plan_data.get('state', {}).get('elements', [])
-        booths = [elem for elem in elements if elem.get('type') == 'booth']
+    def totals_group_stage() -> Dict:
+        """$group stage summing the stored stats of every matched floor plan"""
+        group = {'_id': None, 'floorplan_count': {'$sum': 1}}
+        for key in FloorPlanStats.empty_stats():
+            group[key] = {'$sum': {'$ifNull': [f'$stats.{key}', 0]}}
+        return {'$group': group}
+    
+    @staticmethod
+    def totals_from_rows(rows: List[Dict]) -> Dict:
+        """Unpack the single-row result of totals_group_stage (no rows when nothing matched)"""
+        totals = {'floorplan_count': 0, **FloorPlanStats.empty_stats()}
+        if rows:
+            totals.update({k: v for k, v in rows[0].items() if k != '_id'})
+        return totals
+    
+    @staticmethod
+    def get_stats(floor_plan_data: Dict) -> Dict:
+        """Return the stored stats of a floor plan, computing them from the state if absent"""
+        stats = floor_plan_data.get('stats')
+        if stats is None:
+            return FloorPlanStats.calculate_booth_stats(floor_plan_data)
+        return {**FloorPlanStats.empty_stats(), **stats}
+    
+    @staticmethod
+    def booth_detail(booth: Dict) -> Dict:
+        """API representation of a single booth element"""
+        booth_info = {
+            'id': booth.get('id'),
+            'number': booth.get('number', 'N/A'),
+            'status': booth.get('status', 'available'),
+            'price': booth.get('price', 0),
+            'dimensions': booth.get('dimensions', {}),
+            'position': {
+                'x': booth.get('x', 0),
+                'y': booth.get('y', 0),
+                'width': booth.get('width', 0),
+                'height': booth.get('height', 0)
+            }
+        }
         
-        booth_details = []
-        for booth in booths:
-            booth_info = {
-                'id': booth.get('id'),
-                'number': booth.get('number', 'N/A'),
-                'status': booth.get('status', 'available'),
-                'price': booth.get('price', 0),
-                'dimensions': booth.get('dimensions', {}),
-                'position': {
-                    'x': booth.get('x', 0),
-                    'y': booth.get('y', 0),
-                    'width': booth.get('width', 0),
-                    'height': booth.get('height', 0)
-                }
+        # Add exhibitor info if available
+        exhibitor = booth.get('exhibitor', {})
+        if exhibitor:
+            booth_info['exhibitor'] = {
+                'company_name': exhibitor.get('companyName', ''),
+                'category': exhibitor.get('category', ''),
+                'contact': exhibitor.get('contact', {}),
+                'logo': exhibitor.get('logo'),
+                'description': exhibitor.get('description')
             }
-            
-            # Add exhibitor info if available
-            exhibitor = booth.get('exhibitor', {})
-            if exhibitor:
-                booth_info['exhibitor'] = {
-                    'company_name': exhibitor.get('companyName', ''),
-                    'category': exhibitor.get('category', ''),
-                    'contact': exhibitor.get('contact', {})
-                }
-            
-            booth_details.append(booth_info)
         
-        return booth_details
\ No newline at end of file
+        return booth_info
+    
+    @staticmethod
+    def get_booth_details(floor_plan_data: Dict) -> List[Dict]:
+        elements = floor_plan_data.get('state', {}).get('elements', [])
+        return [FloorPlanStats.booth_detail(elem) for elem in elements if elem.get('type') == 'booth']
@@ -0,0 +1,186 @@
+"""
+Pagination helpers shared by the listing endpoints.
+
+Two modes are supported:
+
+* page mode (``page`` / ``limit``), the original contract, using skip/limit;
+* cursor mode, selected by passing ``after`` (empty for the first page). The
+  cursor is an opaque token holding the sort key values of the last row, and
+  the next page is fetched with a keyset filter instead of a skip, so every
+  page costs the same regardless of depth.
+
+Totals are controlled with ``count=exact|estimated|none``. Page mode defaults
+to ``exact`` for compatibility, cursor mode to ``none``.
+"""
+
+import base64
+from typing import Dict, List, Tuple
+from bson import json_util
+
+from config import Config
+
+# Default listing order: newest first, _id breaks ties so the order is total
+DEFAULT_SORT = [('last_modified', -1), ('_id', -1)]
+
+COUNT_MODES = ('exact', 'estimated', 'none')
+
+def encode_cursor(values: List) -> str:
+    """Encode the sort key values of a row into an opaque URL-safe token"""
+    raw = json_util.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token: str) -> List:
+    """Decode a token produced by encode_cursor; raises ValueError if malformed"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid pagination cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid pagination cursor')
+    return values
+
+def _get_path(doc: Dict, path: str):
+    for part in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+def cursor_for(doc: Dict, sort: List[Tuple[str, int]]) -> str:
+    return encode_cursor([_get_path(doc, field) for field, _ in sort])
+
+def keyset_filter(sort: List[Tuple[str, int]], values: List) -> Dict:
+    """Filter matching rows strictly after `values` in `sort` order.
+
+    For sort [(a, -1), (b, -1)] and values [x, y] this builds
+    {'$or': [{a: {'$lt': x}}, {a: x, b: {'$lt': y}}]}.
+    """
+    if len(values) != len(sort):
+        raise ValueError('Invalid pagination cursor')
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: values[j] for j, (f, _) in enumerate(sort[:i])}
+        clause[field] = {'$lt' if direction < 0 else '$gt': values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+def parse_limit(args, default: int = 10) -> int:
+    limit = int(args.get('limit', default))
+    return max(1, min(limit, Config.PAGINATION_MAX_LIMIT))
+
+def count_total(collection, query: Dict, mode: str):
+    """Return (total, estimated) for the requested count mode"""
+    if mode == 'none':
+        return None, False
+    if mode == 'estimated':
+        if not query:
+            return collection.estimated_document_count(), True
+        # Bounded count: stops scanning once the cap is reached
+        return collection.count_documents(query, limit=Config.PAGINATION_COUNT_CAP), True
+    return collection.count_documents(query), False
+
+async def count_total_async(collection, query: Dict, mode: str):
+    """count_total() for a Motor collection"""
+    if mode == 'none':
+        return None, False
+    if mode == 'estimated':
+        if not query:
+            return await collection.estimated_document_count(), True
+        return await collection.count_documents(query, limit=Config.PAGINATION_COUNT_CAP), True
+    return await collection.count_documents(query), False
+
+def _plan(projection: Dict, args, sort, default_limit: int, score: Dict) -> Dict:
+    """Parse the page or cursor parameters into what the listing query needs"""
+    sort = list(sort or DEFAULT_SORT)
+    if score is not None:
+        sort = [('_score', -1)] + sort
+    limit = parse_limit(args, default_limit)
+    if projection and all(projection.values()):
+        # Inclusion projections must carry the sort keys to build the next cursor
+        projection = {**projection, **{field: 1 for field, _ in sort}}
+    cursor_mode = 'after' in args
+    count_mode = args.get('count', 'none' if cursor_mode else 'exact')
+    if count_mode not in COUNT_MODES:
+        raise ValueError(f"Invalid count mode. Must be one of: {', '.join(COUNT_MODES)}")
+
+    plan = {'sort': sort, 'limit': limit, 'projection': projection,
+            'cursor_mode': cursor_mode, 'count_mode': count_mode, 'after_filter': None}
+    if cursor_mode:
+        after = args.get('after')
+        if after:
+            plan['after_filter'] = keyset_filter(sort, decode_cursor(after))
+        # Fetch one extra row to learn whether another page exists
+        plan.update(skip=0, fetch=limit + 1)
+    else:
+        plan['page'] = max(1, int(args.get('page', 1)))
+        plan.update(skip=(plan['page'] - 1) * limit, fetch=limit)
+    return plan
+
+def _ranked_pipeline(query: Dict, plan: Dict, score: Dict) -> List[Dict]:
+    """Aggregation equivalent of find() that sorts on a computed `_score` first"""
+    pipeline = [{'$match': query}, {'$addFields': {'_score': score}}]
+    if plan['after_filter']:
+        pipeline.append({'$match': plan['after_filter']})
+    pipeline.append({'$sort': dict(plan['sort'])})
+    if plan['skip']:
+        pipeline.append({'$skip': plan['skip']})
+    pipeline.append({'$limit': plan['fetch']})
+    if plan['projection']:
+        pipeline.append({'$project': plan['projection']})
+    return pipeline
+
+def _cursor(collection, query: Dict, plan: Dict, score: Dict):
+    """Cursor over the rows of the page (pymongo or Motor, the calls are the same)"""
+    if score is not None:
+        return collection.aggregate(_ranked_pipeline(query, plan, score))
+    page_query = query
+    if plan['after_filter']:
+        page_query = {'$and': [query, plan['after_filter']]} if query else plan['after_filter']
+    cursor = collection.find(page_query, plan['projection']).sort(plan['sort'])
+    if plan['skip']:
+        cursor = cursor.skip(plan['skip'])
+    return cursor.limit(plan['fetch'])
+
+def _page(docs: List[Dict], plan: Dict, total, estimated: bool):
+    limit = plan['limit']
+    if plan['cursor_mode']:
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        pagination = {
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': cursor_for(docs[-1], plan['sort']) if has_more else None
+        }
+    else:
+        pagination = {'page': plan['page'], 'limit': limit}
+
+    if total is not None:
+        pagination['total'] = total
+        pagination['pages'] = (total + limit - 1) // limit
+        if estimated:
+            pagination['total_estimated'] = True
+    return docs, pagination
+
+def paginate(collection, query: Dict, projection: Dict, args, sort=None, default_limit: int = 10,
+             score: Dict = None):
+    """Run a listing query in page or cursor mode.
+
+    When `score` (an aggregation expression) is given, rows are ranked by it
+    before the regular sort order, e.g. for search relevance.
+
+    Returns (documents, pagination) where pagination is the dict sent back
+    to the client. Raises ValueError for malformed parameters.
+    """
+    plan = _plan(projection, args, sort, default_limit, score)
+    docs = list(_cursor(collection, query, plan, score))
+    total, estimated = count_total(collection, query, plan['count_mode'])
+    return _page(docs, plan, total, estimated)
+
+async def paginate_async(collection, query: Dict, projection: Dict, args, sort=None,
+                         default_limit: int = 10, score: Dict = None):
+    """paginate() for a Motor collection (see asgi.py)"""
+    plan = _plan(projection, args, sort, default_limit, score)
+    docs = await _cursor(collection, query, plan, score).to_list(length=None)
+    total, estimated = await count_total_async(collection, query, plan['count_mode'])
+    return _page(docs, plan, total, estimated)
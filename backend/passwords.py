@@ -0,0 +1,159 @@
+"""
+Password hashing and verification off the request threads.
+
+bcrypt is deliberately slow (about 250 ms at cost 12), so a burst of logins
+run inline would occupy every request thread and CPU core of a worker. Here
+each operation runs in a pool of BCRYPT_PROCESSES processes per server
+worker, niced by BCRYPT_NICE so that request threads win the CPU from them.
+This bounds the CPU that logins can take. At most
+BCRYPT_MAX_PENDING operations may be queued or running. Beyond that, callers
+get PasswordHasherBusy at once, and the routes answer 503 with Retry-After
+instead of letting the queue grow.
+
+New hashes use BCRYPT_ROUNDS. A stored hash with another cost is re-hashed
+on the next successful login (see verify_password).
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+import bcrypt
+
+from config import Config
+
+class PasswordHasherBusy(Exception):
+    """Too many password operations are queued; retry later"""
+
+# Forking a threaded server worker is unsafe; children come from a clean server process
+_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_count_lock = threading.Lock()
+_pending = 0
+_stats = {'completed': 0, 'shed': 0, 'timeouts': 0, 'rehashed': 0, 'broken': 0}
+
+# Run in the pool processes
+
+def _init_process(nice: int):
+    if nice:
+        os.nice(nice)
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _verify(password: bytes, password_hash: bytes, rounds: int) -> Tuple[bool, Optional[bytes]]:
+    """(valid, new hash when the stored cost differs from `rounds`)"""
+    if not bcrypt.checkpw(password, password_hash):
+        return False, None
+    if cost(password_hash) != rounds:
+        return True, bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return True, None
+
+def _noop():
+    return None
+
+# Pool
+
+def cost(password_hash: bytes) -> int:
+    """Cost factor of a bcrypt hash ($2b$<cost>$...)"""
+    return int(password_hash.split(b'$')[2])
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ProcessPoolExecutor(max_workers=Config.BCRYPT_PROCESSES, mp_context=_CONTEXT,
+                                                initializer=_init_process, initargs=(Config.BCRYPT_NICE,))
+                _executor_pid = pid
+    return _executor
+
+def _done(_future):
+    global _pending
+    with _count_lock:
+        _pending -= 1
+        _stats['completed'] += 1
+
+def _run(fn, *args):
+    """Run `fn` in the pool and wait for it; raises PasswordHasherBusy when the queue is full"""
+    global _pending
+    with _count_lock:
+        if _pending >= Config.BCRYPT_MAX_PENDING:
+            _stats['shed'] += 1
+            raise PasswordHasherBusy()
+        _pending += 1
+    pool = _pool()
+    try:
+        future = pool.submit(fn, *args)
+    except BaseException as e:
+        with _count_lock:
+            _pending -= 1
+        if isinstance(e, BrokenProcessPool):
+            _discard(pool)
+            raise PasswordHasherBusy() from e
+        raise
+    future.add_done_callback(_done)
+    try:
+        return future.result(timeout=Config.BCRYPT_TIMEOUT)
+    except FuturesTimeout:
+        with _count_lock:
+            _stats['timeouts'] += 1
+        raise PasswordHasherBusy()
+    except BrokenProcessPool as e:
+        _discard(pool)
+        raise PasswordHasherBusy() from e
+
+def _discard(pool: ProcessPoolExecutor):
+    """A pool process died (e.g. killed for memory): the next call starts a fresh pool.
+    Callers get PasswordHasherBusy and retry like after any other overload."""
+    global _executor
+    with _lock:
+        if _executor is pool:
+            _executor = None
+            with _count_lock:
+                _stats['broken'] += 1
+
+def prestart():
+    """Start the pool processes now rather than on the first login"""
+    pool = _pool()
+    for future in [pool.submit(_noop) for _ in range(Config.BCRYPT_PROCESSES)]:
+        future.result()
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password.encode('utf-8'), Config.BCRYPT_ROUNDS).decode('utf-8')
+
+def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """(valid, replacement hash or None). The replacement uses BCRYPT_ROUNDS; store it."""
+    valid, new_hash = _run(_verify, password.encode('utf-8'), password_hash.encode('utf-8'),
+                           Config.BCRYPT_ROUNDS)
+    if new_hash is None:
+        return valid, None
+    with _count_lock:
+        _stats['rehashed'] += 1
+    return valid, new_hash.decode('utf-8')
+
+def stats() -> Dict:
+    with _count_lock:
+        return {'rounds': Config.BCRYPT_ROUNDS, 'processes': Config.BCRYPT_PROCESSES,
+                'pending': _pending, 'max_pending': Config.BCRYPT_MAX_PENDING, **_stats}
+
+def _reset_after_fork():
+    # The pool's processes and threads belong to the parent
+    global _executor, _executor_pid, _lock, _count_lock, _pending, _stats
+    _executor = None
+    _executor_pid = None
+    _lock = threading.Lock()
+    _count_lock = threading.Lock()
+    _pending = 0
+    _stats = {'completed': 0, 'shed': 0, 'timeouts': 0, 'rehashed': 0, 'broken': 0}
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
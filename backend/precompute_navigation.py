@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Precompute entrance-to-booth routes of published floor plans
+Builds the entrance field (see wayfinding.py) of every published plan whose
+stored field is missing or older than the plan, and prints its storage cost.
+Publishing a plan does this in the background; use this script to backfill
+plans published earlier or after a lost job.
+
+Usage: python precompute_navigation.py [--all]
+"""
+
+import argparse
+
+from database import get_db
+import wayfinding
+
+def precompute_navigation(rebuild_all: bool = False):
+    db = get_db()
+
+    stored = {d['_id']: d['version'] for d in db.navfields.find({}, {'version': 1})}
+    plans = list(db.floorplans.find({'status': 'published'}, {'name': 1, 'version': 1}))
+    print(f"Found {len(plans)} published floorplans.")
+
+    raw_total = stored_total = built = 0
+    for fp in plans:
+        if not rebuild_all and stored.get(fp['_id']) == fp.get('version'):
+            continue
+        summary = wayfinding.precompute_entrances(db, fp['_id'])
+        if not summary:
+            continue
+        built += 1
+        raw_total += summary['raw_bytes']
+        stored_total += summary['stored_bytes']
+        print(f"  {fp['name']}: {summary['cols']}x{summary['rows']} cells, "
+              f"{len(summary['doors'])} doors, {summary['raw_bytes'] / 1024:.1f} KB raw, "
+              f"{summary['stored_bytes'] / 1024:.1f} KB stored, {summary['build_ms']} ms")
+
+    # Fields of plans that were deleted or unpublished
+    live_ids = [fp['_id'] for fp in plans]
+    removed = db.navfields.delete_many({'_id': {'$nin': live_ids}}).deleted_count
+
+    print(f"Built {built} entrance fields ({raw_total / 1024:.1f} KB raw, "
+          f"{stored_total / 1024:.1f} KB stored), removed {removed} stale ones")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute entrance routes of published floor plans')
+    parser.add_argument('--all', action='store_true', help='rebuild fields that are up to date too')
+    args = parser.parse_args()
+    precompute_navigation(rebuild_all=args.all)
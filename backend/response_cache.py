@@ -0,0 +1,191 @@
+"""
+Cache of serialized public API responses.
+
+Entries are ready-to-send JSON bodies together with their validators:
+
+* plan detail entries are keyed by plan id and version, so a new version can
+  never be served from an old entry;
+* list entries are keyed by the query parameters and a generation number,
+  which every floor plan write bumps.
+
+The default backend is a bounded in-process LRU. For multi-worker deployments
+set RESPONSE_CACHE_BACKEND=redis so that all workers share entries and see
+invalidations. A cache failure is treated as a miss and never fails a request.
+"""
+
+import hashlib
+import json
+import threading
+from datetime import datetime
+from flask import current_app, request
+
+from cache import TTLCache
+from config import Config
+from http_cache import apply_cache_headers
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for the shared backend
+    redis = None
+
+class LocalBackend:
+    name = 'local'
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, entry):
+        self._entries.set(key, entry)
+
+    def delete_prefix(self, prefix):
+        self._entries.discard_prefix(prefix)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+
+    def size(self) -> int:
+        return len(self._entries)
+
+class RedisBackend:
+    name = 'redis'
+    GENERATION_KEY = 'public:generation'
+
+    def __init__(self, url: str, ttl: float):
+        if redis is None:
+            raise RuntimeError('RESPONSE_CACHE_BACKEND=redis requires the redis package')
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = int(ttl)
+
+    def get(self, key):
+        raw = self._redis.get(key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        entry['body'] = entry['body'].encode('utf-8')
+        if entry.get('last_modified'):
+            entry['last_modified'] = datetime.fromisoformat(entry['last_modified'])
+        return entry
+
+    def set(self, key, entry):
+        payload = dict(entry)
+        payload['body'] = entry['body'].decode('utf-8')
+        if entry.get('last_modified'):
+            payload['last_modified'] = entry['last_modified'].isoformat()
+        self._redis.set(key, json.dumps(payload), ex=self._ttl or None)
+
+    def delete_prefix(self, prefix):
+        keys = list(self._redis.scan_iter(match=prefix + '*', count=500))
+        if keys:
+            self._redis.delete(*keys)
+
+    def generation(self) -> int:
+        return int(self._redis.get(self.GENERATION_KEY) or 0)
+
+    def bump_generation(self):
+        self._redis.incr(self.GENERATION_KEY)
+
+    def size(self) -> int:
+        return self._redis.dbsize()
+
+class ResponseCache:
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    if Config.RESPONSE_CACHE_BACKEND == 'redis':
+                        self._backend = RedisBackend(Config.REDIS_URL, Config.RESPONSE_CACHE_TTL)
+                    else:
+                        self._backend = LocalBackend(Config.RESPONSE_CACHE_SIZE,
+                                                     Config.RESPONSE_CACHE_TTL)
+        return self._backend
+
+    # Keys
+
+    @staticmethod
+    def detail_key(floorplan_id, version) -> str:
+        return f"public:fp:{floorplan_id}:v{version}"
+
+    def list_key(self, args) -> str:
+        """Key of a list response: the endpoint path plus its query parameters"""
+        params = '&'.join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+        digest = hashlib.sha1(f"{request.path}?{params}".encode('utf-8')).hexdigest()
+        return f"public:list:g{self._safe(self.backend.generation, 0)}:{digest}"
+
+    # Entries
+
+    def get(self, key):
+        if not Config.RESPONSE_CACHE_ENABLED:
+            return None
+        entry = self._safe(self.backend.get, None, key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key, payload, etag: str = None, last_modified=None) -> dict:
+        """Serialize `payload` once and cache the bytes; returns the entry"""
+        entry = {
+            'body': current_app.json.dumps(payload).encode('utf-8'),
+            'etag': etag,
+            'last_modified': last_modified
+        }
+        if Config.RESPONSE_CACHE_ENABLED:
+            self._safe(self.backend.set, None, key, entry)
+        return entry
+
+    @staticmethod
+    def to_response(entry, public: bool = True):
+        response = current_app.response_class(entry['body'], status=200,
+                                              mimetype='application/json')
+        if entry.get('etag'):
+            apply_cache_headers(response, entry['etag'], entry.get('last_modified'), public=public)
+        elif public:
+            response.cache_control.public = True
+            response.cache_control.max_age = Config.PUBLIC_CACHE_MAX_AGE
+        return response
+
+    def invalidate(self, floorplan_id=None):
+        """Called by every floor plan write: drops lists and the plan's detail entries"""
+        self._safe(self.backend.bump_generation, None)
+        if floorplan_id is not None:
+            self._safe(self.backend.delete_prefix, None, f"public:fp:{floorplan_id}:")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend.name,
+            'enabled': Config.RESPONSE_CACHE_ENABLED,
+            'entries': self._safe(self.backend.size, None),
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+        }
+
+    def _safe(self, fn, default, *args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            self.errors += 1
+            current_app.logger.warning(f"Response cache error: {e}")
+            return default
+
+public_cache = ResponseCache()
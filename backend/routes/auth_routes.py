@@ -1,17 +1,20 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from pymongo import MongoClient
 from bson import ObjectId
 from datetime import datetime
-import os
+from database import get_db
 from models import User
+from auth import user_claims, invalidate_user
+from config import Config
+from passwords import PasswordHasherBusy
 
 auth_bp = Blueprint('auth', __name__)
 
-# Get MongoDB connection
-def get_db():
-    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/imtma_flooring'))
-    return client.get_default_database()
+def busy_response():
+    """503 while the bcrypt pool is saturated, instead of queueing more logins"""
+    response = jsonify({'message': 'Too many sign-in attempts in progress, try again shortly'})
+    response.headers['Retry-After'] = str(Config.BCRYPT_RETRY_AFTER)
+    return response, 503
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -46,7 +49,8 @@ def register():
         })
         
         # Create access token
-        access_token = create_access_token(identity=str(result.inserted_id))
+        access_token = create_access_token(identity=str(result.inserted_id),
+                                           additional_claims=user_claims({'role': user.role}))
         
         return jsonify({
             'message': 'User created successfully',
@@ -54,6 +58,8 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except PasswordHasherBusy:
+        return busy_response()
     except Exception as e:
         return jsonify({'message': 'Registration failed', 'error': str(e)}), 500
 
@@ -85,14 +91,19 @@ def login():
         if not user.check_password(data['password']):
             return jsonify({'message': 'Invalid credentials'}), 401
         
-        # Update last login
+        # Update last login, and store the hash if it was re-hashed at the configured cost
+        changes = {'last_login': datetime.utcnow()}
+        if user.rehashed:
+            changes['password_hash'] = user.password_hash
         db.users.update_one(
             {'_id': user_doc['_id']},
-            {'$set': {'last_login': datetime.utcnow()}}
+            {'$set': changes}
         )
+        invalidate_user(user_doc['_id'])
         
-        # Create access token
-        access_token = create_access_token(identity=str(user_doc['_id']))
+        # Create access token; the role travels as a signed claim
+        access_token = create_access_token(identity=str(user_doc['_id']),
+                                           additional_claims=user_claims(user_doc))
         
         # Prepare user data (without sensitive info)
         user_data = {
@@ -109,6 +120,8 @@ def login():
             'user': user_data
         }), 200
         
+    except PasswordHasherBusy:
+        return busy_response()
     except Exception as e:
         return jsonify({'message': 'Login failed', 'error': str(e)}), 500
 
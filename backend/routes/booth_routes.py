@@ -0,0 +1,64 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import get_jwt_identity
+from datetime import datetime
+from database import get_db
+from pagination import paginate
+import booths
+from auth import login_required, get_current_role
+
+booth_bp = Blueprint('booth', __name__)
+
+def scoped_query(args):
+    """Booth filter for the caller: admins see every plan, users only their own"""
+    user_id = None if get_current_role() == 'admin' else get_jwt_identity()
+    return booths.build_query(args, user_id=user_id)
+
+@booth_bp.route('/booths', methods=['GET'])
+@login_required
+def get_booths():
+    """Booth inventory across floor plans, filtered and paginated in MongoDB"""
+    try:
+        db = get_db()
+
+        try:
+            query = scoped_query(request.args)
+            sort = booths.parse_sort(request.args.get('sort'))
+            docs, pagination = paginate(db.booths, query, booths.DETAIL_PROJECTION, request.args,
+                                        sort=sort, default_limit=50)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        response = {
+            'booths': [booths.to_detail(b) for b in docs],
+            'pagination': pagination
+        }
+
+        # Status counts and revenue for the whole filtered set, on request
+        if request.args.get('stats', '').lower() in ('true', '1', 'yes'):
+            response['stats'] = booths.stats_from_rows(db.booths.aggregate(booths.stats_pipeline(query)))
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        return jsonify({'message': 'Failed to get booths', 'error': str(e)}), 500
+
+@booth_bp.route('/booths/export.csv', methods=['GET'])
+@login_required
+def export_booths():
+    """Stream the filtered booth inventory as CSV without building it in memory"""
+    try:
+        db = get_db()
+
+        try:
+            query = scoped_query(request.args)
+            sort = booths.parse_sort(request.args.get('sort'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        cursor = db.booths.find(query, booths.DETAIL_PROJECTION).sort(sort).batch_size(1000)
+        filename = f"booths-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.csv"
+        return Response(stream_with_context(booths.stream_csv(cursor)), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+    except Exception as e:
+        return jsonify({'message': 'Failed to export booths', 'error': str(e)}), 500
@@ -1,18 +1,18 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from pymongo import MongoClient
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, session,
+                   Response, stream_with_context, jsonify)
 from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
-import os
-from models import FloorPlanStats
+from database import get_db
+from models import FloorPlan, FloorPlanStats
 from auth import get_current_user
+from pagination import paginate
+import search as plan_search
+import booths
+import thumbnails
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
-# Get MongoDB connection
-def get_db():
-    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/imtma_flooring'))
-    return client.get_default_database()
-
 @dashboard_bp.route('/')
 def dashboard_home():
     """Main dashboard overview"""
@@ -28,33 +28,23 @@ def dashboard_home():
         if current_user.get('role') != 'admin':
             query['user_id'] = current_user['_id']
         
-        total_floorplans = db.floorplans.count_documents(query)
+        # Plan count and booth totals are summed inside MongoDB from the stored per-plan stats
+        totals = FloorPlanStats.totals_from_rows(list(db.floorplans.aggregate([
+            {'$match': query},
+            FloorPlanStats.totals_group_stage()
+        ])))
+        total_floorplans = totals.pop('floorplan_count')
+        overall_stats = totals
         
         # Get recent floor plans
-        recent_floorplans = list(db.floorplans.find(query)
+        recent_floorplans = list(db.floorplans.find(query, FloorPlan.list_projection())
                                .sort('last_modified', -1)
                                .limit(5))
         
-        # Calculate overall booth statistics
-        all_floorplans = list(db.floorplans.find(query))
-        overall_stats = {
-            'total_booths': 0,
-            'available': 0,
-            'reserved': 0,
-            'sold': 0,
-            'on_hold': 0,
-            'total_revenue': 0
-        }
-        
-        for fp in all_floorplans:
-            stats = FloorPlanStats.calculate_booth_stats(fp)
-            for key in overall_stats:
-                overall_stats[key] += stats.get(key, 0)
-        
         # Process recent floor plans for display
         for fp in recent_floorplans:
             fp['_id'] = str(fp['_id'])
-            fp['stats'] = FloorPlanStats.calculate_booth_stats(fp)
+            fp['stats'] = FloorPlanStats.get_stats(fp)
         
         return render_template('dashboard/home.html',
                              current_user=current_user,
@@ -77,46 +67,35 @@ def floorplans_list():
         db = get_db()
         
         # Get query parameters
-        page = int(request.args.get('page', 1))
-        limit = 10
         search = request.args.get('search', '')
         
-        # Build query
+        # Build query; search terms prefix-match the indexed search_tokens
         query = {}
-        if search:
-            query['$or'] = [
-                {'name': {'$regex': search, '$options': 'i'}},
-                {'description': {'$regex': search, '$options': 'i'}}
-            ]
+        terms = plan_search.parse_terms(search)
+        if terms:
+            query.update(plan_search.prefix_filter(terms))
         
         if current_user.get('role') != 'admin':
             query['user_id'] = current_user['_id']
         
-        # Calculate skip
-        skip = (page - 1) * limit
-        
-        # Get floor plans
-        floorplans = list(db.floorplans.find(query)
-                         .sort('last_modified', -1)
-                         .skip(skip)
-                         .limit(limit))
+        # Get floor plans (page numbers, or keyset cursor when `after` is given)
+        floorplans, pagination = paginate(db.floorplans, query, FloorPlan.list_projection(),
+                                          request.args,
+                                          score=plan_search.score_expression(terms) if terms else None)
         
         # Process floor plans
         for fp in floorplans:
             fp['_id'] = str(fp['_id'])
-            fp['stats'] = FloorPlanStats.calculate_booth_stats(fp)
-        
-        # Get total count for pagination
-        total = db.floorplans.count_documents(query)
-        pages = (total + limit - 1) // limit
+            fp['stats'] = FloorPlanStats.get_stats(fp)
         
         return render_template('dashboard/floorplans.html',
                              current_user=current_user,
                              floorplans=floorplans,
-                             page=page,
-                             pages=pages,
+                             page=pagination.get('page', 1),
+                             pages=pagination.get('pages', 0),
+                             next_cursor=pagination.get('next_cursor'),
                              search=search,
-                             total=total)
+                             total=pagination.get('total'))
     
     except Exception as e:
         flash(f'Error loading floor plans: {str(e)}', 'error')
@@ -146,7 +125,7 @@ def floorplan_detail(floorplan_id):
         
         # Get booth details and statistics
         booth_details = FloorPlanStats.get_booth_details(floorplan)
-        stats = FloorPlanStats.calculate_booth_stats(floorplan)
+        stats = FloorPlanStats.get_stats(floorplan)
         
         # Get creator information
         creator = None
@@ -166,6 +145,32 @@ def floorplan_detail(floorplan_id):
         flash(f'Error loading floor plan: {str(e)}', 'error')
         return render_template('dashboard/error.html', error=str(e))
 
+@dashboard_bp.route('/floorplans/<floorplan_id>/thumbnail')
+def floorplan_thumbnail(floorplan_id):
+    """Preview image of a floor plan for the listing cards"""
+    current_user = get_current_user()
+    if not current_user:
+        return redirect(url_for('dashboard.login'))
+    
+    try:
+        db = get_db()
+        oid = ObjectId(floorplan_id)
+        floorplan = db.floorplans.find_one({'_id': oid}, {'user_id': 1})
+        if not floorplan or (current_user.get('role') != 'admin' and
+                             floorplan.get('user_id') != current_user['_id']):
+            return Response(status=404)
+        
+        doc = thumbnails.ensure_thumbnail(db, oid, request.args.get('v', type=int))
+        if not doc:
+            return Response(status=404)
+        return thumbnails.to_response(doc)
+    
+    except InvalidId:
+        return Response(status=404)
+    except Exception as e:
+        # An <img> request: answer with a status, not the HTML error page
+        return jsonify({'message': 'Failed to get thumbnail', 'error': str(e)}), 500
+
 @dashboard_bp.route('/booths')
 def booths_overview():
     """Overview of all booths across floor plans"""
@@ -176,49 +181,28 @@ def booths_overview():
         
         db = get_db()
         
-        # Build query based on user permissions
-        query = {}
-        if current_user.get('role') != 'admin':
-            query['user_id'] = current_user['_id']
-        
-        # Get all floor plans and extract booth information
-        floorplans = list(db.floorplans.find(query))
-        all_booths = []
-        
-        for fp in floorplans:
-            booth_details = FloorPlanStats.get_booth_details(fp)
-            for booth in booth_details:
-                booth['floorplan_name'] = fp['name']
-                booth['floorplan_id'] = str(fp['_id'])
-                all_booths.append(booth)
-        
-        # Filter booths based on query parameters
+        # Same filters as /api/booths, scoped to the user's plans for non-admins
         status_filter = request.args.get('status')
         search = request.args.get('search', '')
+        user_id = None if current_user.get('role') == 'admin' else current_user['_id']
+        query = booths.build_query(request.args, user_id=user_id)
         
-        if status_filter:
-            all_booths = [b for b in all_booths if b['status'] == status_filter]
-        
-        if search:
-            all_booths = [b for b in all_booths 
-                         if search.lower() in b.get('number', '').lower() or
-                            search.lower() in b.get('exhibitor', {}).get('company_name', '').lower()]
-        
-        # Calculate summary statistics
-        stats = {
-            'total_booths': len(all_booths),
-            'available': len([b for b in all_booths if b['status'] == 'available']),
-            'reserved': len([b for b in all_booths if b['status'] == 'reserved']),
-            'sold': len([b for b in all_booths if b['status'] == 'sold']),
-            'on_hold': len([b for b in all_booths if b['status'] == 'on_hold']),
-            'total_revenue': sum(b.get('price', 0) for b in all_booths 
-                               if b['status'] in ['reserved', 'sold'])
-        }
+        # One page at a time with a keyset cursor, so memory does not grow with the exhibition
+        args = request.args.to_dict()
+        args.setdefault('after', '')
+        docs, pagination = paginate(db.booths, query, booths.DETAIL_PROJECTION, args,
+                                    sort=booths.parse_sort(request.args.get('sort')),
+                                    default_limit=50)
+        page_booths = [booths.to_detail(b) for b in docs]
+        
+        # Calculate summary statistics over the whole filtered set
+        stats = booths.stats_from_rows(db.booths.aggregate(booths.stats_pipeline(query)))
         
         return render_template('dashboard/booths.html',
                              current_user=current_user,
-                             booths=all_booths,
+                             booths=page_booths,
                              stats=stats,
+                             next_cursor=pagination.get('next_cursor'),
                              status_filter=status_filter,
                              search=search)
     
@@ -226,6 +210,24 @@ def booths_overview():
         flash(f'Error loading booths: {str(e)}', 'error')
         return render_template('dashboard/error.html', error=str(e))
 
+@dashboard_bp.route('/booths/export.csv')
+def booths_export():
+    """CSV export of the filtered booths, streamed from a cursor"""
+    current_user = get_current_user()
+    if not current_user:
+        return redirect(url_for('dashboard.login'))
+    
+    db = get_db()
+    user_id = None if current_user.get('role') == 'admin' else current_user['_id']
+    try:
+        query = booths.build_query(request.args, user_id=user_id)
+        sort = booths.parse_sort(request.args.get('sort'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    cursor = db.booths.find(query, booths.DETAIL_PROJECTION).sort(sort).batch_size(1000)
+    return Response(stream_with_context(booths.stream_csv(cursor)), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=booths.csv'})
+
 @dashboard_bp.route('/analytics')
 def analytics():
     """Analytics and reports dashboard"""
@@ -241,44 +243,36 @@ def analytics():
         if current_user.get('role') != 'admin':
             query['user_id'] = current_user['_id']
         
-        # Get all floor plans for analytics
-        floorplans = list(db.floorplans.find(query))
+        # Totals are summed inside MongoDB from the stored per-plan stats
+        totals = FloorPlanStats.totals_from_rows(list(db.floorplans.aggregate([
+            {'$match': query},
+            FloorPlanStats.totals_group_stage()
+        ])))
+        
+        # The per-plan table only needs name, stats and last_modified
+        floorplans = db.floorplans.find(query, {'name': 1, 'stats': 1, 'last_modified': 1}).sort('last_modified', -1)
         
-        # Calculate analytics data
         analytics_data = {
-            'floorplan_count': len(floorplans),
-            'total_booths': 0,
-            'revenue_by_status': {'reserved': 0, 'sold': 0},
-            'booths_by_status': {'available': 0, 'reserved': 0, 'sold': 0, 'on_hold': 0},
-            'floorplan_stats': []
+            'floorplan_count': totals['floorplan_count'],
+            'total_booths': totals['total_booths'],
+            'revenue_by_status': {
+                'reserved': totals['reserved_revenue'],
+                'sold': totals['sold_revenue']
+            },
+            'booths_by_status': {
+                status: totals[status] for status in ('available', 'reserved', 'sold', 'on_hold')
+            },
+            'floorplan_stats': [
+                {
+                    'name': fp['name'],
+                    'id': str(fp['_id']),
+                    'stats': FloorPlanStats.get_stats(fp),
+                    'last_modified': fp['last_modified']
+                }
+                for fp in floorplans
+            ]
         }
         
-        for fp in floorplans:
-            stats = FloorPlanStats.calculate_booth_stats(fp)
-            
-            # Add to totals
-            analytics_data['total_booths'] += stats['total_booths']
-            for status in analytics_data['booths_by_status']:
-                analytics_data['booths_by_status'][status] += stats.get(status, 0)
-            
-            analytics_data['revenue_by_status']['reserved'] += sum(
-                booth.get('price', 0) for booth in FloorPlanStats.get_booth_details(fp)
-                if booth['status'] == 'reserved'
-            )
-            analytics_data['revenue_by_status']['sold'] += sum(
-                booth.get('price', 0) for booth in FloorPlanStats.get_booth_details(fp)
-                if booth['status'] == 'sold'
-            )
-            
-            # Individual floor plan stats
-            fp_stat = {
-                'name': fp['name'],
-                'id': str(fp['_id']),
-                'stats': stats,
-                'last_modified': fp['last_modified']
-            }
-            analytics_data['floorplan_stats'].append(fp_stat)
-        
         return render_template('dashboard/analytics.html',
                              current_user=current_user,
                              analytics=analytics_data)
@@ -1,87 +1,153 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from pymongo import MongoClient
+from flask import Blueprint, request, jsonify, current_app, Response
+from flask_jwt_extended import (jwt_required, get_jwt_identity, verify_jwt_in_request, create_access_token,
+                                decode_token)
 from bson import ObjectId
-from datetime import datetime
-import os
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+from database import get_db
 from models import FloorPlan, FloorPlanStats
-from auth import login_required, admin_required
+from pagination import paginate, parse_limit
+import search as plan_search
+import element_ops
+import booths
+import directory
+import wayfinding
+import jobs
+import spatial
+import tiles
+import thumbnails
+import live
+import collab
+import passwords
+from http_cache import (VALIDATOR_PROJECTION, floorplan_etag, is_conditional, is_not_modified,
+                        not_modified_response, apply_cache_headers, if_match_version)
+from response_cache import public_cache
+from config import Config
+from auth import login_required, admin_required, get_current_role, user_cache_stats
 
 floorplan_bp = Blueprint('floorplan', __name__)
 
-# Get MongoDB connection
-def get_db():
-    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/imtma_flooring'))
-    return client.get_default_database()
+# Stored fields that a plan's search tokens are computed from
+SEARCH_SOURCE_PROJECTION = {'version': 1, 'name': 1, 'description': 1, 'booth_tokens': 1}
+# Reads and guarded writes before an unversioned PUT that changes them gives up
+SEARCH_FIELDS_ATTEMPTS = 5
+
+def parse_fields(raw, allowed):
+    """Parse the `fields=` query parameter into a tuple of allowed field names"""
+    if not raw:
+        return tuple(allowed)
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return fields
+
+def after_write(db, oid, floorplan=None):
+    """Propagate a committed floor plan write to the booths, exhibitor directory and response cache"""
+    try:
+        changed, deleted = booths.sync_floorplan(db, oid, floorplan)
+        if changed or deleted:
+            directory.refresh_floorplan(db, oid)
+    except Exception as e:
+        # The plan write itself succeeded; migrate_booths.py repairs a missed sync
+        current_app.logger.error(f"Booth sync failed for floor plan {oid}: {e}")
+    public_cache.invalidate(str(oid))
+    jobs.submit(('tiles', str(oid)), tiles.purge_stale, str(oid))
+    jobs.submit(('thumbnail', str(oid)), thumbnails.render_job, oid)
+
+def expected_version(data, floorplan_id):
+    """Version the client based its write on: body `version` or an If-Match ETag"""
+    version = data.get('version')
+    if version is None:
+        return if_match_version(floorplan_id)
+    if not isinstance(version, int) or isinstance(version, bool):
+        raise ValueError('version must be an integer')
+    return version
+
+def write_miss_response(db, oid, expected, current_user_id):
+    """Explain why a guarded write matched nothing, using the small validator projection"""
+    meta = db.floorplans.find_one({'_id': oid}, VALIDATOR_PROJECTION)
+    if not meta:
+        return jsonify({'message': 'Floor plan not found'}), 404
+    if get_current_role() != 'admin' and meta.get('user_id') != current_user_id:
+        return jsonify({'message': 'Access denied'}), 403
+    if expected is not None and meta['version'] != expected:
+        return jsonify({'message': 'Floor plan was modified by someone else',
+                        'version': meta['version']}), 409
+    return None
+
+def guarded_query(oid, expected, current_user_id):
+    """Compare-and-set filter: the plan, at the expected version, writable by the caller"""
+    query = {'_id': oid}
+    if expected is not None:
+        query['version'] = expected
+    if get_current_role() != 'admin':
+        query['user_id'] = current_user_id
+    return query
+
+def load_tile_state(db, oid):
+    doc = db.floorplans.find_one({'_id': oid}, tiles.STATE_PROJECTION)
+    return (doc or {}).get('state') or {}
+
+def element_query_response(db, meta, public=False):
+    """Viewport / hit-test response of a plan version, from its cached spatial index"""
+    etag = floorplan_etag(meta['_id'], meta['version'])
+    if is_not_modified(etag, meta['last_modified']):
+        return not_modified_response(etag, meta['last_modified'], public=public)
+    
+    def load_elements():
+        doc = db.floorplans.find_one({'_id': meta['_id']}, spatial.STATE_PROJECTION)
+        return ((doc or {}).get('state') or {}).get('elements') or []
+    index = spatial.get_index(meta['_id'], meta['version'], load_elements)
+    try:
+        body = spatial.query_response(index, request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if body is None:
+        return jsonify({'message': 'bbox=x0,y0,x1,y1 or point=x,y is required'}), 400
+    
+    response = jsonify({**body, 'version': meta['version']})
+    return apply_cache_headers(response, etag, meta['last_modified'], public=public)
 
 @floorplan_bp.route('/floorplans', methods=['GET'])
 @login_required
 def get_floorplans():
     try:
         db = get_db()
-        current_user_id = get_jwt_identity()
         
         # Get query parameters
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 10))
         search = request.args.get('search', '')
         event_id = request.args.get('event_id')
+        try:
+            fields = parse_fields(request.args.get('fields'), FloorPlan.LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
-        # Build query
+        # Build query; search terms prefix-match the indexed search_tokens
         query = {}
-        if search:
-            query['$or'] = [
-                {'name': {'$regex': search, '$options': 'i'}},
-                {'description': {'$regex': search, '$options': 'i'}}
-            ]
+        terms = plan_search.parse_terms(search)
+        if terms:
+            query.update(plan_search.prefix_filter(terms))
         if event_id:
             query['event_id'] = event_id
         
-        # Get user role to determine access
-        user = db.users.find_one({'_id': ObjectId(current_user_id)})
-        if user.get('role') != 'admin':
+        # User role (signed token claim) determines access
+        if get_current_role() != 'admin':
             # Regular users can only see published/active floorplans
             query['status'] = {'$in': ['active', 'published']}
         
-        # Calculate skip
-        skip = (page - 1) * limit
-        
-        # Get floor plans
-        cursor = db.floorplans.find(query).sort('last_modified', -1).skip(skip).limit(limit)
-        floorplans = []
-        
-        for fp in cursor:
-            fp_data = {
-                'id': str(fp['_id']),
-                'name': fp['name'],
-                'description': fp.get('description'),
-                'created': fp['created'],
-                'last_modified': fp['last_modified'],
-                'version': fp['version'],
-                'event_id': fp.get('event_id'),
-                'floor': fp.get('floor', 1),
-                'layer': fp.get('layer', 0),
-                'user_id': fp.get('user_id'),
-                'status': fp.get('status', 'draft')
-            }
-            
-            # Add booth statistics
-            stats = FloorPlanStats.calculate_booth_stats(fp)
-            fp_data['stats'] = stats
-            
-            floorplans.append(fp_data)
-        
-        # Get total count for pagination
-        total = db.floorplans.count_documents(query)
+        # Get floor plans (page/limit, or keyset cursor when `after` is given)
+        try:
+            docs, pagination = paginate(db.floorplans, query,
+                                        FloorPlan.list_projection(fields), request.args,
+                                        score=plan_search.score_expression(terms) if terms else None)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        floorplans = [FloorPlan.summarize(fp, fields) for fp in docs]
         
         return jsonify({
             'floorplans': floorplans,
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total,
-                'pages': (total + limit - 1) // limit
-            }
+            'pagination': pagination
         }), 200
         
     except Exception as e:
@@ -112,7 +178,7 @@ def create_floorplan():
         )
         
         # Insert into database
-        result = db.floorplans.insert_one({
+        doc = {
             'name': floorplan.name,
             'description': floorplan.description,
             'created': floorplan.created,
@@ -123,8 +189,11 @@ def create_floorplan():
             'floor': floorplan.floor,
             'layer': floorplan.layer,
             'user_id': floorplan.user_id,
-            'status': floorplan.status
-        })
+            'status': floorplan.status,
+            **FloorPlan.derived_fields(floorplan.state, floorplan.name, floorplan.description)
+        }
+        result = db.floorplans.insert_one(doc)
+        after_write(db, result.inserted_id, doc)
         
         # Return created floor plan
         fp_data = floorplan.to_dict()
@@ -143,7 +212,18 @@ def create_floorplan():
 def get_floorplan(floorplan_id):
     try:
         db = get_db()
-        current_user_id = get_jwt_identity()
+        is_admin = get_current_role() == 'admin'
+        
+        # Answer conditional requests from the validators alone, without loading the state
+        if is_conditional():
+            meta = db.floorplans.find_one({'_id': ObjectId(floorplan_id)}, VALIDATOR_PROJECTION)
+            if not meta:
+                return jsonify({'message': 'Floor plan not found'}), 404
+            if not is_admin and meta.get('status') not in ['active', 'published']:
+                return jsonify({'message': 'Access denied'}), 403
+            etag = floorplan_etag(meta['_id'], meta['version'])
+            if is_not_modified(etag, meta['last_modified']):
+                return not_modified_response(etag, meta['last_modified'])
         
         # Get floor plan
         floorplan = db.floorplans.find_one({'_id': ObjectId(floorplan_id)})
@@ -151,8 +231,7 @@ def get_floorplan(floorplan_id):
             return jsonify({'message': 'Floor plan not found'}), 404
         
         # Check access permissions
-        user = db.users.find_one({'_id': ObjectId(current_user_id)})
-        if user.get('role') != 'admin':
+        if not is_admin:
             # Regular users can only view published/active floor plans
             if floorplan.get('status') not in ['active', 'published']:
                 return jsonify({'message': 'Access denied'}), 403
@@ -178,10 +257,12 @@ def get_floorplan(floorplan_id):
         fp_data['booth_details'] = booth_details
         
         # Add statistics
-        stats = FloorPlanStats.calculate_booth_stats(floorplan)
-        fp_data['stats'] = stats
+        fp_data['stats'] = FloorPlanStats.get_stats(floorplan)
         
-        return jsonify({'floorplan': fp_data}), 200
+        response = jsonify({'floorplan': fp_data})
+        apply_cache_headers(response, floorplan_etag(floorplan['_id'], floorplan['version']),
+                            floorplan['last_modified'])
+        return response, 200
         
     except Exception as e:
         return jsonify({'message': 'Failed to get floor plan', 'error': str(e)}), 500
@@ -196,29 +277,22 @@ def update_floorplan(floorplan_id):
         
         if not data:
             return jsonify({'message': 'No data provided'}), 400
-        
-        # Get existing floor plan
-        floorplan = db.floorplans.find_one({'_id': ObjectId(floorplan_id)})
-        if not floorplan:
-            return jsonify({'message': 'Floor plan not found'}), 404
-        
-        # Check access permissions
-        user = db.users.find_one({'_id': ObjectId(current_user_id)})
-        if user.get('role') != 'admin' and floorplan.get('user_id') != current_user_id:
-            return jsonify({'message': 'Access denied'}), 403
+        try:
+            expected = expected_version(data, floorplan_id)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
         # Update fields
-        update_data = {
-            'last_modified': datetime.utcnow(),
-            'version': floorplan['version'] + 1
-        }
+        update_data = {'last_modified': datetime.utcnow()}
         
         if 'name' in data:
             update_data['name'] = data['name']
         if 'description' in data:
             update_data['description'] = data['description']
         if 'state' in data:
-            update_data['state'] = data['state']
+            update_data['state'] = FloorPlan.normalize_state(data['state'])
+            update_data.update(FloorPlan.derived_fields(update_data['state'], data.get('name'),
+                                                        data.get('description')))
         if 'event_id' in data:
             update_data['event_id'] = data['event_id']
         if 'floor' in data:
@@ -228,14 +302,39 @@ def update_floorplan(floorplan_id):
         if 'status' in data:
             update_data['status'] = data['status']
         
-        # Update in database
-        db.floorplans.update_one(
-            {'_id': ObjectId(floorplan_id)},
-            {'$set': update_data}
-        )
-        
-        # Get updated floor plan
-        updated_floorplan = db.floorplans.find_one({'_id': ObjectId(floorplan_id)})
+        # Search tokens combine name, description and booth tokens. When the body changes
+        # only some of them, the rest are read and the write is guarded on that read.
+        partial = any(key in data for key in ('name', 'description', 'state')) and \
+            not all(key in data for key in ('name', 'description', 'state'))
+        
+        # Compare-and-set: one round trip that fails if another write got there first
+        oid = ObjectId(floorplan_id)
+        query = guarded_query(oid, expected, current_user_id)
+        changes, updated_floorplan = update_data, None
+        for _ in range(SEARCH_FIELDS_ATTEMPTS):
+            if partial:
+                current = db.floorplans.find_one({'_id': oid}, SEARCH_SOURCE_PROJECTION)
+                if current and 'state' not in data and current.get('booth_tokens') is None:
+                    current = db.floorplans.find_one({'_id': oid}, element_ops.SOURCE_PROJECTION)
+                if not current:
+                    break
+                merged = {**current, **update_data}
+                changes = {**update_data,
+                           **FloorPlan.search_fields(merged, merged.get('name'), merged.get('description'))}
+                if expected is None:
+                    query['version'] = current['version']
+            updated_floorplan = db.floorplans.find_one_and_update(
+                query,
+                {'$set': changes, '$inc': {'version': 1}},
+                return_document=ReturnDocument.AFTER
+            )
+            if updated_floorplan or not partial or expected is not None:
+                break
+        if not updated_floorplan:
+            return write_miss_response(db, oid, expected, current_user_id) or \
+                (jsonify({'message': 'Floor plan was modified concurrently, please retry'}), 409)
+        
+        after_write(db, oid, updated_floorplan)
         
         fp_data = {
             'id': str(updated_floorplan['_id']),
@@ -249,7 +348,8 @@ def update_floorplan(floorplan_id):
             'floor': updated_floorplan.get('floor', 1),
             'layer': updated_floorplan.get('layer', 0),
             'user_id': updated_floorplan.get('user_id'),
-            'status': updated_floorplan.get('status', 'draft')
+            'status': updated_floorplan.get('status', 'draft'),
+            'stats': FloorPlanStats.get_stats(updated_floorplan)
         }
         
         return jsonify({
@@ -260,6 +360,188 @@ def update_floorplan(floorplan_id):
     except Exception as e:
         return jsonify({'message': 'Failed to update floor plan', 'error': str(e)}), 500
 
+@floorplan_bp.route('/floorplans/<floorplan_id>/elements', methods=['GET'])
+@login_required
+def get_floorplan_elements(floorplan_id):
+    """Elements intersecting a viewport (`bbox`) or under a point (`point`)"""
+    try:
+        db = get_db()
+        
+        meta = db.floorplans.find_one({'_id': ObjectId(floorplan_id)}, VALIDATOR_PROJECTION)
+        if not meta:
+            return jsonify({'message': 'Floor plan not found'}), 404
+        # Same visibility as GET /floorplans/<id>
+        if get_current_role() != 'admin' and meta.get('status') not in ['active', 'published']:
+            return jsonify({'message': 'Access denied'}), 403
+        
+        return element_query_response(db, meta)
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to query elements', 'error': str(e)}), 500
+
+@floorplan_bp.route('/floorplans/<floorplan_id>/elements', methods=['PATCH'])
+@login_required
+def patch_floorplan_elements(floorplan_id):
+    """Apply element-level add/update/remove operations to a plan's state"""
+    try:
+        data = request.get_json()
+        current_user_id = get_jwt_identity()
+        
+        if not data:
+            return jsonify({'message': 'version is required'}), 400
+        try:
+            expected = expected_version(data, floorplan_id)
+            adds, updates, removes = element_ops.parse_ops(data.get('ops'), Config.ELEMENT_PATCH_MAX_OPS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        if expected is None:
+            return jsonify({'message': 'version is required'}), 400
+        
+        db = get_db()
+        oid = ObjectId(floorplan_id)
+        query = {**guarded_query(oid, expected, current_user_id),
+                 **element_ops.element_guard(adds, updates, removes)}
+        
+        # Stats and search tokens of the edited version go into the same guarded update
+        derived = None
+        if element_ops.affects_derived_fields(adds, updates, removes):
+            current = db.floorplans.find_one({'_id': oid, 'version': expected}, element_ops.SOURCE_PROJECTION)
+            if current:
+                derived = element_ops.derived_after(current, adds, updates, removes)
+        
+        update, array_filters = element_ops.build_update(adds, updates, removes, derived=derived)
+        updated = db.floorplans.find_one_and_update(
+            query, update, array_filters=array_filters,
+            projection={'version': 1, 'last_modified': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        
+        if not updated:
+            return write_miss_response(db, oid, expected, current_user_id) or \
+                (jsonify({'message': 'Updated or removed elements must exist and added ids must be new'}), 400)
+        
+        after_write(db, oid)
+        
+        return jsonify({
+            'message': 'Floor plan elements updated successfully',
+            'version': updated['version'],
+            'last_modified': updated['last_modified'],
+            'applied': {'added': len(adds), 'updated': len(updates), 'removed': len(removes)},
+            'stats': derived['stats'] if derived else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to update floor plan elements', 'error': str(e)}), 500
+
+def editor_access_response(db, oid, current_user_id):
+    """Error response unless the caller may edit the plan (admin or owner)"""
+    meta = db.floorplans.find_one({'_id': oid}, VALIDATOR_PROJECTION)
+    if not meta:
+        return jsonify({'message': 'Floor plan not found'}), 404
+    if get_current_role() != 'admin' and meta.get('user_id') != current_user_id:
+        return jsonify({'message': 'Access denied'}), 403
+    return None
+
+def collab_stream_scope(oid):
+    return f'collab:{oid}'
+
+def open_collab_events(floorplan_id):
+    """Join a plan's editing session: (session, stream options) or (None, error response).
+    
+    EventSource cannot send headers, so browsers pass `?ticket=` from
+    POST /collab/ticket instead: a token that expires after COLLAB_TICKET_TTL
+    and opens only this stream. Access tokens never appear in a URL.
+    """
+    db = get_db()
+    oid = ObjectId(floorplan_id)
+    ticket = request.args.get('ticket')
+    try:
+        if ticket:
+            if decode_token(ticket).get('stream') != collab_stream_scope(oid):
+                raise ValueError('Ticket is not valid for this floor plan')
+        else:
+            verify_jwt_in_request()
+    except Exception as e:
+        return None, (jsonify({'message': 'Authentication required', 'error': str(e)}), 401)
+    if ticket:
+        # Editor access was checked when the ticket was issued
+        if not db.floorplans.find_one({'_id': oid}, {'_id': 1}):
+            return None, (jsonify({'message': 'Floor plan not found'}), 404)
+    else:
+        denied = editor_access_response(db, oid, get_jwt_identity())
+        if denied:
+            return None, denied
+    session = collab.hub.subscribe(db, oid, current_app._get_current_object(), after_write)
+    return session, {'last_event_id': request.headers.get('Last-Event-ID'),
+                     'ready': session.ready, 'unsubscribe': collab.hub.unsubscribe}
+
+@floorplan_bp.route('/floorplans/<floorplan_id>/collab/ticket', methods=['POST'])
+@login_required
+def post_collab_ticket(floorplan_id):
+    """Short-lived ticket that opens the plan's editing session stream (`?ticket=`)"""
+    try:
+        db = get_db()
+        oid = ObjectId(floorplan_id)
+        current_user_id = get_jwt_identity()
+        denied = editor_access_response(db, oid, current_user_id)
+        if denied:
+            return denied
+        
+        ticket = create_access_token(identity=current_user_id,
+                                     additional_claims={'stream': collab_stream_scope(oid)},
+                                     expires_delta=timedelta(seconds=Config.COLLAB_TICKET_TTL))
+        return jsonify({'ticket': ticket, 'expires_in': Config.COLLAB_TICKET_TTL}), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to issue stream ticket', 'error': str(e)}), 500
+
+@floorplan_bp.route('/floorplans/<floorplan_id>/collab/events', methods=['GET'])
+def get_collab_events(floorplan_id):
+    """Server-Sent Events stream of a plan's collaborative editing session"""
+    try:
+        # Each stream served here holds a thread; asgi.py serves them without one
+        if live.hub.threads_exhausted():
+            return streams_busy_response('Too many open event streams on this server, retry later')
+        session, opened = open_collab_events(floorplan_id)
+        if session is None:
+            return opened
+        return event_stream_response(live.stream(session, **opened))
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to open editing session', 'error': str(e)}), 500
+
+@floorplan_bp.route('/floorplans/<floorplan_id>/collab/ops', methods=['POST'])
+@login_required
+def post_collab_ops(floorplan_id):
+    """Submit element operations to a plan's editing session; they are broadcast now and written on the next flush"""
+    try:
+        data = request.get_json()
+        current_user_id = get_jwt_identity()
+        
+        if not data:
+            return jsonify({'message': 'ops are required'}), 400
+        try:
+            element_ops.parse_ops(data.get('ops'), Config.ELEMENT_PATCH_MAX_OPS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        db = get_db()
+        oid = ObjectId(floorplan_id)
+        denied = editor_access_response(db, oid, current_user_id)
+        if denied:
+            return denied
+        
+        session = collab.hub.session(db, oid, current_app._get_current_object(), after_write)
+        try:
+            seq = collab.hub.submit(session, data['ops'], current_user_id, data.get('client_id'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 409
+        
+        return jsonify({'seq': seq, 'version': session.version}), 202
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to submit operations', 'error': str(e)}), 500
+
 @floorplan_bp.route('/floorplans/<floorplan_id>', methods=['DELETE'])
 @login_required
 def delete_floorplan(floorplan_id):
@@ -273,12 +555,13 @@ def delete_floorplan(floorplan_id):
             return jsonify({'message': 'Floor plan not found'}), 404
         
         # Check access permissions
-        user = db.users.find_one({'_id': ObjectId(current_user_id)})
-        if user.get('role') != 'admin' and floorplan.get('user_id') != current_user_id:
+        if get_current_role() != 'admin' and floorplan.get('user_id') != current_user_id:
             return jsonify({'message': 'Access denied'}), 403
         
         # Delete floor plan
         db.floorplans.delete_one({'_id': ObjectId(floorplan_id)})
+        db.navfields.delete_one({'_id': ObjectId(floorplan_id)})
+        after_write(db, ObjectId(floorplan_id))
         
         return jsonify({'message': 'Floor plan deleted successfully'}), 200
         
@@ -300,31 +583,38 @@ def update_floorplan_status(floorplan_id):
         if new_status not in ['draft', 'active', 'published', 'archived']:
             return jsonify({'message': 'Invalid status. Must be one of: draft, active, published, archived'}), 400
         
-        # Get existing floor plan
-        floorplan = db.floorplans.find_one({'_id': ObjectId(floorplan_id)})
-        if not floorplan:
-            return jsonify({'message': 'Floor plan not found'}), 404
-        
-        # Check access permissions
-        user = db.users.find_one({'_id': ObjectId(current_user_id)})
-        if user.get('role') != 'admin' and floorplan.get('user_id') != current_user_id:
-            return jsonify({'message': 'Access denied'}), 403
-        
-        # Update status
-        update_data = {
-            'status': new_status,
-            'last_modified': datetime.utcnow(),
-            'version': floorplan['version'] + 1
-        }
-        
-        db.floorplans.update_one(
-            {'_id': ObjectId(floorplan_id)},
-            {'$set': update_data}
+        try:
+            expected = expected_version(data, floorplan_id)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # Compare-and-set the status, returning only what the response needs
+        oid = ObjectId(floorplan_id)
+        updated = db.floorplans.find_one_and_update(
+            guarded_query(oid, expected, current_user_id),
+            {'$set': {'status': new_status, 'last_modified': datetime.utcnow()},
+             '$inc': {'version': 1}},
+            projection={'version': 1, 'stats': 1, 'search_tokens': 1},
+            return_document=ReturnDocument.AFTER
         )
+        if not updated:
+            return write_miss_response(db, oid, expected, current_user_id) or \
+                (jsonify({'message': 'Floor plan not found'}), 404)
+        
+        # Plans saved before derived fields were stored get them on their next write,
+        # as a further version so that cached copies without them are not served
+        version = updated['version']
+        if 'stats' not in updated or 'search_tokens' not in updated:
+            version = element_ops.refresh_derived_fields(db.floorplans, oid) or version
+        after_write(db, oid)
+        if new_status == 'published':
+            # Entrance-to-booth routes are precomputed off the request path
+            jobs.submit(('navfield', floorplan_id, version), wayfinding.precompute_job, oid)
         
         return jsonify({
             'message': f'Floor plan status updated to {new_status}',
-            'status': new_status
+            'status': new_status,
+            'version': version
         }), 200
         
     except Exception as e:
@@ -337,19 +627,25 @@ def get_floorplan_booths(floorplan_id):
         db = get_db()
         current_user_id = get_jwt_identity()
         
-        # Get floor plan
-        floorplan = db.floorplans.find_one({'_id': ObjectId(floorplan_id)})
+        # Only the ownership fields and stored stats are needed from the plan
+        oid = ObjectId(floorplan_id)
+        floorplan = db.floorplans.find_one({'_id': oid}, {**VALIDATOR_PROJECTION, 'stats': 1})
         if not floorplan:
             return jsonify({'message': 'Floor plan not found'}), 404
         
         # Check access permissions
-        user = db.users.find_one({'_id': ObjectId(current_user_id)})
-        if user.get('role') != 'admin' and floorplan.get('user_id') != current_user_id:
+        if get_current_role() != 'admin' and floorplan.get('user_id') != current_user_id:
             return jsonify({'message': 'Access denied'}), 403
         
-        # Get booth details
-        booth_details = FloorPlanStats.get_booth_details(floorplan)
-        stats = FloorPlanStats.calculate_booth_stats(floorplan)
+        # Get booth details from the booths collection (floorplan_id index)
+        booth_details = [booths.to_detail(b) for b in
+                         db.booths.find({'floorplan_id': oid}, booths.DETAIL_PROJECTION).sort('number', 1)]
+        stats = FloorPlanStats.get_stats(floorplan)
+        if 'stats' not in floorplan or (stats['total_booths'] and not booth_details):
+            # Plan not synchronised yet (see migrate_booths.py): fall back to its state
+            floorplan = db.floorplans.find_one({'_id': oid})
+            booth_details = FloorPlanStats.get_booth_details(floorplan)
+            stats = FloorPlanStats.get_stats(floorplan)
         
         return jsonify({
             'booths': booth_details,
@@ -359,73 +655,79 @@ def get_floorplan_booths(floorplan_id):
     except Exception as e:
         return jsonify({'message': 'Failed to get booth details', 'error': str(e)}), 500
 
+@floorplan_bp.route('/floorplans/<floorplan_id>/navigation', methods=['GET'])
+@login_required
+def get_floorplan_navigation(floorplan_id):
+    """Size and freshness of a plan's precomputed entrance routes"""
+    try:
+        db = get_db()
+        current_user_id = get_jwt_identity()
+        
+        oid = ObjectId(floorplan_id)
+        floorplan = db.floorplans.find_one({'_id': oid}, VALIDATOR_PROJECTION)
+        if not floorplan:
+            return jsonify({'message': 'Floor plan not found'}), 404
+        if get_current_role() != 'admin' and floorplan.get('user_id') != current_user_id:
+            return jsonify({'message': 'Access denied'}), 403
+        
+        summary = db.navfields.find_one({'_id': oid}, wayfinding.FIELD_META_PROJECTION)
+        if not summary:
+            return jsonify({'message': 'Navigation data not computed yet',
+                            'pending': jobs.pending()}), 404
+        summary.pop('_id')
+        # Still valid after writes that did not move booths or doors
+        def load_state():
+            doc = db.floorplans.find_one({'_id': oid}, wayfinding.STATE_PROJECTION)
+            return (doc or {}).get('state') or {}
+        grid = wayfinding.get_grid(oid, floorplan['version'], load_state)
+        summary['current'] = summary.get('digest') == grid.digest
+        return jsonify({'navigation': summary}), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to get navigation data', 'error': str(e)}), 500
+
 @floorplan_bp.route('/public/floorplans', methods=['GET'])
 def get_public_floorplans():
     """Get published floor plans for public viewing (no authentication required)"""
     try:
         db = get_db()
         
+        # Identical listing queries are served from the serialized response cache
+        cache_key = public_cache.list_key(request.args)
+        cached = public_cache.get(cache_key)
+        if cached:
+            return public_cache.to_response(cached)
+        
         # Get query parameters
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 10))
         search = request.args.get('search', '')
         event_id = request.args.get('event_id')
+        try:
+            fields = parse_fields(request.args.get('fields'), FloorPlan.PUBLIC_LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
         # Build query - only published floor plans
         query = {'status': 'published'}
-        if search:
-            query['$and'] = [
-                {'status': 'published'},
-                {'$or': [
-                    {'name': {'$regex': search, '$options': 'i'}},
-                    {'description': {'$regex': search, '$options': 'i'}}
-                ]}
-            ]
+        terms = plan_search.parse_terms(search)
+        if terms:
+            query.update(plan_search.prefix_filter(terms))
         if event_id:
-            if '$and' in query:
-                query['$and'].append({'event_id': event_id})
-            else:
-                query['event_id'] = event_id
-        
-        # Calculate skip
-        skip = (page - 1) * limit
-        
-        # Get floor plans
-        cursor = db.floorplans.find(query).sort('last_modified', -1).skip(skip).limit(limit)
-        floorplans = []
-        
-        for fp in cursor:
-            fp_data = {
-                'id': str(fp['_id']),
-                'name': fp['name'],
-                'description': fp.get('description'),
-                'created': fp['created'],
-                'last_modified': fp['last_modified'],
-                'version': fp['version'],
-                'event_id': fp.get('event_id'),
-                'floor': fp.get('floor', 1),
-                'layer': fp.get('layer', 0),
-                'status': fp.get('status', 'draft')
-            }
-            
-            # Add booth statistics
-            stats = FloorPlanStats.calculate_booth_stats(fp)
-            fp_data['stats'] = stats
-            
-            floorplans.append(fp_data)
-        
-        # Get total count for pagination
-        total = db.floorplans.count_documents(query)
+            query['event_id'] = event_id
         
-        return jsonify({
+        # Get floor plans (page/limit, or keyset cursor when `after` is given)
+        try:
+            docs, pagination = paginate(db.floorplans, query,
+                                        FloorPlan.list_projection(fields), request.args,
+                                        score=plan_search.score_expression(terms) if terms else None)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        floorplans = [FloorPlan.summarize(fp, fields) for fp in docs]
+        
+        entry = public_cache.store(cache_key, {
             'floorplans': floorplans,
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total,
-                'pages': (total + limit - 1) // limit
-            }
-        }), 200
+            'pagination': pagination
+        })
+        return public_cache.to_response(entry)
         
     except Exception as e:
         return jsonify({'message': 'Failed to get public floor plans', 'error': str(e)}), 500
@@ -435,39 +737,298 @@ def get_public_floorplan(floorplan_id):
     """Get a specific published floor plan for public viewing (no authentication required)"""
     try:
         db = get_db()
+        published = {'_id': ObjectId(floorplan_id), 'status': 'published'}
+        
+        # Kiosks poll this endpoint. The current version decides both the
+        # validators and the cache entry, so only look up the small projection first.
+        meta = db.floorplans.find_one(published, VALIDATOR_PROJECTION)
+        if not meta:
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
+        etag = floorplan_etag(meta['_id'], meta['version'])
+        if is_not_modified(etag, meta['last_modified']):
+            return not_modified_response(etag, meta['last_modified'], public=True)
+        cached = public_cache.get(public_cache.detail_key(meta['_id'], meta['version']))
+        if cached:
+            return public_cache.to_response(cached)
         
         # Get floor plan - only if published
-        floorplan = db.floorplans.find_one({
-            '_id': ObjectId(floorplan_id),
-            'status': 'published'
-        })
+        floorplan = db.floorplans.find_one(published)
         if not floorplan:
             return jsonify({'message': 'Floor plan not found or not published'}), 404
         
-        # Prepare response data
-        fp_data = {
-            'id': str(floorplan['_id']),
-            'name': floorplan['name'],
-            'description': floorplan.get('description'),
-            'created': floorplan['created'],
-            'last_modified': floorplan['last_modified'],
-            'state': floorplan['state'],
-            'version': floorplan['version'],
-            'event_id': floorplan.get('event_id'),
-            'floor': floorplan.get('floor', 1),
-            'layer': floorplan.get('layer', 0),
-            'status': floorplan.get('status', 'draft')
-        }
+        # Prepare response data, with booth details and statistics
+        fp_data = FloorPlan.public_detail(floorplan)
         
-        # Add detailed booth information
-        booth_details = FloorPlanStats.get_booth_details(floorplan)
-        fp_data['booth_details'] = booth_details
+        entry = public_cache.store(public_cache.detail_key(floorplan['_id'], floorplan['version']),
+                                   {'floorplan': fp_data},
+                                   etag=floorplan_etag(floorplan['_id'], floorplan['version']),
+                                   last_modified=floorplan['last_modified'])
+        return public_cache.to_response(entry)
         
-        # Add statistics
-        stats = FloorPlanStats.calculate_booth_stats(floorplan)
-        fp_data['stats'] = stats
+    except Exception as e:
+        return jsonify({'message': 'Failed to get public floor plan', 'error': str(e)}), 500
+
+@floorplan_bp.route('/public/floorplans/<floorplan_id>/elements', methods=['GET'])
+def get_public_floorplan_elements(floorplan_id):
+    """Elements of a published floor plan in a viewport or under a point (no authentication required)"""
+    try:
+        db = get_db()
+        meta = db.floorplans.find_one({'_id': ObjectId(floorplan_id), 'status': 'published'},
+                                      VALIDATOR_PROJECTION)
+        if not meta:
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
         
-        return jsonify({'floorplan': fp_data}), 200
+        return element_query_response(db, meta, public=True)
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to query elements', 'error': str(e)}), 500
+
+def streams_busy_response(message: str):
+    response = jsonify({'message': message})
+    response.headers['Retry-After'] = '30'
+    return response, 503
+
+def event_stream_response(body):
+    """Server-Sent Events response; asgi.py sends the body of its coroutine streams itself"""
+    return Response(body, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def open_public_events(floorplan_id):
+    """Subscribe to a published plan's live events: (channel, stream options) or (None, error response)"""
+    db = get_db()
+    oid = ObjectId(floorplan_id)
+    if not db.floorplans.find_one({'_id': oid, 'status': 'published'}, {'_id': 1}):
+        return None, (jsonify({'message': 'Floor plan not found or not published'}), 404)
+    try:
+        channel = live.hub.subscribe(db, oid)
+    except live.TooManySubscribers:
+        return None, streams_busy_response('Too many live subscribers, retry later')
+    return channel, {'last_event_id': request.headers.get('Last-Event-ID')}
+
+@floorplan_bp.route('/public/floorplans/<floorplan_id>/events', methods=['GET'])
+def get_public_floorplan_events(floorplan_id):
+    """Server-Sent Events stream of booth-status changes of a published floor plan (no authentication required)"""
+    try:
+        # Each stream served here holds a thread; asgi.py serves them without one
+        if live.hub.threads_exhausted():
+            return streams_busy_response('Too many open event streams on this server, retry later')
+        channel, opened = open_public_events(floorplan_id)
+        if channel is None:
+            return opened
+        return event_stream_response(live.stream(channel, **opened))
         
     except Exception as e:
-        return jsonify({'message': 'Failed to get public floor plan', 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'message': 'Failed to open event stream', 'error': str(e)}), 500
+
+@floorplan_bp.route('/public/floorplans/<floorplan_id>/thumbnail', methods=['GET'])
+def get_public_thumbnail(floorplan_id):
+    """Preview image of a published floor plan; immutable with `?v=<version>` (no authentication required)"""
+    try:
+        db = get_db()
+        oid = ObjectId(floorplan_id)
+        if not db.floorplans.find_one({'_id': oid, 'status': 'published'}, {'_id': 1}):
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
+        
+        doc = thumbnails.ensure_thumbnail(db, oid, request.args.get('v', type=int))
+        if not doc:
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
+        return thumbnails.to_response(doc, public=True)
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to get thumbnail', 'error': str(e)}), 500
+
+@floorplan_bp.route('/public/floorplans/<floorplan_id>/tiles.json', methods=['GET'])
+def get_public_tileset(floorplan_id):
+    """Tile pyramid of the current version of a published floor plan (no authentication required)"""
+    try:
+        db = get_db()
+        oid = ObjectId(floorplan_id)
+        meta = db.floorplans.find_one({'_id': oid, 'status': 'published'}, VALIDATOR_PROJECTION)
+        if not meta:
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
+        etag = floorplan_etag(meta['_id'], meta['version'])
+        if is_not_modified(etag, meta['last_modified']):
+            return not_modified_response(etag, meta['last_modified'], public=True)
+        
+        source = tiles.get_source(oid, meta['version'], lambda: load_tile_state(db, oid))
+        response = jsonify({
+            **source.metadata(),
+            'version': meta['version'],
+            'tiles': f"{request.script_root}/api/public/floorplans/{oid}/tiles/v{meta['version']}/{{z}}/{{x}}/{{y}}.json"
+        })
+        return apply_cache_headers(response, etag, meta['last_modified'], public=True)
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to get tiles', 'error': str(e)}), 500
+
+@floorplan_bp.route('/public/floorplans/<floorplan_id>/tiles/v<int:version>/<int:z>/<int:x>/<int:y>.json',
+                    methods=['GET'])
+def get_public_tile(floorplan_id, version, z, x, y):
+    """One z/x/y tile of a published plan version; immutable once rendered (no authentication required)"""
+    try:
+        oid = ObjectId(floorplan_id)
+        if z > Config.TILES_MAX_ZOOM or x >= (1 << z) or y >= (1 << z):
+            return jsonify({'message': 'Tile out of range'}), 404
+        
+        path = tiles.tile_path(oid, version, z, x, y)
+        body = tiles.read_tile(path)
+        if body is None:
+            db = get_db()
+            meta = db.floorplans.find_one({'_id': oid, 'status': 'published'}, {'version': 1})
+            if not meta:
+                return jsonify({'message': 'Floor plan not found or not published'}), 404
+            if meta['version'] != version:
+                # Superseded versions are only served while their tiles are on disk
+                return jsonify({'message': 'Tile version is not current',
+                                'version': meta['version']}), 404
+            source = tiles.get_source(oid, version, lambda: load_tile_state(db, oid))
+            body = tiles.encode({**tiles.render_tile(source, z, x, y), 'version': version})
+            tiles.write_tile(path, body)
+        
+        etag = f"{floorplan_etag(oid, version)}-{z}-{x}-{y}"
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to get tile', 'error': str(e)}), 500
+
+@floorplan_bp.route('/public/floorplans/<floorplan_id>/route', methods=['GET'])
+def get_public_route(floorplan_id):
+    """Walking route to a booth of a published floor plan (no authentication required)
+
+    `from` and `to` are booth ids or numbers; without `from` the route starts at
+    the nearest entrance.
+    """
+    try:
+        from_ref = request.args.get('from', '').strip()
+        to_ref = request.args.get('to', '').strip()
+        if not to_ref:
+            return jsonify({'message': 'to booth id or number is required'}), 400
+        
+        db = get_db()
+        published = {'_id': ObjectId(floorplan_id), 'status': 'published'}
+        
+        # A route only changes with the plan, so the plan's validators apply
+        meta = db.floorplans.find_one(published, VALIDATOR_PROJECTION)
+        if not meta:
+            return jsonify({'message': 'Floor plan not found or not published'}), 404
+        etag = floorplan_etag(meta['_id'], meta['version'])
+        if is_not_modified(etag, meta['last_modified']):
+            return not_modified_response(etag, meta['last_modified'], public=True)
+        
+        # The state is loaded only when this version's grid is not cached yet
+        def load_state():
+            doc = db.floorplans.find_one({'_id': meta['_id']}, wayfinding.STATE_PROJECTION)
+            return (doc or {}).get('state') or {}
+        grid = wayfinding.get_grid(meta['_id'], meta['version'], load_state)
+        
+        try:
+            if from_ref:
+                route = wayfinding.booth_route(meta['_id'], meta['version'], grid, from_ref, to_ref)
+                start = grid.resolve(from_ref) if route else None
+            else:
+                # Read off the entrance field precomputed when the plan was published
+                field = wayfinding.get_entrance_field(db, meta['_id'], meta['version'], grid)
+                start, route = wayfinding.entrance_route(grid, field, to_ref) or (None, None)
+        except KeyError as e:
+            return jsonify({'message': f'Booth not found: {e.args[0]}'}), 404
+        if route is None:
+            return jsonify({'message': 'No route to this booth'}), 404
+        
+        response = jsonify({
+            **route,
+            'from': start,
+            'to': grid.resolve(to_ref),
+            'entrance': not from_ref,
+            'version': meta['version']
+        })
+        return apply_cache_headers(response, etag, meta['last_modified'], public=True)
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to get route', 'error': str(e)}), 500
+
+@floorplan_bp.route('/public/companies', methods=['GET'])
+def get_public_companies():
+    """Exhibitor directory of published floor plans (no authentication required)"""
+    try:
+        db = get_db()
+        
+        cache_key = public_cache.list_key(request.args)
+        cached = public_cache.get(cache_key)
+        if cached:
+            return public_cache.to_response(cached)
+        
+        # Build query on the indexed directory fields
+        query = {}
+        if request.args.get('floor'):
+            try:
+                query['floor'] = int(request.args['floor'])
+            except ValueError:
+                return jsonify({'message': 'floor must be an integer'}), 400
+        if request.args.get('category'):
+            query['category'] = request.args['category']
+        if request.args.get('event_id'):
+            query['event_id'] = request.args['event_id']
+        if request.args.get('featured', '').lower() in ('true', '1', 'yes'):
+            query['featured'] = True
+        terms = plan_search.parse_terms(request.args.get('search', ''))
+        if terms:
+            query.update(plan_search.prefix_filter(terms, field='tokens'))
+        
+        try:
+            docs, pagination = paginate(db.exhibitors, query, directory.COMPANY_PROJECTION, request.args,
+                                        sort=directory.COMPANY_SORT, default_limit=50)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        entry = public_cache.store(cache_key, {
+            'companies': [directory.to_company(doc) for doc in docs],
+            'pagination': pagination
+        })
+        return public_cache.to_response(entry)
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to get companies', 'error': str(e)}), 500
+
+@floorplan_bp.route('/public/sponsors', methods=['GET'])
+def get_public_sponsors():
+    """Sponsors of published floor plans, best tier first (no authentication required)"""
+    try:
+        db = get_db()
+        
+        cache_key = public_cache.list_key(request.args)
+        cached = public_cache.get(cache_key)
+        if cached:
+            return public_cache.to_response(cached)
+        
+        query = {}
+        if request.args.get('event_id'):
+            query['event_id'] = request.args['event_id']
+        limit = parse_limit(request.args, default=50)
+        
+        rows = db.exhibitors.aggregate(directory.sponsors_pipeline(query, limit))
+        entry = public_cache.store(cache_key, {'sponsors': [directory.to_sponsor(row) for row in rows]})
+        return public_cache.to_response(entry)
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to get sponsors', 'error': str(e)}), 500
+
+@floorplan_bp.route('/cache/stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """Hit/miss counters of this worker's in-memory caches"""
+    return jsonify({
+        'responses': public_cache.stats(),
+        'users': user_cache_stats(),
+        'wayfinding': wayfinding.cache_stats(),
+        'spatial': spatial.cache_stats(),
+        'tiles': tiles.cache_stats(),
+        'live': live.hub.stats(),
+        'collab': collab.hub.stats(),
+        'passwords': passwords.stats()
+    }), 200
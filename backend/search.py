@@ -0,0 +1,69 @@
+"""
+Token-based search over floor plans and booths.
+
+Each floor plan stores a `search_tokens` array: the lower-cased words of its
+name and description, its booth numbers and its exhibitor company names.
+The array has a multikey index. A search term matches when some token starts
+with it; the anchored, case-sensitive prefix regex becomes an index range
+scan. User input is split into words and regex-escaped, and is never used as
+a raw pattern.
+"""
+
+import re
+from typing import Dict, Iterable, List
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+# Keep pathological inputs from producing huge $and filters
+MAX_TERMS = 8
+
+def tokenize(*texts) -> List[str]:
+    """Lower-cased unique words of the given texts, in first-seen order"""
+    tokens = []
+    for text in texts:
+        if not text:
+            continue
+        tokens.extend(_WORD.findall(str(text).lower()))
+    return list(dict.fromkeys(tokens))
+
+def booth_tokens(elements: Iterable[Dict]) -> List[str]:
+    """Tokens of booth numbers and exhibitor company names in a plan's elements"""
+    texts = []
+    for element in elements or []:
+        if element.get('type') != 'booth':
+            continue
+        texts.append(element.get('number'))
+        texts.append((element.get('exhibitor') or {}).get('companyName'))
+    return sorted(tokenize(*texts))
+
+def plan_tokens(name: str, description: str, booth_token_list: Iterable[str]) -> List[str]:
+    """Complete search_tokens value for a floor plan"""
+    return sorted(set(tokenize(name, description)) | set(booth_token_list or []))
+
+def parse_terms(search: str) -> List[str]:
+    return tokenize(search)[:MAX_TERMS]
+
+def prefix_filter(terms: List[str], field: str = 'search_tokens') -> Dict:
+    """Every term must prefix-match one of the tokens in `field`"""
+    clauses = [{field: {'$regex': '^' + re.escape(term)}} for term in terms]
+    if len(clauses) == 1:
+        return clauses[0]
+    return {'$and': clauses}
+
+def score_expression(terms: List[str], field: str = 'search_tokens', title_field: str = 'name') -> Dict:
+    """Relevance score for documents already matched by prefix_filter.
+
+    Whole-word matches count double, prefix-only matches once, and a title
+    starting with the first term gets a bonus.
+    """
+    exact = {'$size': {'$setIntersection': [{'$ifNull': [f'${field}', []]}, terms]}}
+    title = {'$cond': [{'$regexMatch': {
+        'input': {'$toLower': {'$ifNull': [f'${title_field}', '']}},
+        'regex': '^' + re.escape(terms[0])
+    }}, 1, 0]}
+    return {'$add': [len(terms), exact, title]}
+
+def matches(terms: List[str], *texts) -> bool:
+    """In-process equivalent of prefix_filter for already loaded values"""
+    tokens = tokenize(*texts)
+    return all(any(token.startswith(term) for token in tokens) for term in terms)
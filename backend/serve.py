@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Production server for IMTMA Flooring Backend (gunicorn, preforked workers).
+
+    python serve.py                     # Flask app: SERVER_WORKERS x SERVER_THREADS
+    python serve.py --asgi              # asgi.py on uvicorn workers (see README)
+
+The master process only forks and supervises. Each worker imports the app
+after the fork, so it creates its own MongoDB client, background threads and
+bcrypt pool, then warms up (pool processes, templates, connection pool,
+public listing and the most recently published plans) before it accepts
+connections.
+
+Signals to the master process:
+
+    HUP    graceful reload: start workers with the new code and, once they
+           are warmed up, retire the old ones after their requests finish.
+           The listening socket stays open throughout, so no connection is
+           refused or left waiting on a cold worker.
+    TERM   graceful shutdown: stop accepting and drain in-flight requests for
+           at most SERVER_GRACEFUL_TIMEOUT seconds.
+    INT    immediate shutdown.
+"""
+
+import argparse
+import logging
+import os
+import select
+import sys
+import time
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.arbiter import Arbiter
+from gunicorn.workers.gthread import ThreadWorker
+
+from config import Config
+import passwords
+
+# Flask app of this worker, set when the worker loads it
+_flask_app = None
+
+# Access log lines carry the path without its query string: a stream ticket
+# (`?ticket=`) or any other credential in a URL must not end up in the logs
+ACCESS_LOG_FORMAT = '%(h)s %(l)s %(u)s %(t)s "%(m)s %(U)s %(H)s" %(s)s %(b)s "%(f)s" "%(a)s"'
+
+class StripQueryString(logging.Filter):
+    """Drop the query string from uvicorn's access log records (method, path, version)"""
+
+    def filter(self, record):
+        args = record.args
+        if isinstance(args, tuple) and len(args) >= 3 and isinstance(args[2], str):
+            record.args = (*args[:2], args[2].split('?', 1)[0], *args[3:])
+        return True
+
+# Workers write their pid here once warmed up; created by the master before forking
+_ready_read, _ready_write = None, None
+
+def warm_up(app, log):
+    """Prime a fresh worker before it accepts connections"""
+    start = time.perf_counter()
+    try:
+        passwords.prestart()
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+        client = app.test_client()
+        client.get('/health')
+        client.get('/api/public/floorplans')
+        listing = client.get('/api/public/floorplans',
+                             query_string={'limit': Config.SERVER_WARMUP_PLANS, 'count': 'none'})
+        plans = (listing.get_json() or {}).get('floorplans', [])
+        for plan in plans:
+            client.get(f"/api/public/floorplans/{plan['id']}")
+        log.info(f"Worker warmed up in {(time.perf_counter() - start) * 1000:.0f} ms "
+                 f"({len(plans)} published plans)")
+    except Exception as e:
+        # A cold worker is still a working worker
+        log.warning(f"Worker warm-up failed: {e}")
+
+def post_worker_init(worker):
+    warm_up(_flask_app, worker.log)
+    try:
+        os.write(_ready_write, f"{os.getpid()}\n".encode('ascii'))
+    except OSError:
+        pass  # nobody is waiting and the pipe is full
+
+class DrainingThreadWorker(ThreadWorker):
+    """gthread worker that serves every connection it accepted before exiting.
+
+    On a graceful exit the stock worker closes accepted connections whose
+    request it has not read yet, which drops them during a reload. This one
+    stops accepting, answers with `Connection: close`, and exits once its
+    connections are done or SERVER_GRACEFUL_TIMEOUT has passed.
+    """
+
+    drain_deadline = None
+    draining = False
+
+    def handle_exit(self, sig, frame):
+        # Signal handler: only take note, the main loop drains (see below)
+        if self.drain_deadline is None:
+            self.drain_deadline = time.monotonic() + self.cfg.graceful_timeout
+
+    def murder_keepalived(self):
+        # Runs once per iteration of the worker's main loop
+        super().murder_keepalived()
+        if self.drain_deadline is None:
+            return
+        if not self.draining:
+            self.draining = True
+            self.max_keepalived = 0
+            with self._lock:
+                for sock in self.sockets:
+                    self.poller.unregister(sock)
+        with self._lock:
+            waiting = len(self.poller.get_map())
+        if not waiting or time.monotonic() > self.drain_deadline:
+            self.alive = False
+
+class WarmReloadArbiter(Arbiter):
+    """Arbiter that retires the old workers on reload only once the new ones are warm"""
+
+    reloading = False
+
+    def manage_workers(self):
+        if not self.reloading:
+            super().manage_workers()
+
+    def reload(self):
+        _drain_ready()
+        before = set(self.WORKERS)
+        self.reloading = True
+        try:
+            super().reload()
+        finally:
+            self.reloading = False
+        self.wait_ready(set(self.WORKERS) - before)
+        self.manage_workers()
+
+    def wait_ready(self, pids):
+        deadline = time.monotonic() + self.cfg.timeout
+        while pids and time.monotonic() < deadline:
+            readable, _, _ = select.select([_ready_read], [], [], deadline - time.monotonic())
+            if readable:
+                pids -= {int(pid) for pid in os.read(_ready_read, 4096).split()}
+            # Workers that failed to boot will not report
+            pids &= set(self.WORKERS)
+        if pids:
+            self.log.warning(f"Workers {sorted(pids)} not ready after {self.cfg.timeout}s, "
+                             "retiring the old workers anyway")
+
+def _drain_ready():
+    # Drop reports from workers started since the last reload (e.g. by max_requests)
+    while select.select([_ready_read], [], [], 0)[0]:
+        os.read(_ready_read, 4096)
+
+class Server(BaseApplication):
+    def __init__(self, use_asgi: bool, options: dict):
+        self.use_asgi = use_asgi
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def run(self):
+        try:
+            WarmReloadArbiter(self).run()
+        except RuntimeError as e:
+            print(f"\nError: {e}\n", file=sys.stderr)
+            sys.exit(1)
+
+    def load(self):
+        # Runs in each worker after the fork (the app is not preloaded)
+        global _flask_app
+        if self.use_asgi:
+            logging.getLogger('uvicorn.access').addFilter(StripQueryString())
+            import asgi
+            _flask_app = asgi.flask_app
+            return asgi.app
+        from app import create_app
+        _flask_app = create_app()
+        if _flask_app is None:
+            raise RuntimeError('Failed to create the application; check the MongoDB connection')
+        return _flask_app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--asgi', action='store_true', help='serve asgi.py on uvicorn workers')
+    parser.add_argument('--bind', default=Config.SERVER_BIND)
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument('--threads', type=int, default=Config.SERVER_THREADS)
+    args = parser.parse_args()
+
+    if args.asgi:
+        worker_class = 'uvicorn.workers.UvicornWorker'
+    elif Config.SERVER_WORKER_CLASS == 'gthread':
+        worker_class = 'serve.DrainingThreadWorker'
+    else:
+        worker_class = Config.SERVER_WORKER_CLASS
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': worker_class,
+        'timeout': Config.SERVER_TIMEOUT,
+        'graceful_timeout': Config.SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': Config.SERVER_KEEPALIVE,
+        'max_requests': Config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': Config.SERVER_MAX_REQUESTS // 10,
+        'preload_app': False,
+        'post_worker_init': post_worker_init,
+        'accesslog': '-',
+        'access_log_format': ACCESS_LOG_FORMAT,
+    }
+    global _ready_read, _ready_write
+    _ready_read, _ready_write = os.pipe()
+    os.set_blocking(_ready_write, False)
+    print(f"🚀 Starting IMTMA Flooring Backend on {args.bind} "
+          f"({args.workers} workers x {args.threads} threads{', ASGI' if args.asgi else ''})")
+    Server(args.asgi, options).run()
+
+if __name__ == '__main__':
+    main()
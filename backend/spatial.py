@@ -0,0 +1,168 @@
+"""
+Spatial index over the canvas elements of a floor plan.
+
+Elements are bucketed into a uniform grid by their axis-aligned bounding box,
+which accounts for rotation (Konva rotates a node clockwise around its x, y)
+and for the `points` of lines. Elements spanning many buckets, such as hall
+outlines, are kept in a separate list that every query checks.
+
+Indexes are immutable and cached per (plan id, version), so a viewer panning
+over a large plan only pays for loading and bucketing the elements once.
+Queries return elements in drawing order.
+"""
+
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from cache import TTLCache
+from config import Config
+
+# Only the elements are needed to build an index
+STATE_PROJECTION = {'state.elements': 1}
+
+# Elements covering more buckets than this go to the `large` list
+_MAX_BUCKETS_PER_ELEMENT = 16
+
+BBox = Tuple[float, float, float, float]  # x0, y0, x1, y1
+
+def element_bbox(element: Dict) -> BBox:
+    """Axis-aligned bounding box of an element in canvas coordinates"""
+    x, y = element.get('x', 0) or 0, element.get('y', 0) or 0
+    w, h = element.get('width', 0) or 0, element.get('height', 0) or 0
+    local = [(0, 0), (w, 0), (0, h), (w, h)]
+    points = element.get('points') or []
+    local.extend(zip(points[0::2], points[1::2]))
+
+    rotation = element.get('rotation') or 0
+    if rotation:
+        cos, sin = math.cos(math.radians(rotation)), math.sin(math.radians(rotation))
+        corners = [(x + px * cos - py * sin, y + px * sin + py * cos) for px, py in local]
+    else:
+        corners = [(x + px, y + py) for px, py in local]
+    xs, ys = [c[0] for c in corners], [c[1] for c in corners]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def contains_point(element: Dict, px: float, py: float) -> bool:
+    """Whether a point lies inside the element's (possibly rotated) rectangle"""
+    x, y = element.get('x', 0) or 0, element.get('y', 0) or 0
+    w, h = element.get('width', 0) or 0, element.get('height', 0) or 0
+    dx, dy = px - x, py - y
+    rotation = element.get('rotation') or 0
+    if rotation:
+        # Rotate the point back into the element's own frame
+        cos, sin = math.cos(math.radians(rotation)), math.sin(math.radians(rotation))
+        dx, dy = dx * cos + dy * sin, -dx * sin + dy * cos
+    return min(0, w) <= dx <= max(0, w) and min(0, h) <= dy <= max(0, h)
+
+def _intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+class ElementIndex:
+    """Uniform grid index of one plan version's elements"""
+
+    def __init__(self, elements: List[Dict]):
+        self.elements = elements
+        self.boxes = [element_bbox(e) for e in elements]
+        if self.boxes:
+            self.bounds = (min(b[0] for b in self.boxes), min(b[1] for b in self.boxes),
+                           max(b[2] for b in self.boxes), max(b[3] for b in self.boxes))
+        else:
+            self.bounds = (0, 0, 0, 0)
+
+        # Buckets sized for about one element each
+        width, height = self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1]
+        self.bucket = max(Config.SPATIAL_MIN_BUCKET,
+                          math.sqrt(width * height / max(1, len(elements))))
+        self.buckets: Dict[Tuple[int, int], List[int]] = {}
+        self.large: List[int] = []
+        for i, box in enumerate(self.boxes):
+            c0, r0, c1, r1 = self._cells(box)
+            if (c1 - c0 + 1) * (r1 - r0 + 1) > _MAX_BUCKETS_PER_ELEMENT:
+                self.large.append(i)
+                continue
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    self.buckets.setdefault((c, r), []).append(i)
+
+    def _cells(self, box: BBox) -> Tuple[int, int, int, int]:
+        ox, oy, size = self.bounds[0], self.bounds[1], self.bucket
+        return (math.floor((box[0] - ox) / size), math.floor((box[1] - oy) / size),
+                math.floor((box[2] - ox) / size), math.floor((box[3] - oy) / size))
+
+    def _candidates(self, box: BBox) -> List[int]:
+        c0, r0, c1, r1 = self._cells(box)
+        # Clamp to the occupied area so a huge viewport does not walk empty buckets
+        cmax, rmax = self._cells(self.bounds)[2:]
+        c0, r0, c1, r1 = max(c0, 0), max(r0, 0), min(c1, cmax), min(r1, rmax)
+        if c1 < c0 or r1 < r0:
+            return list(self.large)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) >= len(self.elements):
+            return range(len(self.elements))
+        found = set(self.large)
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                found.update(self.buckets.get((c, r), ()))
+        return sorted(found)
+
+    def query(self, box: BBox) -> List[Dict]:
+        """Elements whose bounding box intersects `box`, in drawing order"""
+        return [self.elements[i] for i in self._candidates(box) if _intersects(self.boxes[i], box)]
+
+    def hit_test(self, px: float, py: float) -> List[Dict]:
+        """Elements under a point, topmost (highest layer, drawn last) first"""
+        hits = [i for i in self._candidates((px, py, px, py))
+                if _intersects(self.boxes[i], (px, py, px, py))
+                and contains_point(self.elements[i], px, py)]
+        hits.sort(key=lambda i: (self.elements[i].get('layer') or 0, i), reverse=True)
+        return [self.elements[i] for i in hits]
+
+def parse_bbox(raw: str) -> BBox:
+    """`x0,y0,x1,y1` (any two opposite corners); raises ValueError"""
+    values = [float(v) for v in raw.split(',')]
+    if len(values) != 4 or not all(math.isfinite(v) for v in values):
+        raise ValueError('bbox must be x0,y0,x1,y1')
+    x0, y0, x1, y1 = values
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+def parse_point(raw: str) -> Tuple[float, float]:
+    """`x,y`; raises ValueError"""
+    values = [float(v) for v in raw.split(',')]
+    if len(values) != 2 or not all(math.isfinite(v) for v in values):
+        raise ValueError('point must be x,y')
+    return values[0], values[1]
+
+# Cache
+
+_indexes = TTLCache(maxsize=Config.SPATIAL_INDEX_CACHE_SIZE, ttl=0)
+_build_lock = threading.Lock()
+
+def get_index(floorplan_id, version: int, load_elements) -> ElementIndex:
+    """Cached index of a plan version; `load_elements()` is called only to build it"""
+    key = (str(floorplan_id), version)
+    index = _indexes.get(key)
+    if index is None:
+        with _build_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = ElementIndex(load_elements())
+                _indexes.set(key, index)
+    return index
+
+def query_response(index: ElementIndex, args) -> Optional[Dict]:
+    """Body of an element query from `bbox` or `point` args; raises ValueError, None if neither"""
+    if args.get('bbox'):
+        elements = index.query(parse_bbox(args['bbox']))
+    elif args.get('point'):
+        elements = index.hit_test(*parse_point(args['point']))
+    else:
+        return None
+    return {
+        'elements': elements,
+        'count': len(elements),
+        'total': len(index.elements),
+        'bounds': list(index.bounds)
+    }
+
+def cache_stats() -> Dict:
+    return _indexes.stats()
@@ -202,6 +202,70 @@ def test_get_booth_details(token, floor_plan_id):
     print_response(response, "Get Booth Details")
     return response.status_code == 200
 
+def test_patch_floor_plan_elements(token, floor_plan_id):
+    """Test element-level updates and the version guard"""
+    print("🧩 Testing floor plan element patch...")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    current = requests.get(f"{BASE_URL}/api/floorplans/{floor_plan_id}", headers=headers)
+    version = current.json()['floorplan']['version']
+    
+    patch = {
+        "version": version,
+        "ops": [{"op": "update", "id": "test_booth_001", "fields": {"x": 140, "status": "sold"}}]
+    }
+    response = requests.patch(
+        f"{BASE_URL}/api/floorplans/{floor_plan_id}/elements",
+        json=patch,
+        headers=headers
+    )
+    print_response(response, "Patch Floor Plan Elements")
+    if response.status_code != 200 or response.json().get('version') != version + 1:
+        return False
+    
+    # Replaying the same patch against the old version must be rejected
+    stale = requests.patch(
+        f"{BASE_URL}/api/floorplans/{floor_plan_id}/elements",
+        json=patch,
+        headers=headers
+    )
+    print_response(stale, "Patch With Stale Version")
+    return stale.status_code == 409
+
+def test_patch_expression_ids(token, floor_plan_id):
+    """Test that element ids are never read as aggregation expressions"""
+    print("🧪 Testing element ids that look like expressions...")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"{BASE_URL}/api/floorplans/{floor_plan_id}/elements"
+    plan = requests.get(f"{BASE_URL}/api/floorplans/{floor_plan_id}", headers=headers).json()['floorplan']
+    
+    # An id starting with '$' would name a field path or variable in a mixed-batch pipeline
+    hostile = requests.patch(url, json={
+        "version": plan['version'],
+        "ops": [{"op": "add", "element": {"id": "$$el.id", "type": "booth", "x": 0, "y": 0}}]
+    }, headers=headers)
+    print_response(hostile, "Patch With Expression Id")
+    if hostile.status_code != 400:
+        return False
+    
+    # A mixed batch (pipeline update) must touch only the addressed elements
+    before = {e['id']: e for e in plan['state']['elements']}
+    mixed = requests.patch(url, json={
+        "version": plan['version'],
+        "ops": [
+            {"op": "add", "element": {"id": "test_literal_001", "type": "booth", "x": 300, "y": 300,
+                                      "width": 50, "height": 50}},
+            {"op": "update", "id": "test_booth_001", "fields": {"x": 150}}
+        ]
+    }, headers=headers)
+    print_response(mixed, "Mixed Patch")
+    after = {e['id']: e for e in requests.get(f"{BASE_URL}/api/floorplans/{floor_plan_id}",
+                                              headers=headers).json()['floorplan']['state']['elements']}
+    untouched = all(after.get(i) == e for i, e in before.items() if i != 'test_booth_001')
+    return (mixed.status_code == 200 and untouched and after['test_booth_001']['x'] == 150
+            and set(after) == set(before) | {'test_literal_001'})
+
 def run_tests():
     """Run all tests"""
     print("🚀 Starting IMTMA Flooring Backend API Tests")
@@ -270,6 +334,22 @@ def run_tests():
     else:
         print("❌ Get booth details failed")
     
+    # Test 7: Patch Floor Plan Elements
+    total_tests += 1
+    if test_patch_floor_plan_elements(token, floor_plan_id):
+        tests_passed += 1
+        print("✅ Patch floor plan elements passed")
+    else:
+        print("❌ Patch floor plan elements failed")
+    
+    # Test 8: Element Ids Are Literals
+    total_tests += 1
+    if test_patch_expression_ids(token, floor_plan_id):
+        tests_passed += 1
+        print("✅ Element id literal handling passed")
+    else:
+        print("❌ Element id literal handling failed")
+    
     # Summary
     print(f"\n{'='*50}")
     print("📊 TEST SUMMARY")
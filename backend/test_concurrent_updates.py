@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Concurrency test for floor plan writes against a running backend.
+
+Many threads increment a counter stored in one plan's state. Each one does a
+read-modify-write of the whole state with the version it read. Version-guarded
+writes must never lose an increment: stale writers get 409 and retry. At the
+end the counter must equal the number of accepted writes, and the plan
+version must have advanced by the same amount. A full write and an element
+patch against an outdated version must both get 409.
+
+Usage: python test_concurrent_updates.py [--threads 16] [--writes 10]
+"""
+
+import argparse
+import sys
+import threading
+import requests
+
+BASE_URL = "http://localhost:5000"
+TEST_USER = {
+    "username": "concurrency_admin",
+    "email": "concurrency_admin@example.com",
+    "password": "concurrency_password_123",
+    "role": "admin"
+}
+
+def get_token():
+    response = requests.post(f"{BASE_URL}/api/auth/register", json=TEST_USER)
+    if response.status_code != 201:
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "username": TEST_USER["username"],
+            "password": TEST_USER["password"]
+        })
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+def counter_state(value):
+    return {
+        "elements": [{
+            "id": "counter",
+            "type": "text",
+            "x": 0, "y": 0, "width": 10, "height": 10,
+            "text": str(value)
+        }]
+    }
+
+def writer(floorplan_id, headers, writes, results, lock):
+    session = requests.Session()
+    done = conflicts = 0
+    while done < writes:
+        plan = session.get(f"{BASE_URL}/api/floorplans/{floorplan_id}", headers=headers).json()["floorplan"]
+        value = int(plan["state"]["elements"][0]["text"])
+        response = session.put(
+            f"{BASE_URL}/api/floorplans/{floorplan_id}",
+            json={"state": counter_state(value + 1), "version": plan["version"]},
+            headers=headers
+        )
+        if response.status_code == 409:
+            conflicts += 1
+            continue
+        response.raise_for_status()
+        done += 1
+    with lock:
+        results["writes"] += done
+        results["conflicts"] += conflicts
+
+def run(threads, writes):
+    token = get_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    created = requests.post(f"{BASE_URL}/api/floorplans", json={
+        "name": "Concurrency Test Plan",
+        "state": counter_state(0)
+    }, headers=headers)
+    created.raise_for_status()
+    floorplan_id = created.json()["floorplan"]["id"]
+    start_version = created.json()["floorplan"]["version"]
+
+    results = {"writes": 0, "conflicts": 0}
+    lock = threading.Lock()
+    workers = [threading.Thread(target=writer, args=(floorplan_id, headers, writes, results, lock))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    plan = requests.get(f"{BASE_URL}/api/floorplans/{floorplan_id}", headers=headers).json()["floorplan"]
+    counter = int(plan["state"]["elements"][0]["text"])
+
+    # A write against an outdated version must be refused
+    stale = requests.put(f"{BASE_URL}/api/floorplans/{floorplan_id}",
+                         json={"name": "stale", "version": start_version}, headers=headers)
+    stale_patch = requests.patch(f"{BASE_URL}/api/floorplans/{floorplan_id}/elements", json={
+        "version": start_version,
+        "ops": [{"op": "update", "id": "counter", "fields": {"text": "stale"}}]
+    }, headers=headers)
+
+    requests.delete(f"{BASE_URL}/api/floorplans/{floorplan_id}", headers=headers)
+
+    print(f"Threads: {threads}, writes per thread: {writes}")
+    print(f"Accepted writes: {results['writes']}, conflicts retried: {results['conflicts']}")
+    print(f"Counter: {counter}, version advanced by: {plan['version'] - start_version}")
+    print(f"Stale write status: {stale.status_code} (current version {stale.json().get('version')})")
+    print(f"Stale element patch status: {stale_patch.status_code}")
+
+    ok = (counter == results["writes"] == threads * writes
+          and plan["version"] - start_version == results["writes"]
+          and stale.status_code == 409
+          and stale_patch.status_code == 409)
+    print("✅ No lost updates" if ok else "❌ Lost or unexpected updates")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.threads, args.writes) else 1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Thumbnail rendering test; runs in process, no server or database needed.
+
+Element colours come from stored plan data and SVG thumbnails are served
+publicly as image/svg+xml, so a hostile fill must never break out of its
+attribute. Valid colours must still be drawn.
+
+Usage: python test_thumbnails.py
+"""
+
+import sys
+from xml.dom import minidom
+
+import thumbnails
+
+HOSTILE = [
+    '"/><script>alert(document.domain)</script><rect fill="',
+    "red' onload='alert(1)",
+    'url(javascript:alert(1))',
+    '#fff" onmouseover="alert(1)',
+]
+
+def booth(element_id, x, **fields):
+    return {'id': element_id, 'type': 'booth', 'x': x, 'y': 10, 'width': 40, 'height': 40, **fields}
+
+def run():
+    state = {
+        'canvasSize': {'width': 400, 'height': 200},
+        'flooring': {'elements': [{'id': f'floor{i}', 'x': 0, 'y': 0, 'width': 100, 'height': 100, 'fill': fill}
+                                  for i, fill in enumerate(HOSTILE + ['#e2e8f0', 'tan'])]},
+        'elements': [booth('b1', 10), booth('b2', 60, status='sold')]
+    }
+    svg = thumbnails.render_svg(state).decode('utf-8')
+
+    ok = True
+    for needle in ('<script', 'onload', 'onmouseover', 'javascript:'):
+        if needle in svg:
+            print(f"❌ Hostile fill reached the SVG: {needle}")
+            ok = False
+
+    # Still one well-formed document with one polygon per element
+    polygons = minidom.parseString(svg).getElementsByTagName('polygon')
+    fills = [p.getAttribute('fill') for p in polygons]
+    if len(polygons) != len(HOSTILE) + 4:
+        print(f"❌ Expected {len(HOSTILE) + 4} polygons, got {len(polygons)}")
+        ok = False
+    if fills[:len(HOSTILE)] != ['none'] * len(HOSTILE) or fills[len(HOSTILE):] != \
+            ['#e2e8f0', 'tan', thumbnails.STATUS_COLORS['available'], thumbnails.STATUS_COLORS['sold']]:
+        print(f"❌ Unexpected fills: {fills}")
+        ok = False
+
+    print("✅ SVG thumbnails escape element colours" if ok else "❌ SVG thumbnail test failed")
+    return ok
+
+if __name__ == '__main__':
+    sys.exit(0 if run() else 1)
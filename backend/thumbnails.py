@@ -0,0 +1,201 @@
+"""
+Preview images of floor plans for listings.
+
+A thumbnail is a small drawing of the plan: flooring, walls and other shapes
+in muted colours and booths filled with their status colour. It is rendered by
+a background job after every plan write (see jobs.py) and stored in the
+`thumbnails` collection under the plan id and version, so the URL
+`.../thumbnail?v=<version>` names immutable content. A thumbnail that is not
+rendered yet is rendered on first request.
+
+Images are PNG or WebP (THUMBNAIL_FORMAT) when Pillow is installed and SVG
+otherwise.
+"""
+
+import hashlib
+import io
+import math
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import Binary
+from flask import current_app, request
+from pymongo.errors import DuplicateKeyError
+
+try:
+    from PIL import Image, ImageColor, ImageDraw
+except ImportError:  # optional dependency: thumbnails are then SVG
+    Image = None
+
+from config import Config
+
+# Only the drawn parts of the state are needed
+STATE_PROJECTION = {'state.elements': 1, 'state.flooring': 1, 'state.canvasSize': 1, 'version': 1}
+
+# Booth status colours of the editor (ElementRenderer)
+STATUS_COLORS = {
+    'available': '#48bb78',
+    'reserved': '#ed8936',
+    'sold': '#4299e1',
+    'on_hold': '#a0aec0'
+}
+SHAPE_COLOR = '#cbd5e0'
+BACKGROUND = '#ffffff'
+
+_MIMETYPES = {'png': 'image/png', 'webp': 'image/webp', 'svg': 'image/svg+xml'}
+
+# Colours that may be written into SVG attributes: #hex or a named colour
+_SVG_COLOR = re.compile(r'#[0-9a-fA-F]{3,8}|[a-zA-Z]{1,32}')
+
+def _corners(element: Dict, scale: float, ox: float, oy: float) -> List[tuple]:
+    """Rectangle corners in image pixels, rotated clockwise around x, y like Konva"""
+    x, y = element.get('x', 0) or 0, element.get('y', 0) or 0
+    w, h = element.get('width', 0) or 0, element.get('height', 0) or 0
+    rotation = math.radians(element.get('rotation') or 0)
+    cos, sin = math.cos(rotation), math.sin(rotation)
+    return [((x + px * cos - py * sin - ox) * scale, (y + px * sin + py * cos - oy) * scale)
+            for px, py in ((0, 0), (w, 0), (w, h), (0, h))]
+
+def _layers(state: Dict):
+    """(element, colour, outline) in drawing order: flooring, shapes, booths"""
+    for element in (state.get('flooring') or {}).get('elements') or []:
+        yield element, element.get('fill') or SHAPE_COLOR, None
+    elements = state.get('elements') or []
+    for element in elements:
+        if element.get('type') in ('shape', 'door'):
+            yield element, None, SHAPE_COLOR
+    for element in elements:
+        if element.get('type') == 'booth':
+            status = (element.get('status') or 'available').replace('-', '_')
+            yield element, STATUS_COLORS.get(status, STATUS_COLORS['available']), '#ffffff'
+
+def _frame(state: Dict):
+    """Origin, scale and pixel size fitting the plan into THUMBNAIL_WIDTH x THUMBNAIL_HEIGHT"""
+    canvas = state.get('canvasSize') or {}
+    elements = (state.get('elements') or []) + ((state.get('flooring') or {}).get('elements') or [])
+    x0 = min([0] + [e.get('x', 0) or 0 for e in elements])
+    y0 = min([0] + [e.get('y', 0) or 0 for e in elements])
+    x1 = max([canvas.get('width') or 1] + [(e.get('x', 0) or 0) + (e.get('width', 0) or 0) for e in elements])
+    y1 = max([canvas.get('height') or 1] + [(e.get('y', 0) or 0) + (e.get('height', 0) or 0) for e in elements])
+    scale = min(Config.THUMBNAIL_WIDTH / (x1 - x0), Config.THUMBNAIL_HEIGHT / (y1 - y0))
+    size = (max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale)))
+    return x0, y0, scale, size
+
+def _color(value: str, default: str):
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except (ValueError, AttributeError, TypeError):
+        return ImageColor.getrgb(default)
+
+def render_raster(state: Dict, fmt: str) -> bytes:
+    ox, oy, scale, size = _frame(state)
+    # Draw at twice the size and downsample for smooth edges
+    factor = 2
+    image = Image.new('RGB', (size[0] * factor, size[1] * factor), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    for element, fill, outline in _layers(state):
+        corners = _corners(element, scale * factor, ox, oy)
+        draw.polygon(corners, fill=_color(fill, SHAPE_COLOR) if fill else None,
+                     outline=_color(outline, SHAPE_COLOR) if outline else None)
+    image = image.resize(size, Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == 'webp':
+        image.save(out, 'WEBP', quality=80, method=6)
+    else:
+        image.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+def _svg_color(value) -> str:
+    # Fills come from stored element data and the SVG is served publicly
+    if isinstance(value, str) and _SVG_COLOR.fullmatch(value):
+        return value
+    return 'none'
+
+def render_svg(state: Dict) -> bytes:
+    ox, oy, scale, size = _frame(state)
+    shapes = []
+    for element, fill, outline in _layers(state):
+        points = ' '.join(f"{x:.1f},{y:.1f}" for x, y in _corners(element, scale, ox, oy))
+        shapes.append(f'<polygon points="{points}" fill="{_svg_color(fill)}" '
+                      f'stroke="{_svg_color(outline)}" stroke-width="0.5"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{size[0]}" height="{size[1]}" '
+            f'viewBox="0 0 {size[0]} {size[1]}"><rect width="100%" height="100%" fill="{BACKGROUND}"/>'
+            + ''.join(shapes) + '</svg>').encode('utf-8')
+
+def render(state: Dict):
+    """(format, image bytes) of a plan state"""
+    state = state or {}
+    if Image is None:
+        return 'svg', render_svg(state)
+    fmt = 'webp' if Config.THUMBNAIL_FORMAT == 'webp' else 'png'
+    return fmt, render_raster(state, fmt)
+
+def thumbnail_id(floorplan_id, version: int) -> str:
+    return f"{floorplan_id}:v{version}"
+
+def ensure_thumbnail(db, floorplan_id, version: Optional[int] = None) -> Optional[Dict]:
+    """Stored thumbnail of a plan version (current by default), rendering it if missing"""
+    if version is not None:
+        doc = db.thumbnails.find_one({'_id': thumbnail_id(floorplan_id, version)})
+        if doc:
+            return doc
+    floorplan = db.floorplans.find_one({'_id': floorplan_id}, STATE_PROJECTION)
+    if not floorplan:
+        return None
+    version = floorplan.get('version', 1)
+    doc = db.thumbnails.find_one({'_id': thumbnail_id(floorplan_id, version)})
+    if doc:
+        return doc
+
+    fmt, data = render(floorplan.get('state'))
+    doc = {
+        '_id': thumbnail_id(floorplan_id, version),
+        'floorplan_id': floorplan_id,
+        'version': version,
+        'format': fmt,
+        'data': Binary(data),
+        'bytes': len(data),
+        'digest': hashlib.sha1(data).hexdigest(),
+        'created': datetime.utcnow()
+    }
+    try:
+        db.thumbnails.insert_one(doc)
+    except DuplicateKeyError:
+        pass  # rendered concurrently; the content is the same
+    return doc
+
+def render_job(floorplan_id, attempts: int = 3):
+    """Background job run after every plan write: render the current version, drop older ones"""
+    from database import get_db
+    db = get_db()
+    for _ in range(attempts):
+        doc = ensure_thumbnail(db, floorplan_id)
+        if doc is None:
+            db.thumbnails.delete_many({'floorplan_id': floorplan_id})
+            return
+        db.thumbnails.delete_many({'floorplan_id': floorplan_id, 'version': {'$lt': doc['version']}})
+        current = db.floorplans.find_one({'_id': floorplan_id}, {'version': 1})
+        if not current or current.get('version') == doc['version']:
+            return
+
+def to_response(doc: Dict, public: bool = False):
+    """Image response; `?v=` naming the stored version makes it immutable"""
+    etag = doc['digest']
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(bytes(doc['data']), status=200,
+                                              mimetype=_MIMETYPES[doc['format']])
+    response.set_etag(etag)
+    if doc['format'] == 'svg':
+        # No scripts even in thumbnails stored before colours were validated
+        response.headers['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'"
+    scope = 'public' if public else 'private'
+    if request.args.get('v') == str(doc['version']):
+        response.headers['Cache-Control'] = f"{scope}, max-age=31536000, immutable"
+    elif public:
+        response.headers['Cache-Control'] = f"public, max-age={Config.PUBLIC_CACHE_MAX_AGE}"
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,209 @@
+"""
+Level-of-detail tiles of published floor plans.
+
+A plan version is cut into a z/x/y pyramid over a square covering the canvas
+and all elements: zoom 0 is one tile, each level splits tiles in four. Tiles
+are JSON documents in canvas coordinates:
+
+* below TILES_DETAIL_ZOOM (overview) they hold bare booth blocks (no labels or
+  exhibitor data), walls, doors and other shapes large enough to see, and the
+  flooring merged into a few rectangles per colour. Booths smaller than
+  TILES_MIN_PIXELS are merged into rectangles per status as well;
+* from TILES_DETAIL_ZOOM on they hold the full elements and flooring shapes.
+
+An element is listed in every tile it overlaps; clients de-duplicate by id.
+Tile URLs name the plan version, so a rendered tile never changes. Tiles are
+written once to TILES_CACHE_DIR and served with immutable cache headers.
+purge_stale() removes the tiles of superseded versions.
+"""
+
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Tuple
+
+from cache import TTLCache
+from config import Config
+from spatial import ElementIndex, element_bbox
+
+# Parts of the state tiles are cut from
+STATE_PROJECTION = {'state.elements': 1, 'state.flooring': 1, 'state.canvasSize': 1}
+
+# Element types kept in overview tiles; labels, images and furniture are dropped
+_OVERVIEW_TYPES = {'shape', 'door'}
+_OVERVIEW_FIELDS = ('id', 'type', 'shapeType', 'x', 'y', 'width', 'height', 'rotation', 'fill',
+                    'points')
+_BOOTH_BLOCK_FIELDS = ('id', 'x', 'y', 'width', 'height', 'rotation', 'status', 'fill')
+
+class TileSource:
+    """Spatial indexes and pyramid geometry of one plan version"""
+
+    def __init__(self, state: Dict):
+        state = state or {}
+        canvas = state.get('canvasSize') or {}
+        self.elements = ElementIndex(state.get('elements') or [])
+        self.flooring = ElementIndex((state.get('flooring') or {}).get('elements') or [])
+
+        boxes = [idx.bounds for idx in (self.elements, self.flooring) if idx.elements]
+        x0 = min([0] + [b[0] for b in boxes])
+        y0 = min([0] + [b[1] for b in boxes])
+        x1 = max([canvas.get('width') or 0] + [b[2] for b in boxes])
+        y1 = max([canvas.get('height') or 0] + [b[3] for b in boxes])
+        self.origin = (x0, y0)
+        self.extent = max(x1 - x0, y1 - y0, 1)
+
+    def tile_bounds(self, z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+        size = self.extent / (1 << z)
+        ox, oy = self.origin
+        return ox + x * size, oy + y * size, ox + (x + 1) * size, oy + (y + 1) * size
+
+    def metadata(self) -> Dict:
+        ox, oy = self.origin
+        return {
+            'bounds': [ox, oy, ox + self.extent, oy + self.extent],
+            'min_zoom': 0,
+            'max_zoom': Config.TILES_MAX_ZOOM,
+            'detail_zoom': Config.TILES_DETAIL_ZOOM,
+            'tile_size': Config.TILES_SIZE_PX
+        }
+
+def _visible(element: Dict, scale: float) -> bool:
+    """Whether an element is at least TILES_MIN_PIXELS across at this scale"""
+    size = max(abs(element.get('width') or 0), abs(element.get('height') or 0))
+    points = element.get('points') or []
+    if points:
+        size = max(size, max(points[0::2]) - min(points[0::2]), max(points[1::2]) - min(points[1::2]))
+    return size * scale >= Config.TILES_MIN_PIXELS
+
+def _pick(element: Dict, fields) -> Dict:
+    return {field: element[field] for field in fields if element.get(field) is not None}
+
+def merge_rects(shapes: List[Tuple[Dict, tuple]], bounds, cells: int, key: str = 'fill') -> List[Dict]:
+    """Rasterise (element, bbox) pairs onto cells x cells per `key` value and emit merged rectangles"""
+    x0, y0, x1, y1 = bounds
+    step_x, step_y = (x1 - x0) / cells, (y1 - y0) / cells
+    masks = {}
+    for shape, box in shapes:
+        mask = masks.setdefault(shape.get(key) or '', bytearray(cells * cells))
+        c0 = max(0, math.floor((box[0] - x0) / step_x))
+        c1 = min(cells, math.ceil((box[2] - x0) / step_x))
+        r0 = max(0, math.floor((box[1] - y0) / step_y))
+        r1 = min(cells, math.ceil((box[3] - y0) / step_y))
+        if c1 > c0:
+            for r in range(r0, r1):
+                mask[r * cells + c0:r * cells + c1] = b'\x01' * (c1 - c0)
+
+    rects = []
+    for value, mask in masks.items():
+        # Runs of each row, extended downwards while the next rows repeat them
+        open_runs = {}
+        for r in range(cells + 1):
+            runs = set()
+            if r < cells:
+                c = 0
+                while c < cells:
+                    if mask[r * cells + c]:
+                        start = c
+                        while c < cells and mask[r * cells + c]:
+                            c += 1
+                        runs.add((start, c))
+                    c += 1
+            for run in list(open_runs):
+                if run not in runs:
+                    top = open_runs.pop(run)
+                    rects.append({'x': x0 + run[0] * step_x, 'y': y0 + top * step_y,
+                                  'width': (run[1] - run[0]) * step_x,
+                                  'height': (r - top) * step_y, key: value})
+            for run in runs:
+                open_runs.setdefault(run, r)
+    return rects
+
+def render_tile(source: TileSource, z: int, x: int, y: int) -> Dict:
+    bounds = source.tile_bounds(z, x, y)
+    scale = Config.TILES_SIZE_PX / (bounds[2] - bounds[0])
+    elements = source.elements.query(bounds)
+    tile = {'z': z, 'x': x, 'y': y, 'bounds': list(bounds)}
+
+    if z >= Config.TILES_DETAIL_ZOOM:
+        tile['lod'] = 'detail'
+        tile['elements'] = elements
+        tile['flooring'] = source.flooring.query(bounds)
+        return tile
+
+    tile['lod'] = 'overview'
+    booths = [e for e in elements if e.get('type') == 'booth']
+    tile['booths'] = [_pick(e, _BOOTH_BLOCK_FIELDS) for e in booths if _visible(e, scale)]
+    # Booths too small to pick out are merged into blocks per status
+    tile['booth_blocks'] = merge_rects([(e, element_bbox(e)) for e in booths if not _visible(e, scale)],
+                                       bounds, Config.TILES_MERGE_CELLS, key='status')
+    tile['shapes'] = [_pick(e, _OVERVIEW_FIELDS) for e in elements
+                      if e.get('type') in _OVERVIEW_TYPES and _visible(e, scale)]
+    flooring = [(e, b) for e, b in zip(source.flooring.elements, source.flooring.boxes)
+                if b[0] <= bounds[2] and bounds[0] <= b[2] and b[1] <= bounds[3] and bounds[1] <= b[3]]
+    tile['flooring'] = merge_rects(flooring, bounds, Config.TILES_MERGE_CELLS)
+    return tile
+
+# Caches
+
+_sources = TTLCache(maxsize=Config.SPATIAL_INDEX_CACHE_SIZE, ttl=0)
+_build_lock = threading.Lock()
+
+def get_source(floorplan_id, version: int, load_state) -> TileSource:
+    """Cached tile source of a plan version; `load_state()` is called only to build it"""
+    key = (str(floorplan_id), version)
+    source = _sources.get(key)
+    if source is None:
+        with _build_lock:
+            source = _sources.get(key)
+            if source is None:
+                source = TileSource(load_state())
+                _sources.set(key, source)
+    return source
+
+def tile_path(floorplan_id, version: int, z: int, x: int, y: int) -> str:
+    return os.path.join(Config.TILES_CACHE_DIR, str(floorplan_id), f"v{version}",
+                        str(z), str(x), f"{y}.json")
+
+def read_tile(path: str):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def write_tile(path: str, body: bytes):
+    """Write atomically, so concurrent readers never see a partial tile"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def encode(tile: Dict) -> bytes:
+    return json.dumps(tile, separators=(',', ':'), default=str).encode('utf-8')
+
+def purge_stale(floorplan_id):
+    """Background job: drop the tiles of all but the current published version"""
+    from database import get_db
+    from bson import ObjectId
+
+    plan_dir = os.path.join(Config.TILES_CACHE_DIR, str(floorplan_id))
+    if not os.path.isdir(plan_dir):
+        return
+    current = get_db().floorplans.find_one({'_id': ObjectId(str(floorplan_id)), 'status': 'published'},
+                                           {'version': 1})
+    keep = f"v{current['version']}" if current else None
+    for name in os.listdir(plan_dir):
+        if name != keep:
+            shutil.rmtree(os.path.join(plan_dir, name), ignore_errors=True)
+
+def cache_stats() -> Dict:
+    return _sources.stats()
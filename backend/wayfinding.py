@@ -0,0 +1,488 @@
+"""
+Server-side booth-to-booth wayfinding.
+
+A plan's walkable area is rasterised into an occupancy grid once per plan
+version, using the same rules as the editor's usePathFinding hook:
+
+* cells of `state.grid.size` canvas units;
+* every booth rectangle is an obstacle except the start and end booths;
+* a booth is entered and left at its centre cell;
+* diagonal steps are allowed only when both adjacent orthogonal cells are free.
+
+Grids are cached per (plan id, version) and routes per booth pair, so a kiosk
+asking for a popular route is answered from memory. A route is searched with
+A* and an octile heuristic over a flat bytearray. NumPy (optional) speeds up
+rasterising large halls.
+
+Most visitors walk from an entrance (a `door` element) to a booth. When a plan
+is published, entrance_field() runs one multi-source Dijkstra from all doors
+and stores, per cell, the distance to the nearest door (uint16) and the
+direction of the next step towards it (uint8). A route from the nearest
+entrance is then read off the field in O(path length). Fields are persisted in
+the `navfields` collection, one zlib-compressed document per plan, keyed by a
+digest of the walkable geometry rather than the plan version: a booth status
+change or a price edit bumps the version but keeps the stored field valid.
+"""
+
+import hashlib
+import heapq
+import logging
+import math
+import sys
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: grids are then filled row by row
+    np = None
+
+import jobs
+from cache import TTLCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SQRT2 = math.sqrt(2)
+
+# Only these parts of the state are needed to build a grid
+STATE_PROJECTION = {'state.elements': 1, 'state.canvasSize': 1, 'state.grid': 1}
+
+# (dx, dy, cost) for the eight neighbours; diagonals come last and the
+# opposite of step i is step i ^ 1
+_STEPS = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+          (1, 1, SQRT2), (-1, -1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2))
+
+Rect = Tuple[int, int, int, int]  # col0, row0, col1, row1 (end exclusive)
+
+class NavGrid:
+    """Occupancy grid of one plan version plus the cells of its booths and doors"""
+
+    def __init__(self, cols: int, rows: int, cell: float, blocked: bytearray,
+                 booths: Dict[str, Rect], centers: Dict[str, Tuple[int, int]],
+                 numbers: Dict[str, str], doors: Dict[str, Tuple[int, int]]):
+        self.cols = cols
+        self.rows = rows
+        self.cell = cell
+        self.blocked = blocked
+        self.booths = booths
+        self.centers = centers
+        self.numbers = numbers
+        self.doors = doors
+        self._digest = None
+
+    @property
+    def digest(self) -> str:
+        """Hash of everything an entrance field depends on: size, obstacles and doors"""
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(repr((self.cols, self.rows, self.cell, sorted(self.doors.items()))).encode('utf-8'))
+            h.update(self.blocked)
+            self._digest = h.hexdigest()
+        return self._digest
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.blocked)
+
+    def resolve(self, ref: str) -> str:
+        """Booth element id for a booth id or booth number; raises KeyError"""
+        if ref in self.booths:
+            return ref
+        return self.numbers[ref]
+
+    def to_canvas(self, col: int, row: int) -> Tuple[float, float]:
+        return col * self.cell + self.cell / 2, row * self.cell + self.cell / 2
+
+def _cell_size(state: Dict, width: float, height: float) -> float:
+    cell = float((state.get('grid') or {}).get('size') or Config.WAYFINDING_DEFAULT_CELL)
+    # Coarsen huge canvases so the grid stays within WAYFINDING_MAX_CELLS
+    return max(cell, math.sqrt(width * height / Config.WAYFINDING_MAX_CELLS))
+
+def _rect(element: Dict, cell: float, cols: int, rows: int) -> Rect:
+    x, y = element.get('x', 0) or 0, element.get('y', 0) or 0
+    w, h = element.get('width', 0) or 0, element.get('height', 0) or 0
+    return (max(0, math.floor(x / cell)), max(0, math.floor(y / cell)),
+            min(cols, math.ceil((x + w) / cell)), min(rows, math.ceil((y + h) / cell)))
+
+def _center(element: Dict, cell: float, cols: int, rows: int) -> Tuple[int, int]:
+    x, y = element.get('x', 0) or 0, element.get('y', 0) or 0
+    w, h = element.get('width', 0) or 0, element.get('height', 0) or 0
+    col = math.floor(x / cell) + math.floor(w / cell / 2)
+    row = math.floor(y / cell) + math.floor(h / cell / 2)
+    return max(0, min(col, cols - 1)), max(0, min(row, rows - 1))
+
+def build_grid(state: Dict) -> NavGrid:
+    """Rasterise a plan state into a NavGrid"""
+    state = state or {}
+    elements = state.get('elements') or []
+    canvas = state.get('canvasSize') or {}
+    # Cover elements placed outside the nominal canvas as well
+    width = max([canvas.get('width') or 1200] +
+                [(e.get('x', 0) or 0) + (e.get('width', 0) or 0) for e in elements])
+    height = max([canvas.get('height') or 800] +
+                 [(e.get('y', 0) or 0) + (e.get('height', 0) or 0) for e in elements])
+    cell = _cell_size(state, width, height)
+    cols, rows = max(1, math.ceil(width / cell)), max(1, math.ceil(height / cell))
+
+    booths, centers, numbers, doors = {}, {}, {}, {}
+    for element in elements:
+        element_id = element.get('id')
+        if not element_id:
+            continue
+        if element.get('type') == 'booth':
+            booths[element_id] = _rect(element, cell, cols, rows)
+            centers[element_id] = _center(element, cell, cols, rows)
+            if element.get('number'):
+                numbers.setdefault(str(element['number']), element_id)
+        elif element.get('type') == 'door':
+            doors[element_id] = _center(element, cell, cols, rows)
+
+    if np is not None:
+        occupancy = np.zeros((rows, cols), dtype=np.uint8)
+        for c0, r0, c1, r1 in booths.values():
+            occupancy[r0:r1, c0:c1] = 1
+        blocked = bytearray(occupancy.tobytes())
+    else:
+        blocked = bytearray(rows * cols)
+        for c0, r0, c1, r1 in booths.values():
+            if c1 > c0:
+                run = b'\x01' * (c1 - c0)
+                for r in range(r0, r1):
+                    blocked[r * cols + c0:r * cols + c1] = run
+    return NavGrid(cols, rows, cell, blocked, booths, centers, numbers, doors)
+
+def _open_rect(blocked: bytearray, cols: int, rect: Rect):
+    c0, r0, c1, r1 = rect
+    if c1 > c0:
+        run = bytes(c1 - c0)
+        for r in range(r0, r1):
+            blocked[r * cols + c0:r * cols + c1] = run
+
+def find_path(grid: NavGrid, start: Tuple[int, int], goal: Tuple[int, int],
+              open_rects: List[Rect] = ()) -> Optional[List[Tuple[int, int]]]:
+    """A* from `start` to `goal` cells; `open_rects` are treated as walkable"""
+    cols, rows = grid.cols, grid.rows
+    blocked = grid.blocked
+    if open_rects:
+        blocked = bytearray(blocked)
+        for rect in open_rects:
+            _open_rect(blocked, cols, rect)
+
+    start_idx = start[1] * cols + start[0]
+    goal_idx = goal[1] * cols + goal[0]
+    gx, gy = goal
+    g_score = {start_idx: 0.0}
+    came_from = {}
+    heap = [(0.0, 0.0, start_idx)]
+    closed = set()
+    while heap:
+        _, g, idx = heapq.heappop(heap)
+        if idx == goal_idx:
+            path = [idx]
+            while idx in came_from:
+                idx = came_from[idx]
+                path.append(idx)
+            path.reverse()
+            return [(i % cols, i // cols) for i in path]
+        if idx in closed:
+            continue
+        closed.add(idx)
+        x, y = idx % cols, idx // cols
+        for dx, dy, cost in _STEPS:
+            nx, ny = x + dx, y + dy
+            if nx < 0 or ny < 0 or nx >= cols or ny >= rows:
+                continue
+            nidx = ny * cols + nx
+            if blocked[nidx] or nidx in closed:
+                continue
+            if dx and dy and (blocked[y * cols + nx] or blocked[ny * cols + x]):
+                continue
+            ng = g + cost
+            if ng < g_score.get(nidx, math.inf):
+                g_score[nidx] = ng
+                came_from[nidx] = idx
+                hx, hy = abs(nx - gx), abs(ny - gy)
+                h = (hx + hy) + (SQRT2 - 2) * min(hx, hy)
+                heapq.heappush(heap, (ng + h, ng, nidx))
+    return None
+
+def simplify(path: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Keep only the cells where the direction changes"""
+    if len(path) < 3:
+        return list(path)
+    points = [path[0]]
+    for prev, cur, nxt in zip(path, path[1:], path[2:]):
+        if (cur[0] - prev[0], cur[1] - prev[1]) != (nxt[0] - cur[0], nxt[1] - cur[1]):
+            points.append(cur)
+    points.append(path[-1])
+    return points
+
+def path_length(path: List[Tuple[int, int]]) -> float:
+    return sum(SQRT2 if a[0] != b[0] and a[1] != b[1] else 1.0 for a, b in zip(path, path[1:]))
+
+def route_response(grid: NavGrid, path: List[Tuple[int, int]]) -> Dict:
+    """Turn points in canvas coordinates, flat `points` as drawn by the editor, and distance"""
+    turns = [grid.to_canvas(c, r) for c, r in simplify(path)]
+    return {
+        'path': [[x, y] for x, y in turns],
+        'points': [v for point in turns for v in point],
+        'distance': round(path_length(path) * grid.cell, 2),
+        'cells': len(path)
+    }
+
+# Caches
+
+_grids = TTLCache(maxsize=Config.WAYFINDING_GRID_CACHE_SIZE, ttl=0)
+_routes = TTLCache(maxsize=Config.WAYFINDING_ROUTE_CACHE_SIZE, ttl=0)
+_fields = TTLCache(maxsize=Config.WAYFINDING_GRID_CACHE_SIZE, ttl=0)
+_build_lock = threading.Lock()
+
+def get_grid(floorplan_id, version: int, load_state) -> NavGrid:
+    """Cached grid of a plan version; `load_state()` is called only to build it"""
+    key = (str(floorplan_id), version)
+    grid = _grids.get(key)
+    if grid is None:
+        with _build_lock:
+            grid = _grids.get(key)
+            if grid is None:
+                grid = build_grid(load_state())
+                _grids.set(key, grid)
+    return grid
+
+def booth_route(floorplan_id, version: int, grid: NavGrid, from_ref: str, to_ref: str) -> Optional[Dict]:
+    """Route between two booths (ids or numbers); raises KeyError for unknown booths"""
+    start_id, end_id = grid.resolve(from_ref), grid.resolve(to_ref)
+    key = (str(floorplan_id), version, start_id, end_id)
+    cached = _routes.get(key, False)
+    if cached is not False:
+        return cached
+    # Routes are symmetric: reuse the reverse direction if it is cached
+    reverse = _routes.get((str(floorplan_id), version, end_id, start_id), False)
+    if reverse is not False and reverse is not None:
+        turns = list(reversed(reverse['path']))
+        result = {**reverse, 'path': turns, 'points': [v for point in turns for v in point]}
+        _routes.set(key, result)
+        return result
+
+    path = find_path(grid, grid.centers[start_id], grid.centers[end_id],
+                     open_rects=[grid.booths[start_id], grid.booths[end_id]])
+    result = route_response(grid, path) if path else None
+    _routes.set(key, result)
+    return result
+
+# Entrance fields
+
+# Integer step costs (octile distance x 5) keep distances within uint16
+_STEP_COST = (5, 5, 5, 5, 7, 7, 7, 7)
+UNREACHED = 0xFFFF
+NO_HOP = 0xFF
+
+class EntranceField:
+    """Distance to the nearest door and next-hop direction of every grid cell"""
+
+    def __init__(self, cols: int, rows: int, cell: float, dist: array, hop: bytearray,
+                 doors: Dict[Tuple[int, int], str]):
+        self.cols = cols
+        self.rows = rows
+        self.cell = cell
+        self.dist = dist
+        self.hop = hop
+        self.doors = doors
+
+    def matches(self, grid: NavGrid) -> bool:
+        return (self.cols, self.rows, self.cell) == (grid.cols, grid.rows, grid.cell)
+
+    @property
+    def raw_bytes(self) -> int:
+        return len(self.dist) * self.dist.itemsize + len(self.hop)
+
+def entrance_field(grid: NavGrid) -> EntranceField:
+    """Multi-source Dijkstra from every reachable door over the walkable cells"""
+    cols, rows, blocked = grid.cols, grid.rows, grid.blocked
+    dist = array('H', [UNREACHED]) * (cols * rows)
+    hop = bytearray([NO_HOP]) * (cols * rows)
+    doors = {}
+    heap = []
+    for door_id, (col, row) in grid.doors.items():
+        idx = row * cols + col
+        if not blocked[idx] and dist[idx]:
+            dist[idx] = 0
+            doors[(col, row)] = door_id
+            heap.append((0, idx))
+    heapq.heapify(heap)
+
+    while heap:
+        d, idx = heapq.heappop(heap)
+        if d > dist[idx]:
+            continue
+        x, y = idx % cols, idx // cols
+        for step, (dx, dy, _) in enumerate(_STEPS):
+            nx, ny = x + dx, y + dy
+            if nx < 0 or ny < 0 or nx >= cols or ny >= rows:
+                continue
+            nidx = ny * cols + nx
+            if blocked[nidx]:
+                continue
+            if dx and dy and (blocked[y * cols + nx] or blocked[ny * cols + x]):
+                continue
+            nd = d + _STEP_COST[step]
+            # Cells further than uint16 can express stay unreached (A* fallback)
+            if nd < dist[nidx] and nd < UNREACHED:
+                dist[nidx] = nd
+                hop[nidx] = step ^ 1
+                heapq.heappush(heap, (nd, nidx))
+    return EntranceField(cols, rows, grid.cell, dist, hop, doors)
+
+def _walk_to_door(field: EntranceField, idx: int) -> List[Tuple[int, int]]:
+    cols = field.cols
+    cells = [(idx % cols, idx // cols)]
+    while field.hop[idx] != NO_HOP:
+        dx, dy, _ = _STEPS[field.hop[idx]]
+        idx += dy * cols + dx
+        cells.append((idx % cols, idx // cols))
+    return cells
+
+def _line(start: Tuple[int, int], goal: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """Cells after `start` up to `goal`: diagonal first, then straight"""
+    (x, y), cells = start, []
+    while (x, y) != goal:
+        x += (goal[0] > x) - (goal[0] < x)
+        y += (goal[1] > y) - (goal[1] < y)
+        cells.append((x, y))
+    return cells
+
+def entrance_route(grid: NavGrid, field: EntranceField, to_ref: str) -> Optional[Tuple[str, Dict]]:
+    """(door id, route) from the nearest entrance to a booth; raises KeyError for unknown booths"""
+    booth_id = grid.resolve(to_ref)
+    c0, r0, c1, r1 = grid.booths[booth_id]
+    center = grid.centers[booth_id]
+    cols, rows = field.cols, field.rows
+
+    # Enter the booth from the cheapest cell of the ring around its rectangle
+    best, best_cost = None, UNREACHED
+    for row in range(max(0, r0 - 1), min(rows, r1 + 1)):
+        for col in range(max(0, c0 - 1), min(cols, c1 + 1)):
+            if c0 <= col < c1 and r0 <= row < r1:
+                continue
+            d = field.dist[row * cols + col]
+            if d == UNREACHED:
+                continue
+            hx, hy = abs(col - center[0]), abs(row - center[1])
+            cost = d + 5 * max(hx, hy) + 2 * min(hx, hy)
+            if cost < best_cost:
+                best, best_cost = row * cols + col, cost
+    if best is None:
+        return None
+
+    path = _walk_to_door(field, best)
+    path.reverse()
+    path.extend(_line(path[-1], center))
+    return field.doors[path[0]], route_response(grid, path)
+
+def pack_field(field: EntranceField) -> Dict:
+    """Document fields of a stored entrance field (little-endian, zlib-compressed)"""
+    dist = array('H', field.dist)
+    if sys.byteorder == 'big':
+        dist.byteswap()
+    dist_blob = zlib.compress(dist.tobytes(), 6)
+    hop_blob = zlib.compress(bytes(field.hop), 6)
+    return {
+        'cols': field.cols,
+        'rows': field.rows,
+        'cell': field.cell,
+        'doors': [{'id': door_id, 'col': col, 'row': row}
+                  for (col, row), door_id in field.doors.items()],
+        'encoding': 'zlib:uint16le,uint8',
+        'dist': Binary(dist_blob),
+        'hop': Binary(hop_blob),
+        'raw_bytes': field.raw_bytes,
+        'stored_bytes': len(dist_blob) + len(hop_blob)
+    }
+
+def unpack_field(doc: Dict) -> EntranceField:
+    dist = array('H')
+    dist.frombytes(zlib.decompress(doc['dist']))
+    if sys.byteorder == 'big':
+        dist.byteswap()
+    doors = {(d['col'], d['row']): d['id'] for d in doc.get('doors', [])}
+    return EntranceField(doc['cols'], doc['rows'], doc['cell'], dist,
+                         bytearray(zlib.decompress(doc['hop'])), doors)
+
+# Summary of a stored field, without the blobs
+FIELD_META_PROJECTION = {'dist': 0, 'hop': 0}
+
+def store_field(db, floorplan_id, version: int, grid: NavGrid, field: EntranceField,
+                build_ms: float = None) -> Dict:
+    """Persist a plan's entrance field; returns the stored document"""
+    doc = {
+        'version': version,
+        'digest': grid.digest,
+        **pack_field(field),
+        'cells': grid.cols * grid.rows,
+        'build_ms': build_ms,
+        'computed_at': datetime.utcnow()
+    }
+    try:
+        # Never replace the field of a newer version computed concurrently
+        db.navfields.replace_one({'_id': floorplan_id, 'version': {'$lte': version}}, doc, upsert=True)
+    except DuplicateKeyError:
+        pass
+    return doc
+
+def precompute_entrances(db, floorplan_id) -> Optional[Dict]:
+    """Build and store the entrance field of a plan's current version; returns its summary"""
+    floorplan = db.floorplans.find_one({'_id': floorplan_id}, {**STATE_PROJECTION, 'version': 1})
+    if not floorplan:
+        return None
+    start = time.perf_counter()
+    grid = build_grid(floorplan.get('state'))
+    field = entrance_field(grid)
+    build_ms = round((time.perf_counter() - start) * 1000, 1)
+    _fields.set((str(floorplan_id), grid.digest), field)
+    doc = store_field(db, floorplan_id, floorplan.get('version', 1), grid, field, build_ms)
+    return {key: value for key, value in doc.items() if key not in ('dist', 'hop')}
+
+def precompute_job(floorplan_id):
+    """Background job run when a plan is published (see jobs.py)"""
+    from database import get_db
+    summary = precompute_entrances(get_db(), floorplan_id)
+    if summary:
+        logger.info(f"Entrance field of floor plan {floorplan_id} v{summary['version']}: "
+                    f"{summary['cells']} cells, {len(summary['doors'])} doors, "
+                    f"{summary['raw_bytes']} bytes raw, {summary['stored_bytes']} stored, "
+                    f"{summary['build_ms']} ms")
+
+def get_entrance_field(db, floorplan_id, version: int, grid: NavGrid) -> EntranceField:
+    """Entrance field of a plan's geometry: memory, then `navfields`, else computed now.
+
+    A field computed here (publish job still running, or the booths or doors
+    moved since publishing) is stored in the background for the other workers.
+    """
+    key = (str(floorplan_id), grid.digest)
+    field = _fields.get(key)
+    if field is None:
+        doc = db.navfields.find_one({'_id': floorplan_id, 'digest': grid.digest})
+        field = unpack_field(doc) if doc else None
+        if field is None or not field.matches(grid):
+            start = time.perf_counter()
+            field = entrance_field(grid)
+            build_ms = round((time.perf_counter() - start) * 1000, 1)
+            jobs.submit(('navfield-store', str(floorplan_id), grid.digest),
+                   _store_job, floorplan_id, version, grid, field, build_ms)
+        _fields.set(key, field)
+    return field
+
+def _store_job(floorplan_id, version: int, grid: NavGrid, field: EntranceField, build_ms: float):
+    from database import get_db
+    store_field(get_db(), floorplan_id, version, grid, field, build_ms)
+
+def cache_stats() -> Dict:
+    return {'grids': _grids.stats(), 'routes': _routes.stats(), 'fields': _fields.stats()}
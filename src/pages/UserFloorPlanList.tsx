@@ -11,6 +11,7 @@ interface FloorPlan {
   created: string;
   last_modified: string;
   status: string;
+  version?: number;
   stats?: {
     total_booths: number;
     sold: number;
@@ -103,6 +104,12 @@ export const UserFloorPlanList: React.FC = () => {
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
             {floorPlans.map((plan) => (
               <div key={plan.id} className="bg-white rounded-lg shadow-sm hover:shadow-md transition-shadow duration-200">
+                <img
+                  src={publicFloorPlanAPI.getPublicThumbnailUrl(plan.id, plan.version)}
+                  alt={`Preview of ${plan.name}`}
+                  loading="lazy"
+                  className="w-full h-40 object-contain bg-white rounded-t-lg border-b border-gray-100"
+                />
                 <div className="p-6">
                   <div className="flex items-start justify-between mb-4">
                     <div className="flex items-center">
@@ -79,12 +79,17 @@ export const floorPlanAPI = {
     limit?: number;
     search?: string;
     event_id?: string;
+    // Cursor pagination: pass '' for the first page, then pagination.next_cursor
+    after?: string;
+    count?: 'exact' | 'estimated' | 'none';
   }) {
     const queryParams = new URLSearchParams();
     if (params?.page) queryParams.set('page', params.page.toString());
     if (params?.limit) queryParams.set('limit', params.limit.toString());
     if (params?.search) queryParams.set('search', params.search);
     if (params?.event_id) queryParams.set('event_id', params.event_id);
+    if (params?.after !== undefined) queryParams.set('after', params.after);
+    if (params?.count) queryParams.set('count', params.count);
 
     const response = await fetch(
       `${API_BASE_URL}/floorplans?${queryParams}`,
@@ -125,6 +130,7 @@ export const floorPlanAPI = {
     floor?: number;
     layer?: number;
     status?: string;
+    version?: number;
   }) {
     const response = await fetch(`${API_BASE_URL}/floorplans/${id}`, {
       method: 'PUT',
@@ -134,6 +140,57 @@ export const floorPlanAPI = {
     return { success: response.ok, data: await response.json() };
   },
 
+  // Collaborative editing session: `ready` { version, pending }, `ops` { seq, client_id, user_id, ops },
+  // `saved` { version }, `rejected` { ids }, `resync` { version } (re-fetch the plan).
+  // The stream is opened with a short-lived ticket; once the EventSource closes on an
+  // error (e.g. an expired ticket on reconnect), open a new session.
+  async openEditSession(id: string) {
+    const response = await fetch(`${API_BASE_URL}/floorplans/${id}/collab/ticket`, {
+      method: 'POST',
+      headers: getAuthHeaders(),
+    });
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.message || 'Failed to open editing session');
+    }
+    return new EventSource(`${API_BASE_URL}/floorplans/${id}/collab/events?ticket=${encodeURIComponent(data.ticket)}`);
+  },
+
+  async sendEditOps(id: string, clientId: string, ops: any[]) {
+    const response = await fetch(`${API_BASE_URL}/floorplans/${id}/collab/ops`, {
+      method: 'POST',
+      headers: getAuthHeaders(),
+      body: JSON.stringify({ client_id: clientId, ops }),
+    });
+    return { success: response.ok, data: await response.json() };
+  },
+
+  // Elements in a viewport (bbox: [x0, y0, x1, y1]) or under a point ([x, y])
+  async getFloorPlanElements(id: string, query: { bbox?: number[]; point?: number[] }) {
+    const queryParams = new URLSearchParams();
+    if (query.bbox) queryParams.set('bbox', query.bbox.join(','));
+    if (query.point) queryParams.set('point', query.point.join(','));
+
+    const response = await fetch(`${API_BASE_URL}/floorplans/${id}/elements?${queryParams}`, {
+      headers: getAuthHeaders(),
+    });
+    const data = await response.json();
+    return { success: response.ok, data };
+  },
+
+  async patchFloorPlanElements(id: string, version: number, ops: Array<
+    | { op: 'add'; element: Record<string, any> }
+    | { op: 'update'; id: string; fields: Record<string, any> }
+    | { op: 'remove'; id: string }
+  >) {
+    const response = await fetch(`${API_BASE_URL}/floorplans/${id}/elements`, {
+      method: 'PATCH',
+      headers: getAuthHeaders(),
+      body: JSON.stringify({ version, ops }),
+    });
+    return { success: response.ok, data: await response.json() };
+  },
+
   async deleteFloorPlan(id: string) {
     const response = await fetch(`${API_BASE_URL}/floorplans/${id}`, {
       method: 'DELETE',
@@ -142,11 +199,11 @@ export const floorPlanAPI = {
     return { success: response.ok, data: await response.json() };
   },
 
-  async updateFloorPlanStatus(id: string, status: string) {
+  async updateFloorPlanStatus(id: string, status: string, version?: number) {
     const response = await fetch(`${API_BASE_URL}/floorplans/${id}/status`, {
       method: 'PUT',
       headers: getAuthHeaders(),
-      body: JSON.stringify({ status }),
+      body: JSON.stringify({ status, version }),
     });
     return { success: response.ok, data: await response.json() };
   },
@@ -159,6 +216,36 @@ export const floorPlanAPI = {
   },
 };
 
+// Booth inventory across floor plans
+export const boothAPI = {
+  async getBooths(params?: {
+    status?: string;
+    floor?: number;
+    event_id?: string;
+    floorplan_id?: string;
+    category?: string;
+    company?: string;
+    min_price?: number;
+    max_price?: number;
+    search?: string;
+    sort?: string;
+    limit?: number;
+    after?: string;
+    stats?: boolean;
+  }) {
+    const queryParams = new URLSearchParams();
+    Object.entries(params || {}).forEach(([key, value]) => {
+      if (value !== undefined && value !== null) queryParams.set(key, String(value));
+    });
+
+    const response = await fetch(
+      `${API_BASE_URL}/booths?${queryParams}`,
+      { headers: getAuthHeaders() }
+    );
+    return { success: response.ok, data: await response.json() };
+  },
+};
+
 // Public API (no authentication required)
 export const publicFloorPlanAPI = {
   async getPublicFloorPlans(params?: {
@@ -166,12 +253,17 @@ export const publicFloorPlanAPI = {
     limit?: number;
     search?: string;
     event_id?: string;
+    // Cursor pagination: pass '' for the first page, then pagination.next_cursor
+    after?: string;
+    count?: 'exact' | 'estimated' | 'none';
   }) {
     const queryParams = new URLSearchParams();
     if (params?.page) queryParams.set('page', params.page.toString());
     if (params?.limit) queryParams.set('limit', params.limit.toString());
     if (params?.search) queryParams.set('search', params.search);
     if (params?.event_id) queryParams.set('event_id', params.event_id);
+    if (params?.after !== undefined) queryParams.set('after', params.after);
+    if (params?.count) queryParams.set('count', params.count);
 
     const response = await fetch(
       `${API_BASE_URL}/public/floorplans?${queryParams}`,
@@ -189,17 +281,77 @@ export const publicFloorPlanAPI = {
     return { success: response.ok, data };
   },
 
+  async getPublicFloorPlanElements(id: string, query: { bbox?: number[]; point?: number[] }) {
+    const queryParams = new URLSearchParams();
+    if (query.bbox) queryParams.set('bbox', query.bbox.join(','));
+    if (query.point) queryParams.set('point', query.point.join(','));
+
+    const response = await fetch(
+      `${API_BASE_URL}/public/floorplans/${id}/elements?${queryParams}`,
+      { headers: { 'Content-Type': 'application/json' } }
+    );
+    const data = await response.json();
+    return { success: response.ok, data };
+  },
+
+  // Live booth-status changes; `booths` events carry { version, changes: [{ id, number, status } | { id, removed }] }
+  openBoothEvents(id: string) {
+    return new EventSource(`${API_BASE_URL}/public/floorplans/${id}/events`);
+  },
+
+  // Preview image URL; naming the version lets browsers cache it forever
+  getPublicThumbnailUrl(id: string, version?: number) {
+    const query = version ? `?v=${version}` : '';
+    return `${API_BASE_URL}/public/floorplans/${id}/thumbnail${query}`;
+  },
+
+  // Tile pyramid of the current version; `tiles` is a {z}/{x}/{y} URL template
+  async getPublicTileset(id: string) {
+    const response = await fetch(`${API_BASE_URL}/public/floorplans/${id}/tiles.json`, {
+      headers: { 'Content-Type': 'application/json' },
+    });
+    const data = await response.json();
+    return { success: response.ok, data };
+  },
+
+  async getPublicTile(template: string, z: number, x: number, y: number) {
+    const path = template.replace('{z}', String(z)).replace('{x}', String(x)).replace('{y}', String(y));
+    const response = await fetch(`${API_BASE_URL.replace(/\/api$/, '')}${path}`);
+    const data = await response.json();
+    return { success: response.ok, data };
+  },
+
+  // Without `from` the route starts at the nearest entrance
+  async getPublicRoute(id: string, to: string, from?: string) {
+    const queryParams = new URLSearchParams({ to });
+    if (from) queryParams.set('from', from);
+    const response = await fetch(
+      `${API_BASE_URL}/public/floorplans/${id}/route?${queryParams}`,
+      { headers: { 'Content-Type': 'application/json' } }
+    );
+    const data = await response.json();
+    return { success: response.ok, data };
+  },
+
   async getPublicCompanies(params?: {
     page?: number;
     limit?: number;
     search?: string;
     floor?: number;
+    category?: string;
+    event_id?: string;
+    featured?: boolean;
+    after?: string;
   }) {
     const queryParams = new URLSearchParams();
     if (params?.page) queryParams.set('page', params.page.toString());
     if (params?.limit) queryParams.set('limit', params.limit.toString());
     if (params?.search) queryParams.set('search', params.search);
     if (params?.floor) queryParams.set('floor', params.floor.toString());
+    if (params?.category) queryParams.set('category', params.category);
+    if (params?.event_id) queryParams.set('event_id', params.event_id);
+    if (params?.featured) queryParams.set('featured', 'true');
+    if (params?.after !== undefined) queryParams.set('after', params.after);
 
     const response = await fetch(
       `${API_BASE_URL}/public/companies?${queryParams}`,
@@ -24,6 +24,7 @@ export interface ExhibitorInfo {
     email?: string;
     website?: string;
   };
+  sponsorTier?: 'platinum' | 'gold' | 'silver' | 'bronze';
 }
 
 export interface CanvasElement {